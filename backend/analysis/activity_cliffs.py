@@ -0,0 +1,257 @@
+#DrugPredict - Activity cliff detection
+#Finds pairs of highly similar compounds with a large pIC50 difference among all
+#pairs of an analysed dataset. Compounds are sorted by fingerprint bit count and
+#the pair matrix is cut into tiles: whole tiles are skipped when their bit counts
+#or pIC50 ranges rule out a cliff, the remaining tiles are scored on a process pool
+#with a vectorized popcount, and each tile only returns its best pairs, so memory
+#stays within a fixed budget whatever the number of compounds.
+
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from cancellation import CANCEL_POLL_INTERVAL, NEVER, StopFlag
+from similarity import fingerprint_smiles, popcount_rows, FP_BYTES
+from process_pool import get_process_pool, PROCESS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# A cliff pair is at least this similar (Tanimoto) and this far apart in pIC50
+CLIFF_MIN_SIMILARITY = 0.7
+CLIFF_MIN_DELTA = 1.0
+
+# Pairs returned, ranked by SALI = |delta pIC50| / (1 - similarity)
+CLIFF_TOP_PAIRS = 100
+
+# Distance used for pairs with identical fingerprints (keeps SALI finite)
+SALI_MIN_DISTANCE = 0.01
+
+# Working memory of all tile workers together
+CLIFF_MEMORY_BUDGET_MB = int(os.getenv('DRUGPREDICT_CLIFF_MEMORY_MB', 256))
+
+# Bytes per cell of a tile: bit-count bound, pIC50 difference and candidate mask (16),
+# plus the two int64 indices np.nonzero returns per candidate pair (16), as in a dense
+# tile every cell can be a candidate; and per scored candidate pair (both fingerprints,
+# their AND and the results)
+BYTES_PER_INDEX_PAIR = 2 * np.dtype(np.int64).itemsize
+BYTES_PER_TILE_CELL = 16 + BYTES_PER_INDEX_PAIR
+BYTES_PER_CANDIDATE = 3 * FP_BYTES + 32
+
+MIN_TILE_ROWS, MAX_TILE_ROWS = 64, 4096
+
+def plan_tiles(n_compounds, memory_budget_mb=CLIFF_MEMORY_BUDGET_MB, workers=None):
+    """
+    Tile size and candidate batch size that keep all workers within the memory budget
+
+    Half of a worker's share goes to the tile matrices, half to scoring candidates.
+
+    Returns:
+        tuple: (rows per tile, candidate pairs per batch)
+    """
+    workers = workers or PROCESS_WORKERS
+    per_worker = memory_budget_mb * 1024 * 1024 / workers
+    tile_rows = int(math.sqrt(per_worker / 2 / BYTES_PER_TILE_CELL))
+    tile_rows = max(MIN_TILE_ROWS, min(tile_rows, MAX_TILE_ROWS, max(n_compounds, 1)))
+    pair_batch = max(1024, int(per_worker / 2 / BYTES_PER_CANDIDATE))
+    return tile_rows, pair_batch
+
+
+@lru_cache(maxsize=4)
+def _load_arrays(data_dir):
+    """Memory-map the sorted fingerprints, bit counts and pIC50 values (once per worker)"""
+    return tuple(np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+                 for name in ('fingerprints', 'counts', 'values'))
+
+
+def _top_pairs(sali, top_k):
+    if len(sali) <= top_k:
+        return np.arange(len(sali))
+    return np.argpartition(-sali, top_k - 1)[:top_k]
+
+
+def score_tile(data_dir, rows, cols, min_similarity, min_delta, top_k, pair_batch, flag=None):
+    """
+    Best cliff pairs of one tile of the pair matrix
+
+    Args:
+        data_dir (str): Directory of the arrays written by find_activity_cliffs
+        rows, cols (tuple): (start, stop) of the tile in the sorted compound order
+        min_similarity, min_delta (float): Cliff thresholds
+        top_k (int): Pairs returned
+        pair_batch (int): Candidate pairs scored at once
+        flag (StopFlag): Checked before the tile and between candidate batches
+
+    Returns:
+        tuple: (pair arrays (i, j, similarity, delta, sali), candidates scored, cliffs found),
+               or None if the flag was stopped
+    """
+    if flag is not None and flag.stopped():
+        return None
+    fps, counts, values = _load_arrays(data_dir)
+    r0, r1 = rows
+    c0, c1 = cols
+
+    # Candidates: pairs whose bit counts allow the similarity and whose pIC50 differ enough
+    count_a = counts[r0:r1].astype(np.float32)[:, None]
+    count_b = counts[c0:c1].astype(np.float32)[None, :]
+    high = np.maximum(count_a, count_b)
+    bound = np.divide(np.minimum(count_a, count_b), high, out=np.zeros(high.shape, np.float32), where=high > 0)
+    delta = np.abs(values[r0:r1][:, None] - values[c0:c1][None, :])
+    candidates = (bound >= min_similarity) & (delta >= min_delta)
+    if r0 == c0:
+        # Diagonal tile: each pair once
+        candidates &= np.triu(np.ones(candidates.shape, dtype=bool), k=1)
+    del bound, high
+    ii, jj = np.nonzero(candidates)
+    del candidates
+
+    best = [np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32), np.zeros(0, np.float32),
+            np.zeros(0, np.float32)]
+    found = 0
+    for start in range(0, len(ii), pair_batch):
+        if flag is not None and flag.stopped():
+            return None
+        i = ii[start:start + pair_batch] + r0
+        j = jj[start:start + pair_batch] + c0
+        common = popcount_rows(fps[i] & fps[j])
+        union = counts[i].astype(np.int64) + counts[j] - common
+        similarity = np.divide(common, union, out=np.zeros(len(common)), where=union > 0).astype(np.float32)
+        keep = similarity >= min_similarity
+        found += int(keep.sum())
+        pair_delta = delta[i[keep] - r0, j[keep] - c0]
+        sali = pair_delta / np.maximum(1 - similarity[keep], SALI_MIN_DISTANCE)
+        merged = [np.concatenate(pair) for pair in zip(best, (i[keep], j[keep], similarity[keep], pair_delta, sali))]
+        top = _top_pairs(merged[4], top_k)
+        best = [array[top] for array in merged]
+    return best, len(ii), found
+
+
+def find_activity_cliffs(df, min_similarity=CLIFF_MIN_SIMILARITY, min_delta=CLIFF_MIN_DELTA,
+                         top_k=CLIFF_TOP_PAIRS, memory_budget_mb=CLIFF_MEMORY_BUDGET_MB, cancel=NEVER):
+    """
+    Top activity cliffs among all compound pairs of a dataset
+
+    Compounds are sorted by bit count, so in a tile (I, J) with J after I every pair
+    has a Tanimoto bound of at most max(count I) / min(count J). Tiles further right
+    only have lower bounds, so the scan of a tile row stops at the first tile below
+    min_similarity; tiles whose pIC50 ranges are closer than min_delta are skipped too.
+
+    Args:
+        df (pd.DataFrame): Final dataset (molecule_chembl_id, canonical_smiles, pIC50)
+        min_similarity (float): Minimum Tanimoto similarity of a cliff pair
+        min_delta (float): Minimum pIC50 difference of a cliff pair
+        top_k (int): Number of pairs returned
+        memory_budget_mb (int): Working memory of all tile workers together
+        cancel (CancelToken): Checked while tiles are scored
+
+    Returns:
+        dict: {"pairs": [...] ranked by SALI, "summary": {...}}
+    """
+    start = time.perf_counter()
+    fps, valid = fingerprint_smiles(df['canonical_smiles'])
+    rows = np.flatnonzero(valid & df['pIC50'].notna().to_numpy())
+    counts = popcount_rows(fps[rows])
+    order = np.argsort(counts, kind='stable')
+    rows, counts = rows[order], counts[order]
+    values = df['pIC50'].to_numpy(dtype=np.float32)[rows]
+    n = len(rows)
+
+    tile_rows, pair_batch = plan_tiles(n, memory_budget_mb)
+    bounds = [(low, min(low + tile_rows, n)) for low in range(0, n, tile_rows)]
+    tiles = []
+    skipped = 0
+    for a, (r0, r1) in enumerate(bounds):
+        low_a, high_a = values[r0:r1].min(), values[r0:r1].max()
+        for b in range(a, len(bounds)):
+            c0, c1 = bounds[b]
+            if b > a and counts[c0] > 0 and counts[r1 - 1] / counts[c0] < min_similarity:
+                skipped += len(bounds) - b
+                break
+            if max(values[c0:c1].max() - low_a, high_a - values[c0:c1].min()) < min_delta:
+                skipped += 1
+                continue
+            tiles.append(((r0, r1), (c0, c1)))
+
+    best = [np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32), np.zeros(0, np.float32),
+            np.zeros(0, np.float32)]
+    scored = found = 0
+    with tempfile.TemporaryDirectory(prefix='cliffs_') as data_dir:
+        for name, array in (('fingerprints', fps[rows]), ('counts', counts.astype(np.uint16)), ('values', values)):
+            np.save(os.path.join(data_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+        def collect(result):
+            nonlocal best, scored, found
+            pairs, tile_scored, tile_found = result
+            scored += tile_scored
+            found += tile_found
+            merged = [np.concatenate(pair) for pair in zip(best, pairs)]
+            top = _top_pairs(merged[4], top_k)
+            best = [array[top] for array in merged]
+
+        args = (min_similarity, min_delta, top_k, pair_batch)
+        if len(tiles) <= 1:
+            for tile in tiles:
+                collect(score_tile(data_dir, *tile, *args))
+        else:
+            pool = get_process_pool()
+            flag = StopFlag(data_dir)
+            futures = {pool.submit(score_tile, data_dir, *tile, *args, flag) for tile in tiles}
+            try:
+                while futures:
+                    done, futures = wait(futures, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+                    cancel.check()
+            finally:
+                # Queued tiles are dropped and running ones stop at their next candidate
+                # batch (their arrays stay mapped after the directory is removed)
+                flag.stop()
+                for future in futures:
+                    future.cancel()
+
+    order = np.argsort(-best[4], kind='stable')
+    ids = df['molecule_chembl_id'].to_numpy()
+    smiles = df['canonical_smiles'].to_numpy()
+    pIC50 = df['pIC50'].to_numpy(dtype=np.float64)
+
+    def compound(row):
+        return {"id": str(ids[row]), "smiles": str(smiles[row]), "pIC50": round(float(pIC50[row]), 3)}
+
+    pairs = []
+    for k in order:
+        a, b = rows[best[0][k]], rows[best[1][k]]
+        # Report the more potent compound first
+        if pIC50[a] < pIC50[b]:
+            a, b = b, a
+        pairs.append({
+            "compoundA": compound(a),
+            "compoundB": compound(b),
+            "similarity": round(float(best[2][k]), 4),
+            "deltaPIC50": round(float(best[3][k]), 3),
+            "sali": round(float(best[4][k]), 2)
+        })
+
+    summary = {
+        "compounds": n,
+        "pairsTotal": n * (n - 1) // 2,
+        "pairsScored": scored,
+        "cliffsFound": found,
+        "tiles": len(tiles),
+        "tilesSkipped": skipped,
+        "tileRows": tile_rows,
+        "memoryBudgetMb": memory_budget_mb,
+        "minSimilarity": min_similarity,
+        "minDeltaPIC50": min_delta,
+        "seconds": round(time.perf_counter() - start, 2)
+    }
+    logger.info(f"Activity cliffs: {found} cliffs among {summary['pairsTotal']} pairs "
+                f"({scored} scored, {skipped} of {len(tiles) + skipped} tiles skipped) in {summary['seconds']}s")
+    return {"pairs": pairs, "summary": summary}
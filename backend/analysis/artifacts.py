@@ -0,0 +1,95 @@
+#DrugPredict - Content-addressed output artifacts
+#Generated files are renamed to include a hash of their content, so a URL always
+#refers to the same bytes and can be cached by browsers and CDNs indefinitely.
+
+import gzip
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Length of the content hash in artifact file names
+HASH_LENGTH = 16
+
+# Artifact names look like plot_MW.0123456789abcdef.png
+HASHED_NAME_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[A-Za-z0-9]+)$' % HASH_LENGTH)
+
+# A gzip variant is only kept if it is at least this much smaller
+MIN_COMPRESSION_SAVING = 0.1
+
+# Mode of gzip variants: mkstemp creates private files, variants follow the umask
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def file_digest(path):
+    """SHA-256 of a file's content (hex)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(filename):
+    """Content hash embedded in an artifact file name, or None for plain names"""
+    match = HASHED_NAME_PATTERN.match(filename)
+    return match.group('hash') if match else None
+
+
+def base_name(filename):
+    """File name without an embedded content hash (plot_MW.<hash>.png -> plot_MW.png)"""
+    match = HASHED_NAME_PATTERN.match(filename)
+    return match.group('stem') + match.group('ext') if match else filename
+
+
+def precompress(path, min_saving=MIN_COMPRESSION_SAVING):
+    """
+    Write a gzip variant next to a file if it compresses well enough
+
+    Returns:
+        str: Path of the .gz file, or None if compression did not pay off
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) > len(data) * (1 - min_saving):
+        return None
+    gz_path = path + '.gz'
+    # Unique temporary name: several requests may compress the same file at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(gz_path) or '.', suffix='.tmp')
+    os.fchmod(fd, FILE_MODE)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(compressed)
+    os.replace(tmp_path, gz_path)
+    return gz_path
+
+
+def publish(path, compress=True):
+    """
+    Rename a generated file to its content-addressed name
+
+    Args:
+        path (str): Generated file (e.g. data/outputs/plot_MW.png)
+        compress (bool): Also write a gzip variant when it is worthwhile
+
+    Returns:
+        str: New file name (e.g. plot_MW.0123456789abcdef.png)
+    """
+    directory, filename = os.path.split(path)
+    stem, ext = os.path.splitext(filename)
+    hashed_name = f"{stem}.{file_digest(path)[:HASH_LENGTH]}{ext}"
+    hashed_path = os.path.join(directory, hashed_name)
+
+    # Identical content has the same name, so an existing file can be kept
+    if os.path.exists(hashed_path):
+        os.remove(path)
+    else:
+        os.replace(path, hashed_path)
+        if compress:
+            precompress(hashed_path)
+    return hashed_name
@@ -0,0 +1,170 @@
+#DrugPredict - Cooperative task cancellation
+#An analysis runs in worker threads that cannot be stopped from outside, so the
+#pipeline checks a CancelToken at safe points (between stages, per chunk, between
+#batches of trees) and stops by raising TaskCancelled. Subprocesses are started in
+#their own process group and killed as a whole when the task is cancelled. Work on
+#the shared process pool checks a StopFlag instead, which its submitter stops.
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the external cancellation flag (e.g. a task store lookup)
+CANCEL_POLL_INTERVAL = float(os.getenv('DRUGPREDICT_CANCEL_POLL_INTERVAL', 1.0))
+
+# Seconds a killed subprocess gets to exit after SIGTERM before it is sent SIGKILL
+KILL_GRACE_SECONDS = 5
+
+# Reasons reported by TaskCancelled
+CANCELLED = 'cancelled'
+DEADLINE = 'deadline'
+
+
+class TaskCancelled(Exception):
+    """The task was cancelled or ran past its deadline"""
+
+    def __init__(self, reason=CANCELLED, message=None):
+        super().__init__(message or ('Analysis exceeded its deadline' if reason == DEADLINE else 'Analysis cancelled'))
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cancellation state of one task, shared by all threads working on it
+
+    Args:
+        is_cancelled (callable): Returns True once cancellation was requested elsewhere,
+            e.g. by another worker process; called at most every poll_interval seconds
+        deadline (float): time.time() after which the task is stopped
+        poll_interval (float): Minimum seconds between calls of is_cancelled
+    """
+
+    def __init__(self, is_cancelled=None, deadline=None, poll_interval=CANCEL_POLL_INTERVAL):
+        self.is_cancelled = is_cancelled
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+        self._reason = None
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    def cancel(self, reason=CANCELLED):
+        """Request cancellation from within this process"""
+        with self._lock:
+            self._reason = self._reason or reason
+
+    @property
+    def reason(self):
+        """CANCELLED or DEADLINE once the task must stop, otherwise None"""
+        with self._lock:
+            if self._reason is None and self.deadline is not None and time.time() >= self.deadline:
+                self._reason = DEADLINE
+            now = time.monotonic()
+            if self._reason is None and self.is_cancelled and now - self._last_poll >= self.poll_interval:
+                self._last_poll = now
+                try:
+                    if self.is_cancelled():
+                        self._reason = CANCELLED
+                except Exception as e:
+                    logger.warning(f"Cancellation check failed: {str(e)}")
+            return self._reason
+
+    def check(self):
+        """Raise TaskCancelled if the task must stop"""
+        reason = self.reason
+        if reason:
+            raise TaskCancelled(reason)
+
+    def remaining(self):
+        """Seconds until the deadline (None without a deadline)"""
+        return None if self.deadline is None else max(self.deadline - time.time(), 0.0)
+
+
+# Token of tasks that cannot be cancelled
+NEVER = CancelToken()
+
+
+class StopFlag:
+    """
+    Stop signal for work running on the process pool
+
+    Pool workers cannot see the CancelToken of a task, so the submitter passes this
+    flag along: a file in `directory` that exists while the work may go on. Workers
+    check stopped() between units of work; stopping the flag or removing its
+    directory ends the work at the next check.
+
+    Args:
+        directory (str): Existing directory of the work's files
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, f'.running-{uuid.uuid4().hex}')
+        open(self.path, 'w').close()
+
+    def stop(self):
+        """Stop all work checking this flag"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def stopped(self):
+        """True once the submitter stopped the work"""
+        return not os.path.exists(self.path)
+
+
+def kill_process_group(process):
+    """Terminate a process started with start_new_session=True and all its children"""
+    for sig, grace in ((signal.SIGTERM, KILL_GRACE_SECONDS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_subprocess(args, cancel=None, timeout=None, **kwargs):
+    """
+    subprocess.run with text output capture that kills the process on cancellation
+
+    The process runs in its own session, so wrapper scripts are killed together with
+    the programs they start (e.g. the JVM behind scripts/padel.sh).
+
+    Args:
+        args (list): Command line
+        cancel (CancelToken): Token checked while the process runs
+        timeout (float): Seconds before the process is killed (raises subprocess.TimeoutExpired)
+
+    Returns:
+        subprocess.CompletedProcess: Exit code and captured output
+    """
+    cancel = cancel or NEVER
+    cancel.check()
+    started = time.monotonic()
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               start_new_session=True, **kwargs)
+    try:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=CANCEL_POLL_INTERVAL)
+                return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                pass
+            if cancel.reason:
+                logger.info(f"Killing {args[0]} (pid {process.pid}): task {cancel.reason}")
+                raise TaskCancelled(cancel.reason)
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise subprocess.TimeoutExpired(args, timeout)
+    finally:
+        if process.poll() is None:
+            kill_process_group(process)
+            process.communicate()
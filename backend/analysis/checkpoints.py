@@ -0,0 +1,208 @@
+#DrugPredict - Pipeline stage checkpoints
+#The output of every pipeline stage is stored under a key derived from the stage's
+#inputs and parameters (Parquet for tables, Arrow IPC for feature matrices, JSON for
+#metadata), so a re-run resumes after the last stage that already completed and a
+#change to downstream parameters reuses all upstream stages.
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+
+import pandas as pd
+import pyarrow as pa
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed', 'checkpoints')
+
+# Set DRUGPREDICT_CHECKPOINTS=0 to always recompute every stage
+CHECKPOINTS_ENABLED = os.getenv('DRUGPREDICT_CHECKPOINTS', '1') != '0'
+
+# Bump to invalidate all checkpoints after a change to stage semantics
+CHECKPOINT_VERSION = 2
+
+Checkpoint = namedtuple('Checkpoint', ['data', 'meta', 'fingerprint', 'resumed'])
+
+
+def frame_fingerprint(df):
+    """Content hash of a DataFrame (values, column names and dtypes)"""
+    digest = hashlib.sha1(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:24]
+
+
+def stage_key(stage, inputs):
+    """Checkpoint key of a stage: hash of the stage name, its inputs and parameters"""
+    payload = json.dumps({"stage": stage, "version": CHECKPOINT_VERSION, "inputs": inputs},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:24]
+
+
+def _paths(stage, key):
+    stage_dir = os.path.join(CHECKPOINT_DIR, stage)
+    return stage_dir, os.path.join(stage_dir, f'{key}.json')
+
+
+def peek(stage, inputs, max_age_hours=None):
+    """
+    Read the metadata of a stage checkpoint without loading its data
+
+    Returns:
+        Checkpoint: Checkpoint without data, or None if there is no valid checkpoint
+    """
+    _, meta_path = _paths(stage, stage_key(stage, inputs))
+    try:
+        with open(meta_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if max_age_hours is not None and time.time() - record['created'] > max_age_hours * 3600:
+        return None
+    return Checkpoint(None, record['meta'], record['fingerprint'], True)
+
+
+def exists(stage, inputs, max_age_hours=None):
+    """True if a stage has a checkpoint for these inputs (checked without loading its data)"""
+    return peek(stage, inputs, max_age_hours) is not None
+
+
+def load(stage, key, max_age_hours=None):
+    """
+    Load a stage checkpoint
+
+    Args:
+        stage (str): Stage name
+        key (str): Key from stage_key()
+        max_age_hours (float): Ignore checkpoints created longer ago than this
+
+    Returns:
+        Checkpoint: Stored data, or None if there is no valid checkpoint
+    """
+    stage_dir, meta_path = _paths(stage, key)
+    try:
+        with open(meta_path) as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if max_age_hours is not None and time.time() - record['created'] > max_age_hours * 3600:
+        return None
+
+    data = None
+    try:
+        if record['format'] == 'parquet':
+            data = columnar.read_dataset(os.path.join(stage_dir, f'{key}.parquet'))
+        elif record['format'] == 'arrow':
+            data = columnar.read_feature_matrix(os.path.join(stage_dir, f'{key}.arrow'))
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f"Discarding unreadable {stage} checkpoint {key}: {str(e)}")
+        return None
+
+    # Keep checkpoints that are still used from being pruned
+    os.utime(meta_path)
+    return Checkpoint(data, record['meta'], record['fingerprint'], True)
+
+
+def save(stage, key, data=None, meta=None):
+    """
+    Store a stage checkpoint (the metadata file is written last and marks it complete)
+
+    Args:
+        data (pd.DataFrame or pa.Table): Table output of the stage
+        meta (dict): JSON-serializable output of the stage
+
+    Returns:
+        Checkpoint: The stored checkpoint
+    """
+    stage_dir, meta_path = _paths(stage, key)
+    os.makedirs(stage_dir, exist_ok=True)
+
+    fingerprint = None
+    data_format = None
+    if isinstance(data, pd.DataFrame):
+        columnar.write_dataset(data, os.path.join(stage_dir, f'{key}.parquet'))
+        fingerprint = frame_fingerprint(data)
+        data_format = 'parquet'
+    elif isinstance(data, pa.Table):
+        columnar.write_feature_matrix(data, os.path.join(stage_dir, f'{key}.arrow'))
+        data_format = 'arrow'
+
+    record = {"created": time.time(), "format": data_format, "fingerprint": fingerprint, "meta": meta or {}}
+    def write_meta(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f, default=str)
+
+    columnar.replace_atomically(meta_path, write_meta)
+    return Checkpoint(data, record['meta'], fingerprint, False)
+
+
+def run_stage(stage, inputs, compute, max_age_hours=None, persist=None, valid=None, enabled=True):
+    """
+    Run a pipeline stage, or resume it from its checkpoint
+
+    Args:
+        stage (str): Stage name
+        inputs (dict): Everything the output depends on (parameters and upstream fingerprints)
+        compute (callable): Runs the stage and returns (data, meta)
+        max_age_hours (float): Maximum checkpoint age (for stages reading external data)
+        persist (callable): persist(data, meta) -> False keeps a result out of the checkpoints
+        valid (callable): valid(checkpoint) -> False discards a stored checkpoint
+        enabled (bool): Use checkpoints at all
+
+    Returns:
+        Checkpoint: Stage output
+    """
+    if enabled and CHECKPOINTS_ENABLED:
+        key = stage_key(stage, inputs)
+        checkpoint = load(stage, key, max_age_hours)
+        if checkpoint is not None and (valid is None or valid(checkpoint)):
+            logger.info(f"Resuming stage '{stage}' from checkpoint {key}")
+            return checkpoint
+
+    data, meta = compute()
+    if not (enabled and CHECKPOINTS_ENABLED) or (persist is not None and not persist(data, meta)):
+        fingerprint = frame_fingerprint(data) if isinstance(data, pd.DataFrame) else None
+        return Checkpoint(data, meta, fingerprint, False)
+    return save(stage, key, data, meta)
+
+
+def prune(max_age_hours=72):
+    """
+    Remove checkpoints that were not used for max_age_hours
+
+    Returns:
+        int: Number of removed checkpoints
+    """
+    if not os.path.exists(CHECKPOINT_DIR):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for stage in os.listdir(CHECKPOINT_DIR):
+        stage_dir = os.path.join(CHECKPOINT_DIR, stage)
+        for file in os.listdir(stage_dir):
+            if not file.endswith('.json'):
+                continue
+            meta_path = os.path.join(stage_dir, file)
+            try:
+                if os.path.getmtime(meta_path) >= cutoff:
+                    continue
+                key = file[:-len('.json')]
+                os.remove(meta_path)
+                for ext in ('.parquet', '.arrow'):
+                    if os.path.exists(os.path.join(stage_dir, key + ext)):
+                        os.remove(os.path.join(stage_dir, key + ext))
+                removed += 1
+            except OSError as e:
+                logger.error(f"Failed to remove checkpoint {file}: {str(e)}")
+
+    if removed:
+        logger.info(f"Removed {removed} expired checkpoints")
+    return removed
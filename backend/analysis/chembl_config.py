@@ -0,0 +1,32 @@
+#DrugPredict - ChemBL client configuration
+#The ChemBL client reads its settings when chembl_webresource_client.new_client is
+#first imported, so this module must be imported before it.
+#DRUGPREDICT_CHEMBL_URL points the client at another server, e.g. the local stand-in
+#of scripts/chembl_standin.py used for load tests.
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Base URL of the ChemBL data API (the client's default is the EBI web service)
+CHEMBL_URL = os.getenv('DRUGPREDICT_CHEMBL_URL')
+
+# Set DRUGPREDICT_CHEMBL_CACHE=0 to disable the client's on-disk response cache
+CHEMBL_CACHE = os.getenv('DRUGPREDICT_CHEMBL_CACHE', '1') != '0'
+
+
+def configure():
+    """Apply the environment settings to the ChemBL client (idempotent)"""
+    if not CHEMBL_URL and CHEMBL_CACHE:
+        return
+
+    from chembl_webresource_client.settings import Settings
+    settings = Settings.Instance()
+    if CHEMBL_URL:
+        settings.NEW_CLIENT_URL = CHEMBL_URL.rstrip('/')
+        logger.info(f"Using ChemBL API at {settings.NEW_CLIENT_URL}")
+    settings.CACHING = CHEMBL_CACHE
+
+
+configure()
@@ -0,0 +1,292 @@
+#DrugPredict - Chemical-space map
+#Projects the Morgan fingerprints of a target's compounds to 2D with a PCA fitted
+#incrementally: the mean and scatter matrix are accumulated over fingerprint chunks,
+#so only one chunk is ever unpacked to a dense matrix and memory does not grow with
+#the number of compounds. The float32 coordinates are stored as a memory-mapped
+#Arrow file and served in pages or downsampled; the stored projection places new
+#compounds on the same map.
+
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import eigh
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+from cancellation import NEVER
+from similarity import fingerprint_smiles, FP_BITS, MORGAN_RADIUS
+
+logger = logging.getLogger(__name__)
+
+MAP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed', 'maps')
+
+# Bump when the stored layout or the projection changes
+FORMAT_VERSION = 1
+
+# Compounds per chunk of the PCA fit (a dense chunk takes chunk x FP_BITS x 4 bytes)
+PROJECTION_CHUNK_ROWS = int(os.getenv('DRUGPREDICT_PROJECTION_CHUNK_ROWS', 2000))
+
+# Points returned by the downsampled view, and the page size limit
+MAP_SAMPLE_POINTS = 2000
+MAP_MAX_PAGE_SIZE = 10000
+
+COORDINATES_FILE = 'coordinates.arrow'
+PROJECTION_FILE = 'projection.npz'
+
+
+def map_key(df):
+    """Content key of the map of a dataset (compounds, classes and pIC50 values)"""
+    columns = ['molecule_chembl_id', 'canonical_smiles', 'class', 'pIC50']
+    digest = hashlib.sha1(f'v{FORMAT_VERSION}:{FP_BITS}:{MORGAN_RADIUS}'.encode())
+    digest.update(pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:20]
+
+
+def _chunks(n, chunk_rows):
+    return [(low, min(low + chunk_rows, n)) for low in range(0, n, chunk_rows)]
+
+
+def fit_projection(packed, chunk_rows=PROJECTION_CHUNK_ROWS, cancel=NEVER):
+    """
+    Principal axes of bit-packed fingerprints, accumulated chunk by chunk
+
+    The sums and the FP_BITS x FP_BITS scatter matrix are exact (the fingerprints
+    are binary), so the result does not depend on the chunk size; only the two
+    leading eigenvectors of the covariance matrix are computed.
+
+    Returns:
+        tuple: (mean, components of shape (2, FP_BITS), explained variance ratio), float32
+    """
+    n = len(packed)
+    total = np.zeros(FP_BITS)
+    scatter = np.zeros((FP_BITS, FP_BITS))
+    for low, high in _chunks(n, chunk_rows):
+        cancel.check()
+        dense = np.unpackbits(packed[low:high], axis=1, count=FP_BITS).astype(np.float32)
+        total += dense.sum(axis=0)
+        scatter += dense.T @ dense
+
+    mean = total / n
+    covariance = (scatter - n * np.outer(mean, mean)) / (n - 1)
+    eigenvalues, eigenvectors = eigh(covariance, subset_by_index=[FP_BITS - 2, FP_BITS - 1])
+    components = eigenvectors[:, ::-1].T
+    # Deterministic orientation: the largest loading of each axis is positive
+    components *= np.sign(components[np.arange(2), np.abs(components).argmax(axis=1)])[:, None]
+    total_variance = np.trace(covariance)
+    ratio = eigenvalues[::-1] / total_variance if total_variance > 0 else np.zeros(2)
+    return mean.astype(np.float32), components.astype(np.float32), ratio.astype(np.float32)
+
+
+def project(packed, mean, components):
+    """
+    2D coordinates of bit-packed fingerprints
+
+    Args:
+        packed (np.ndarray): uint8 fingerprints of shape (n, FP_BYTES)
+        mean, components (np.ndarray): Stored projection
+
+    Returns:
+        np.ndarray: float32 array of shape (n, 2)
+    """
+    dense = np.unpackbits(packed, axis=1, count=FP_BITS).astype(np.float32)
+    return ((dense - mean) @ components.T).astype(np.float32)
+
+
+def build_chemical_space(df, map_dir=MAP_DIR, chunk_rows=PROJECTION_CHUNK_ROWS, cancel=NEVER):
+    """
+    Fit the 2D projection of a dataset and store the coordinates of its compounds
+
+    Fingerprints are kept bit-packed (FP_BITS / 8 bytes per compound) and only
+    unpacked one chunk at a time, for the fit (see fit_projection) and for the
+    coordinates. Coordinates come from the stored float32 projection, so placing a
+    known compound again gives exactly its stored coordinates.
+
+    Args:
+        df (pd.DataFrame): Final dataset (molecule_chembl_id, canonical_smiles, class, pIC50)
+        map_dir (str): Directory of the stored maps
+        chunk_rows (int): Compounds per chunk
+        cancel (CancelToken): Checked before every chunk
+
+    Returns:
+        dict: Map summary (mapKey, count, explainedVariance, dataPath), or None if
+              there are too few compounds for a 2D projection
+    """
+    key = map_key(df)
+    path = os.path.join(map_dir, key)
+    if os.path.exists(os.path.join(path, PROJECTION_FILE)):
+        os.utime(os.path.join(path, PROJECTION_FILE))
+        return load_map_info(key, map_dir)
+
+    start = time.perf_counter()
+    packed = np.zeros((len(df), FP_BITS // 8), dtype=np.uint8)
+    valid = np.zeros(len(df), dtype=bool)
+    smiles = df['canonical_smiles'].to_numpy()
+    for low, high in _chunks(len(df), chunk_rows):
+        cancel.check()
+        packed[low:high], valid[low:high] = fingerprint_smiles(smiles[low:high])
+    packed, rows = packed[valid], np.flatnonzero(valid)
+    if len(rows) < 3:
+        logger.warning(f"Too few compounds for a chemical-space map ({len(rows)})")
+        return None
+
+    mean, components, explained = fit_projection(packed, chunk_rows, cancel)
+    coordinates = np.empty((len(packed), 2), dtype=np.float32)
+    for low, high in _chunks(len(packed), chunk_rows):
+        cancel.check()
+        coordinates[low:high] = project(packed[low:high], mean, components)
+
+    points = pd.DataFrame({
+        'molecule_chembl_id': df['molecule_chembl_id'].to_numpy()[rows].astype(str),
+        'x': coordinates[:, 0],
+        'y': coordinates[:, 1],
+        'class': df['class'].to_numpy()[rows].astype(str),
+        'pIC50': df['pIC50'].to_numpy(dtype=np.float32)[rows]
+    })
+
+    # Write into a temporary directory and rename it, so readers never see a partial map
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp_path, exist_ok=True)
+    columnar.write_feature_matrix(points, os.path.join(tmp_path, COORDINATES_FILE))
+    np.savez(os.path.join(tmp_path, PROJECTION_FILE), mean=mean, components=components,
+             explained_variance_ratio=explained, version=np.int32(FORMAT_VERSION))
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Stored concurrently by another worker
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    logger.info(f"Chemical-space map {key}: {len(points)} compounds in {time.perf_counter() - start:.1f}s, "
+                f"explained variance {explained.sum():.1%}")
+    return load_map_info(key, map_dir)
+
+
+@lru_cache(maxsize=16)
+def load_map(key, map_dir=MAP_DIR):
+    """
+    Memory-map a stored map (once per process)
+
+    Returns:
+        tuple: (coordinates as pa.Table, projection arrays as dict)
+
+    Raises:
+        ValueError: If the key is malformed or the format version is unknown
+        FileNotFoundError: If there is no map for the key
+    """
+    if len(key) != 20 or not all(c in '0123456789abcdef' for c in key):
+        raise ValueError(f"Invalid map key: {key}")
+
+    path = os.path.join(map_dir, key)
+    with np.load(os.path.join(path, PROJECTION_FILE)) as stored:
+        projection = {name: stored[name] for name in stored.files}
+    if int(projection['version']) != FORMAT_VERSION:
+        raise ValueError(f"Unsupported map format version: {int(projection['version'])}")
+
+    os.utime(os.path.join(path, PROJECTION_FILE))
+    return columnar.read_feature_matrix(os.path.join(path, COORDINATES_FILE)), projection
+
+
+def load_map_info(key, map_dir=MAP_DIR):
+    """Summary of a stored map, as returned with the analysis results"""
+    points, projection = load_map(key, map_dir)
+    return {
+        "mapKey": key,
+        "count": points.num_rows,
+        "explainedVariance": [round(float(v), 4) for v in projection['explained_variance_ratio']],
+        "dataPath": f"/api/maps/{key}"
+    }
+
+
+def _points(table):
+    columns = table.to_pydict()
+    return {
+        "id": columns['molecule_chembl_id'],
+        "x": [round(v, 4) for v in columns['x']],
+        "y": [round(v, 4) for v in columns['y']],
+        "class": columns['class'],
+        "pIC50": [round(v, 3) for v in columns['pIC50']]
+    }
+
+
+def map_page(key, offset=0, limit=1000):
+    """
+    One page of the coordinates of a map, in dataset order
+
+    Returns:
+        dict: Map summary with offset, limit and the points of the page
+    """
+    points, _ = load_map(key)
+    offset = max(int(offset), 0)
+    limit = min(max(int(limit), 1), MAP_MAX_PAGE_SIZE)
+    return {**load_map_info(key), "offset": offset, "limit": limit, "points": _points(points.slice(offset, limit))}
+
+
+def map_sample(key, max_points=MAP_SAMPLE_POINTS):
+    """
+    Downsampled coordinates of a map: a fixed random subset of at most max_points
+
+    The subset is the same on every call, so clients can cache it.
+
+    Returns:
+        dict: Map summary with the number of sampled points and the points
+    """
+    points, _ = load_map(key)
+    max_points = min(max(int(max_points), 1), MAP_MAX_PAGE_SIZE)
+    if points.num_rows > max_points:
+        rows = np.sort(np.random.default_rng(0).choice(points.num_rows, max_points, replace=False))
+        points = points.take(rows)
+    return {**load_map_info(key), "sampled": points.num_rows, "points": _points(points)}
+
+
+def place_compounds(key, smiles):
+    """
+    Place compounds on a stored map without refitting it
+
+    Args:
+        key (str): Map key
+        smiles (list): SMILES of the compounds
+
+    Returns:
+        list: [x, y] per compound, None for SMILES that could not be parsed
+    """
+    _, projection = load_map(key)
+    packed, valid = fingerprint_smiles(smiles)
+    coordinates = project(packed[valid], projection['mean'], projection['components'])
+    placed = [None] * len(valid)
+    for row, (x, y) in zip(np.flatnonzero(valid), coordinates.tolist()):
+        placed[row] = [round(x, 4), round(y, 4)]
+    return placed
+
+
+def prune_maps(max_age_hours=72, map_dir=MAP_DIR):
+    """
+    Remove maps that were not stored or loaded for max_age_hours
+
+    Returns:
+        int: Number of removed maps
+    """
+    if not os.path.exists(map_dir):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for key in os.listdir(map_dir):
+        path = os.path.join(map_dir, key)
+        projection_path = os.path.join(path, PROJECTION_FILE)
+        try:
+            # Directories without a projection are interrupted writes
+            if os.path.getmtime(projection_path if os.path.exists(projection_path) else path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except OSError as e:
+            logger.error(f"Failed to remove map {key}: {str(e)}")
+
+    if removed:
+        logger.info(f"Removed {removed} expired chemical-space maps")
+    return removed
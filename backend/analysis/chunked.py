@@ -0,0 +1,223 @@
+#DrugPredict - Out-of-core preprocessing
+#Streams the activity records of very large targets through preprocessing, labelling,
+#descriptors and pIC50 conversion in bounded chunks. Global operations are computed
+#from mergeable partial aggregates: deduplication by hash-partitioning the per-chunk
+#parent-structure aggregates into buckets that are merged one at a time, and class
+#counts and Mann-Whitney statistics from per-class value counts.
+
+import logging
+import math
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from scipy.stats import norm
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+from cancellation import NEVER
+from standardize import parent_aggregates, merge_parent_aggregates, finalize_parents
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk; peak memory of the chunked stages is proportional to this
+CHUNK_ROWS = int(os.getenv('DRUGPREDICT_CHUNK_ROWS', 50000))
+
+# Resolution of the per-class value counts behind the Mann-Whitney tests
+# (values closer than this are ranked as ties)
+STAT_RESOLUTION = {'pIC50': 1e-3, 'MW': 1e-2, 'LogP': 1e-3, 'NumHDonors': 1, 'NumHAcceptors': 1}
+
+# Classes compared by the Mann-Whitney tests
+TEST_CLASSES = ('active', 'inactive')
+
+
+def write_partitions(batches, directory, cancel=NEVER):
+    """
+    Write DataFrame batches as numbered Parquet part files
+
+    The cancel token is checked before each batch, so a cancelled task stops
+    consuming the batch generator (e.g. a paginated ChemBL query).
+
+    Returns:
+        int: Number of rows written
+    """
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    rows = 0
+    for part, batch in enumerate(batches):
+        cancel.check()
+        if len(batch):
+            columnar.write_dataset(batch, os.path.join(directory, f'part-{part:05d}.parquet'))
+            rows += len(batch)
+    return rows
+
+
+def iter_partitions(directory, chunk_rows=CHUNK_ROWS):
+    """Read the part files of a directory back as DataFrames of at most chunk_rows rows"""
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.parquet'):
+            continue
+        parquet_file = pq.ParquetFile(os.path.join(directory, name), memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+
+
+def partition_rows(directory):
+    """Total row count of the part files of a directory (from the Parquet metadata)"""
+    return sum(pq.ParquetFile(os.path.join(directory, name)).metadata.num_rows
+               for name in os.listdir(directory) if name.endswith('.parquet'))
+
+
+class StatisticsAggregate:
+    """
+    Mergeable class counts and per-class value counts of the final dataset
+
+    Value counts are kept at STAT_RESOLUTION, so their size depends on the number of
+    distinct values rather than on the number of compounds.
+    """
+
+    def __init__(self, descriptors=STAT_RESOLUTION):
+        self.resolution = dict(descriptors)
+        self.rows = 0
+        self.class_counts = pd.Series(dtype='int64')
+        self.value_counts = {d: {c: pd.Series(dtype='int64') for c in TEST_CLASSES} for d in self.resolution}
+
+    def add(self, df):
+        """Add the rows of one chunk"""
+        self.rows += len(df)
+        counts = df['class'].astype(str).value_counts()
+        self.class_counts = self.class_counts.add(counts, fill_value=0).astype('int64')
+        for descriptor, resolution in self.resolution.items():
+            steps = np.round(df[descriptor].to_numpy(dtype='float64') / resolution).astype('int64')
+            for cls in TEST_CLASSES:
+                in_class = steps[(df['class'] == cls).to_numpy()]
+                merged = self.value_counts[descriptor][cls].add(pd.Series(in_class).value_counts(), fill_value=0)
+                self.value_counts[descriptor][cls] = merged.astype('int64')
+
+    def merge(self, other):
+        """Combine with the aggregate of other chunks"""
+        self.rows += other.rows
+        self.class_counts = self.class_counts.add(other.class_counts, fill_value=0).astype('int64')
+        for descriptor in self.resolution:
+            for cls in TEST_CLASSES:
+                merged = self.value_counts[descriptor][cls].add(other.value_counts[descriptor][cls], fill_value=0)
+                self.value_counts[descriptor][cls] = merged.astype('int64')
+        return self
+
+    def mannwhitney(self, descriptor):
+        """Mann-Whitney U test of active vs inactive compounds (see mannwhitney_from_counts)"""
+        return mannwhitney_from_counts(self.value_counts[descriptor]['active'],
+                                       self.value_counts[descriptor]['inactive'])
+
+
+def mannwhitney_from_counts(counts_x, counts_y):
+    """
+    Two-sided Mann-Whitney U test from value counts
+
+    Uses the normal approximation with tie and continuity correction, like
+    scipy.stats.mannwhitneyu(method='asymptotic').
+
+    Args:
+        counts_x, counts_y (pd.Series): Number of observations per value of each sample
+
+    Returns:
+        tuple: (U statistic of the first sample, p-value)
+    """
+    n_x, n_y = int(counts_x.sum()), int(counts_y.sum())
+    if n_x == 0 or n_y == 0:
+        raise ValueError("Both samples must contain observations")
+
+    table = pd.concat([counts_x.rename('x'), counts_y.rename('y')], axis=1).fillna(0).sort_index()
+    ties = (table['x'] + table['y']).to_numpy(dtype='float64')
+    # Midrank of every distinct value
+    ranks = np.cumsum(ties) - (ties - 1) / 2
+    u_x = float((ranks * table['x'].to_numpy()).sum() - n_x * (n_x + 1) / 2)
+
+    n = n_x + n_y
+    mean = n_x * n_y / 2
+    variance = n_x * n_y / 12 * ((n + 1) - (ties ** 3 - ties).sum() / (n * (n - 1)))
+    if variance <= 0:
+        return u_x, 1.0
+    z = (abs(u_x - mean) - 0.5) / math.sqrt(variance)
+    return u_x, float(min(1.0, 2 * norm.sf(max(z, 0.0))))
+
+
+def run_chunked(raw_dir, work_dir, prefilter, transform, chunk_rows=CHUNK_ROWS, cancel=NEVER):
+    """
+    Deduplicate and process partitioned activity records with bounded memory
+
+    Pass 1 reads the raw records chunk by chunk, computes the parent-structure
+    aggregates of each chunk and hash-partitions them into buckets on disk (all
+    records of one structure end up in the same bucket). Pass 2 merges one bucket at
+    a time, runs the row-wise stages on it and writes one output part per bucket.
+
+    Args:
+        raw_dir (str): Directory of raw activity part files
+        work_dir (str): Directory for the buckets and the output parts
+        prefilter (callable): Row filter applied to each raw chunk
+        transform (callable): Row-wise stages (labelling, descriptors, pIC50) for a deduplicated chunk
+        chunk_rows (int): Maximum rows per chunk and (approximately) per bucket
+        cancel (CancelToken): Checked before every chunk and every bucket
+
+    Returns:
+        tuple: (output directory, StatisticsAggregate, number of raw records)
+    """
+    raw_rows = partition_rows(raw_dir)
+    n_buckets = max(1, math.ceil(raw_rows / chunk_rows))
+    bucket_dir = os.path.join(work_dir, 'buckets')
+    output_dir = os.path.join(work_dir, 'final')
+    for directory in (bucket_dir, output_dir):
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+
+    # Pass 1: per-chunk aggregates, partitioned by structure
+    row_offset = 0
+    for chunk_index, chunk in enumerate(iter_partitions(raw_dir, chunk_rows)):
+        cancel.check()
+        offset = row_offset
+        row_offset += len(chunk)
+        chunk = prefilter(chunk)
+        if chunk.empty:
+            continue
+        partial = parent_aggregates(chunk, offset)
+        buckets = pd.util.hash_array(partial['parent_smiles'].to_numpy(dtype=object)) % n_buckets
+        for bucket, piece in partial.groupby(buckets):
+            path = os.path.join(bucket_dir, f'{bucket:05d}')
+            os.makedirs(path, exist_ok=True)
+            columnar.write_dataset(piece, os.path.join(path, f'part-{chunk_index:05d}.parquet'))
+    logger.info(f"Partitioned {raw_rows} records into {n_buckets} structure buckets")
+
+    # Pass 2: merge each bucket and run the row-wise stages on it
+    statistics = StatisticsAggregate()
+    for bucket in sorted(os.listdir(bucket_dir)):
+        cancel.check()
+        merged = merge_parent_aggregates(columnar.read_dataset(os.path.join(bucket_dir, bucket)))
+        df = finalize_parents(merged)
+        df['first_row'] = merged['first_row'].to_numpy()
+        df = transform(df)
+        if df.empty:
+            continue
+        statistics.add(df)
+        columnar.write_dataset(df, os.path.join(output_dir, f'part-{bucket}.parquet'))
+        shutil.rmtree(os.path.join(bucket_dir, bucket))
+
+    logger.info(f"Chunked processing complete: {raw_rows} records → {statistics.rows} compounds")
+    return output_dir, statistics, raw_rows
+
+
+def read_output(output_dir):
+    """
+    Load the output parts in the order of first appearance of each structure
+
+    The final dataset has one compact row per structure, so it is small enough for
+    the stages that need all compounds at once (plots, ML).
+    """
+    df = columnar.read_dataset(output_dir)
+    if 'first_row' in df.columns:
+        df = df.sort_values('first_row', kind='stable').drop(columns='first_row').reset_index(drop=True)
+    return df
@@ -0,0 +1,157 @@
+#DrugPredict - Columnar dataset storage
+#Processed datasets are stored as zstd-compressed Parquet and feature matrices as
+#uncompressed Arrow IPC files that can be memory-mapped without copying.
+
+import io
+import logging
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Rows per record batch when streaming a dataset
+STREAM_BATCH_SIZE = 10000
+
+# Mode of replaced files: mkstemp creates private files, replaced files follow the umask
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def replace_atomically(path, write):
+    """
+    Write to a temporary file and move it into place so readers never see partial files
+
+    The temporary file has a unique name in the destination directory, so concurrent
+    writers of the same path (two analyses of one target) never share it; the last
+    one to finish wins.
+
+    Args:
+        path (str): Destination file
+        write (callable): write(tmp_path) writes the content
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f'.{os.path.basename(path)}.',
+                                    suffix='.tmp')
+    os.fchmod(fd, FILE_MODE)
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_dataset(df, path):
+    """
+    Save a DataFrame as compressed Parquet, preserving column types
+
+    Args:
+        df (pd.DataFrame): Data to save
+        path (str): Destination .parquet file
+
+    Returns:
+        str: Path of the saved file
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    replace_atomically(path, lambda tmp: pq.write_table(table, tmp, compression=PARQUET_COMPRESSION))
+    return path
+
+
+def read_dataset(path, columns=None):
+    """
+    Load a Parquet dataset (a single file or a directory of part files)
+
+    Args:
+        path (str): .parquet file or directory
+        columns (list): Only read these columns
+
+    Returns:
+        pd.DataFrame: Loaded data
+    """
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+def write_feature_matrix(table, path):
+    """
+    Save a feature matrix as an uncompressed Arrow IPC file
+
+    Args:
+        table (pa.Table or pd.DataFrame): Feature matrix
+        path (str): Destination .arrow file
+    """
+    if not isinstance(table, pa.Table):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+
+    def write(tmp_path):
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    replace_atomically(path, write)
+    return path
+
+
+def read_feature_matrix(path):
+    """
+    Memory-map an Arrow IPC feature matrix
+
+    The returned table references the mapped file directly (zero-copy), so several
+    readers of the same file share one copy in the page cache.
+
+    Returns:
+        pa.Table: Feature matrix
+    """
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def convert_descriptor_csv(csv_path, arrow_path, drop_columns=('Name',), key_column=None):
+    """
+    Convert a descriptor CSV (e.g. PaDEL output) to a float32 Arrow feature matrix
+
+    The CSV is parsed once with the multithreaded Arrow reader; numeric columns are
+    stored as float32.
+
+    Args:
+        key_column (str): Keep this column (as strings) to identify the rows
+
+    Returns:
+        pa.Table: Memory-mapped feature matrix
+    """
+    convert_options = pacsv.ConvertOptions(column_types={key_column: pa.string()} if key_column else None)
+    table = pacsv.read_csv(csv_path, convert_options=convert_options)
+    table = table.drop([c for c in drop_columns if c in table.column_names and c != key_column])
+    table = table.cast(pa.schema([
+        pa.field(name, pa.string() if name == key_column else pa.float32()) for name in table.column_names
+    ]))
+    write_feature_matrix(table, arrow_path)
+    logger.info(f"Stored {table.num_rows}x{table.num_columns} feature matrix at {arrow_path}")
+    return read_feature_matrix(arrow_path)
+
+
+def iter_csv_bytes(path, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream a Parquet dataset as CSV, one record batch at a time
+
+    Only one batch is held in memory, independent of the dataset size.
+    """
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    first = True
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        buffer = io.BytesIO()
+        pacsv.write_csv(pa.Table.from_batches([batch]), buffer,
+                        write_options=pacsv.WriteOptions(include_header=first))
+        first = False
+        yield buffer.getvalue()
+    if first:
+        # Empty dataset: still emit the header
+        buffer = io.BytesIO()
+        pacsv.write_csv(parquet_file.schema_arrow.empty_table(), buffer)
+        yield buffer.getvalue()
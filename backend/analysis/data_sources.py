@@ -0,0 +1,186 @@
+#DrugPredict - Target and activity data sources
+#Target search and activity retrieval go through a DataSource selected by
+#DRUGPREDICT_DATA_SOURCE: 'chembl' (default) queries the ChemBL web service through
+#chembl_webresource_client, 'local' reads an indexed SQLite snapshot built by
+#scripts/import_chembl_snapshot.py, so analyses do not depend on the latency,
+#availability or rate limits of the remote service.
+
+import importlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+
+sys.path.append(os.path.dirname(__file__))
+import chembl_config  # Must be imported before the ChemBL client
+
+logger = logging.getLogger(__name__)
+
+# Local snapshot database (see scripts/import_chembl_snapshot.py)
+SNAPSHOT_PATH = os.getenv('DRUGPREDICT_CHEMBL_SNAPSHOT') or os.path.join(
+    os.path.dirname(__file__), '..', '..', 'data', 'chembl', 'chembl_snapshot.db')
+
+# Bump when the snapshot schema changes (checked when a snapshot is opened)
+SNAPSHOT_VERSION = 1
+
+# Columns of the snapshot's activities table
+SNAPSHOT_ACTIVITY_FIELDS = ['activity_id', 'target_chembl_id', 'standard_type', 'molecule_chembl_id',
+                            'canonical_smiles', 'standard_value']
+
+TARGET_FIELDS = ['target_chembl_id', 'pref_name', 'organism', 'target_type']
+
+
+class DataSource:
+    """
+    Interface of a target and activity data source
+
+    Target records are dicts with TARGET_FIELDS, activity records dicts with the
+    requested fields.
+    """
+
+    def key(self):
+        """Identity of the data (part of the fetch checkpoint key)"""
+        raise NotImplementedError
+
+    def search_targets(self, query, limit=10):
+        """Targets matching a name, gene symbol or ChemBL ID, best match first"""
+        raise NotImplementedError
+
+    def target_name(self, target_id):
+        """Preferred name of a target (None if unknown)"""
+        raise NotImplementedError
+
+    def activities(self, target_id, fields, standard_type='IC50', limit=None, min_activity_id=None):
+        """
+        Activity records of a target, fetched lazily while iterating
+
+        Args:
+            target_id (str): ChemBL target ID
+            fields (list): Fields of the returned records
+            standard_type (str): Activity type
+            limit (int): Maximum number of records (None for all)
+            min_activity_id (int): Only records with a higher activity_id, in activity_id order
+
+        Returns:
+            iterable: Activity records
+        """
+        raise NotImplementedError
+
+
+class ChemblWebSource(DataSource):
+    """The ChemBL web service (or the server at DRUGPREDICT_CHEMBL_URL, see chembl_config)"""
+
+    @property
+    def client(self):
+        # Imported on first use, so target search does not load the client at boot
+        from chembl_webresource_client.new_client import new_client
+        return new_client
+
+    def key(self):
+        return f"chembl:{chembl_config.CHEMBL_URL or 'ebi'}"
+
+    def search_targets(self, query, limit=10):
+        return list(self.client.target.search(query).only(TARGET_FIELDS)[:limit])
+
+    def target_name(self, target_id):
+        details = self.client.target.get(target_id)
+        return details.get('pref_name') if details else None
+
+    def activities(self, target_id, fields, standard_type='IC50', limit=None, min_activity_id=None):
+        query = self.client.activity.filter(target_chembl_id=target_id).filter(standard_type=standard_type).only(fields)
+        if min_activity_id is not None:
+            query = query.filter(activity_id__gt=int(min_activity_id)).order_by('activity_id')
+        return query if limit is None else query[:int(limit)]
+
+
+class LocalSnapshotSource(DataSource):
+    """
+    Indexed SQLite snapshot of the ChemBL targets and activities
+
+    Activities are looked up through the (target_chembl_id, standard_type, activity_id)
+    index, so a query costs milliseconds whatever the size of the snapshot. The
+    database is opened read-only, with one connection per thread and process.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or SNAPSHOT_PATH)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No ChemBL snapshot at {self.path} (build one with scripts/import_chembl_snapshot.py)")
+        self._local = threading.local()
+        self.info = dict(self._connection().execute("SELECT key, value FROM snapshot_info"))
+        if int(self.info.get('version', 0)) != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported ChemBL snapshot version {self.info.get('version')} in {self.path}")
+        logger.info(f"Using ChemBL snapshot {self.path} ({self.info.get('source')}, imported {self.info.get('imported')})")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def key(self):
+        return f"local:{self.info.get('source')}:{self.info.get('imported')}"
+
+    def search_targets(self, query, limit=10):
+        query = query.strip()
+        pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        # Exact IDs, names and synonyms first, then prefixes, then targets with the most activities
+        rows = self._connection().execute(
+            "SELECT t.target_chembl_id, t.pref_name, t.organism, t.target_type FROM targets t"
+            " WHERE t.target_chembl_id = upper(:q) OR t.pref_name LIKE :contains ESCAPE '\\'"
+            "  OR t.target_chembl_id IN (SELECT target_chembl_id FROM target_synonyms"
+            "                            WHERE synonym LIKE :prefix ESCAPE '\\')"
+            " ORDER BY t.target_chembl_id = upper(:q) DESC,"
+            "  (t.pref_name = :q COLLATE NOCASE OR EXISTS (SELECT 1 FROM target_synonyms s"
+            "   WHERE s.target_chembl_id = t.target_chembl_id AND s.synonym = :q)) DESC,"
+            "  t.pref_name LIKE :prefix ESCAPE '\\' DESC, t.n_activities DESC, length(t.pref_name)"
+            " LIMIT :limit",
+            {"q": query, "contains": f"%{pattern}%", "prefix": f"{pattern}%", "limit": int(limit)}
+        ).fetchall()
+        return [dict(zip(TARGET_FIELDS, row)) for row in rows]
+
+    def target_name(self, target_id):
+        row = self._connection().execute(
+            "SELECT pref_name FROM targets WHERE target_chembl_id = ?", (target_id.upper(),)).fetchone()
+        return row[0] if row else None
+
+    def activities(self, target_id, fields, standard_type='IC50', limit=None, min_activity_id=None):
+        unknown = [field for field in fields if field not in SNAPSHOT_ACTIVITY_FIELDS]
+        if unknown:
+            raise ValueError(f"Fields not in the ChemBL snapshot: {unknown}")
+        sql = (f"SELECT {', '.join(fields)} FROM activities WHERE target_chembl_id = ? AND standard_type = ?"
+               + (" AND activity_id > ?" if min_activity_id is not None else "")
+               + " ORDER BY activity_id" + (" LIMIT ?" if limit is not None else ""))
+        args = [target_id.upper(), standard_type]
+        if min_activity_id is not None:
+            args.append(int(min_activity_id))
+        if limit is not None:
+            args.append(int(limit))
+        cursor = self._connection().execute(sql, args)
+        return (dict(zip(fields, row)) for row in cursor)
+
+
+@lru_cache(maxsize=4)
+def get_data_source(spec=None):
+    """
+    The data source selected by DRUGPREDICT_DATA_SOURCE (one instance per process)
+
+    Args:
+        spec (str): 'chembl' (default), 'local', or 'package.module:ClassName' for a custom source
+
+    Returns:
+        DataSource: Data source instance
+    """
+    spec = spec or os.getenv('DRUGPREDICT_DATA_SOURCE', 'chembl')
+    if spec == 'chembl':
+        return ChemblWebSource()
+    if spec == 'local':
+        return LocalSnapshotSource()
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError(f"Unknown data source: {spec}")
+    return getattr(importlib.import_module(module_name), class_name)()
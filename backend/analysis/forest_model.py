@@ -0,0 +1,226 @@
+#DrugPredict - Compact Random Forest format
+#Trained forests are stored as flat NumPy arrays (split feature, threshold, children
+#and leaf value of every node of every tree) that are memory-mapped on load, so all
+#worker processes share one copy in the page cache. Prediction advances every
+#(row, tree) pair of a batch one level per step with array indexing, instead of
+#walking the trees one by one.
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed', 'models')
+
+# Bump when the array layout changes
+FORMAT_VERSION = 1
+
+# Rows x trees of node indices held at once during prediction
+PREDICT_BLOCK_CELLS = 1 << 20
+
+_ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+
+class CompactForest:
+    """
+    Random Forest regressor stored as flat node arrays
+
+    children holds the left and right child of node i at 2i and 2i + 1, so one
+    gather picks the next node. Leaves are their own children, which marks the
+    end of a path.
+
+    Args:
+        arrays (dict): Node arrays (feature, threshold, children, value) and tree roots
+        meta (dict): Model metadata (feature names, tree count, depth)
+    """
+
+    def __init__(self, arrays, meta):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children = arrays['children']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.meta = meta
+        self.n_features = meta['nFeatures']
+
+    @classmethod
+    def from_sklearn(cls, model, feature_names=None):
+        """Flatten a fitted sklearn RandomForestRegressor"""
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        n_nodes = int(offsets[-1])
+        index_type = np.int32 if 2 * n_nodes < 2 ** 31 else np.int64
+        feature_type = np.int16 if model.n_features_in_ < 2 ** 15 else np.int32
+
+        feature = np.zeros(n_nodes, dtype=feature_type)
+        threshold = np.full(n_nodes, np.inf)
+        children = np.repeat(np.arange(n_nodes, dtype=index_type), 2).reshape(n_nodes, 2)
+        value = np.empty(n_nodes)
+
+        for tree, offset in zip(trees, offsets[:-1]):
+            nodes = slice(offset, offset + tree.node_count)
+            split = tree.children_left != -1
+            feature[nodes][split] = tree.feature[split]
+            threshold[nodes][split] = tree.threshold[split]
+            children[nodes, 0][split] = tree.children_left[split] + offset
+            children[nodes, 1][split] = tree.children_right[split] + offset
+            value[nodes] = tree.value[:, 0, 0]
+
+        arrays = {
+            'feature': feature, 'threshold': threshold, 'children': children, 'value': value, 'roots': offsets[:-1].astype(index_type)
+        }
+        meta = {
+            "version": FORMAT_VERSION,
+            "nTrees": len(trees),
+            "nNodes": n_nodes,
+            "nFeatures": int(model.n_features_in_),
+            "maxDepth": int(max(tree.max_depth for tree in trees)),
+            "featureNames": [str(name) for name in feature_names] if feature_names is not None else None
+        }
+        return cls(arrays, meta)
+
+    def predict(self, X):
+        """
+        Predict a batch of rows (same values as the sklearn model, up to float rounding)
+
+        Args:
+            X (array-like): Feature matrix (n_rows x n_features)
+
+        Returns:
+            np.ndarray: Predictions
+        """
+        # sklearn compares float32 features against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features per row, got shape {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Features must not contain NaN")
+
+        n_trees = len(self.roots)
+        children = self.children.reshape(-1)
+        block = max(1, PREDICT_BLOCK_CELLS // n_trees)
+        predictions = np.empty(len(X))
+        for start in range(0, len(X), block):
+            rows = X[start:start + block]
+            values = rows.reshape(-1)
+
+            # One cell per (row, tree); only cells that have not reached a leaf move on
+            nodes = np.tile(self.roots, len(rows))
+            row_offsets = np.repeat(np.arange(len(rows), dtype=np.int64) * self.n_features, n_trees)
+            active = np.arange(len(nodes))
+            while active.size:
+                current = nodes[active]
+                x = values[row_offsets[active] + self.feature[current]]
+                following = children[2 * current + (x > self.threshold[current])]
+                nodes[active] = following
+                active = active[following != current]
+
+            # Sum tree by tree in the order sklearn accumulates them
+            leaf_values = self.value[nodes].reshape(len(rows), n_trees)
+            total = np.zeros(len(rows))
+            for tree in range(n_trees):
+                total += leaf_values[:, tree]
+            predictions[start:start + block] = total / n_trees
+        return predictions
+
+    def content_key(self):
+        """Hash of the node arrays (identical forests share one stored copy)"""
+        digest = hashlib.sha1(str(FORMAT_VERSION).encode())
+        for name in _ARRAYS:
+            digest.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+        return digest.hexdigest()[:20]
+
+
+def save_forest(model, feature_names=None, model_dir=MODEL_DIR):
+    """
+    Export a fitted RandomForestRegressor in the compact format
+
+    Args:
+        model: Fitted sklearn RandomForestRegressor
+        feature_names (list): Names of the model's input columns
+        model_dir (str): Directory of stored models
+
+    Returns:
+        str: Model key
+    """
+    forest = CompactForest.from_sklearn(model, feature_names)
+    model_key = forest.content_key()
+    path = os.path.join(model_dir, model_key)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        os.utime(os.path.join(path, 'meta.json'))
+        return model_key
+
+    # Write into a temporary directory and rename it, so readers never see a partial model
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp_path, exist_ok=True)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), getattr(forest, name))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(forest.meta, f)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Stored concurrently by another worker
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    size = sum(getattr(forest, name).nbytes for name in _ARRAYS)
+    logger.info(f"Saved model {model_key} ({forest.meta['nNodes']} nodes, {size / 1e6:.1f} MB)")
+    return model_key
+
+
+@lru_cache(maxsize=16)
+def load_forest(model_key, model_dir=MODEL_DIR):
+    """
+    Memory-map a stored model (once per process)
+
+    Raises:
+        ValueError: If the key is malformed or the format version is unknown
+        FileNotFoundError: If there is no model for the key
+    """
+    if len(model_key) != 20 or not all(c in '0123456789abcdef' for c in model_key):
+        raise ValueError(f"Invalid model key: {model_key}")
+
+    path = os.path.join(model_dir, model_key)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version: {meta.get('version')}")
+
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in _ARRAYS}
+    os.utime(os.path.join(path, 'meta.json'))
+    return CompactForest(arrays, meta)
+
+
+def prune_models(max_age_hours=72, model_dir=MODEL_DIR):
+    """
+    Remove models that were not stored or loaded for max_age_hours
+
+    Returns:
+        int: Number of removed models
+    """
+    if not os.path.exists(model_dir):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for model_key in os.listdir(model_dir):
+        path = os.path.join(model_dir, model_key)
+        meta_path = os.path.join(path, 'meta.json')
+        try:
+            # Directories without metadata are interrupted exports
+            if os.path.getmtime(meta_path if os.path.exists(meta_path) else path) < cutoff:
+                shutil.rmtree(path)
+                removed += 1
+        except OSError as e:
+            logger.error(f"Failed to remove model {model_key}: {str(e)}")
+
+    if removed:
+        logger.info(f"Removed {removed} expired models")
+    return removed
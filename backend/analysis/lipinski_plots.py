@@ -1,126 +1,205 @@
-#William Huang
-#Bioinformatics Data Project
-#Dependencies: ChemBL and rdkit (conda install -c rdkit rdkit -y)
-import seaborn as sns
-sns.set(style='ticks')
-import matplotlib.pyplot as plt
-import os
-
-class lipinski_plots:
-    df = 0
-
-    def __init__(self, df, file_prefix=""):
-        self.df = df
-        self.file_prefix = file_prefix
-        # Create output directory if it doesn't exist
-        self.output_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'outputs')
-        os.makedirs(self.output_dir, exist_ok=True)
-
-    def bar_graph(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.countplot(x='class', data=df, edgecolor='black')
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('Frequency', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_bioactivity_class.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def scatter_plot(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.scatterplot(x='MW', y='LogP', data=df, hue='class', size='pIC50', edgecolor='black', alpha=0.7)
-
-        plt.xlabel('MW', fontsize=14, fontweight='bold')
-        plt.ylabel('LogP', fontsize=14, fontweight='bold')
-        plt.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0)
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_MW_vs_LogP.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def pIC_50_plot(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.boxplot(x='class', y='pIC50', data=df)
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('pIC50 value', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_ic50.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def mol_weight(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.boxplot(x='class', y='MW', data=df)
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('MW', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_MW.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def logP(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.boxplot(x='class', y='LogP', data=df)
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('LogP', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_LogP.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def num_hdonors(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.boxplot(x='class', y='NumHDonors', data=df)
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('NumHDonors', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_NumHDonors.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def num_hacceptors(self, df):
-        plt.figure(figsize=(5.5, 5.5))
-
-        sns.boxplot(x='class', y='NumHAcceptors', data=df)
-
-        plt.xlabel('Bioactivity class', fontsize=14, fontweight='bold')
-        plt.ylabel('NumHAcceptors', fontsize=14, fontweight='bold')
-        plt.tight_layout()
-        filename = f'{self.file_prefix}plot_NumHAcceptors.png'
-        plt.savefig(os.path.join(self.output_dir, filename), dpi=300, bbox_inches='tight')
-        plt.close()
-
-    def prediction_scatter(self, experimental_pic50, predicted_pic50):
-        """Create scatter plot of experimental vs predicted pIC50 values"""
-        plt.figure(figsize=(6, 6))
-        
-        # Create scatter plot
-        plt.scatter(experimental_pic50, predicted_pic50, alpha=0.6, edgecolors='black')
-        
-        # Add diagonal line for perfect prediction
-        min_val = min(min(experimental_pic50), min(predicted_pic50))
-        max_val = max(max(experimental_pic50), max(predicted_pic50))
-        plt.plot([min_val, max_val], [min_val, max_val], 'r--', lw=2, label='Perfect prediction')
-        
-        # Labels and formatting
-        plt.xlabel('Experimental pIC50', fontsize=14, fontweight='bold')
-        plt.ylabel('Predicted pIC50', fontsize=14, fontweight='bold')
-        plt.title('Experimental vs Predicted pIC50', fontsize=16, fontweight='bold')
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        
-        # Save plot
-        plt.savefig(os.path.join(self.output_dir, 'predicted_experimental_pIC50.png'), dpi=300, bbox_inches='tight')
-        plt.close()
\ No newline at end of file
+#William Huang
+#Bioinformatics Data Project
+#Dependencies: ChemBL and rdkit (conda install -c rdkit rdkit -y)
+#Plots are drawn on explicit Figure/Axes objects (no pyplot state machine), so they
+#can be rendered from several threads or, via render_plots(), in worker processes.
+import seaborn as sns
+sns.set(style='ticks')
+from matplotlib.figure import Figure
+from matplotlib.colors import to_rgb
+from matplotlib.patches import Patch
+import numpy as np
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(__file__))
+from process_pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Plot methods and the files they write (without the task prefix)
+PLOT_FILES = {
+    'bar_graph': 'plot_bioactivity_class.png',
+    'scatter_plot': 'plot_MW_vs_LogP.png',
+    'pIC_50_plot': 'plot_ic50.png',
+    'mol_weight': 'plot_MW.png',
+    'logP': 'plot_LogP.png',
+    'num_hdonors': 'plot_NumHDonors.png',
+    'num_hacceptors': 'plot_NumHAcceptors.png'
+}
+
+REGRESSION_PLOT_FILE = 'predicted_experimental_pIC50.png'
+
+PLOT_DPI = 300
+
+# Above this many points, scatter plots are drawn as binned density instead of markers
+DENSITY_THRESHOLD = 5000
+
+# Bins per axis of a density plot
+DENSITY_BINS = 200
+
+class lipinski_plots:
+    df = 0
+
+    def __init__(self, df, file_prefix="", dpi=PLOT_DPI, width=None, output_dir=None):
+        self.df = df
+        self.file_prefix = file_prefix
+        self.dpi = dpi
+        # Image width in pixels (None keeps the default figure size)
+        self.width = width
+        # Create output directory if it doesn't exist
+        self.output_dir = output_dir or os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'outputs')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _figure(self, figsize):
+        return Figure(figsize=figsize)
+
+    def _dpi(self, fig):
+        """Resolution that gives the requested image width at the default figure size"""
+        return self.width / fig.get_figwidth() if self.width else self.dpi
+
+    def _save(self, fig, filename):
+        fig.tight_layout()
+        fig.savefig(os.path.join(self.output_dir, f'{self.file_prefix}{filename}'), dpi=self._dpi(fig), bbox_inches='tight')
+
+    def _class_boxplot(self, df, column, ylabel, method):
+        fig = self._figure((5.5, 5.5))
+        ax = fig.subplots()
+
+        sns.boxplot(x='class', y=column, data=df, ax=ax)
+
+        ax.set_xlabel('Bioactivity class', fontsize=14, fontweight='bold')
+        ax.set_ylabel(ylabel, fontsize=14, fontweight='bold')
+        self._save(fig, PLOT_FILES[method])
+
+    def bar_graph(self, df):
+        fig = self._figure((5.5, 5.5))
+        ax = fig.subplots()
+
+        sns.countplot(x='class', data=df, edgecolor='black', ax=ax)
+
+        ax.set_xlabel('Bioactivity class', fontsize=14, fontweight='bold')
+        ax.set_ylabel('Frequency', fontsize=14, fontweight='bold')
+        self._save(fig, PLOT_FILES['bar_graph'])
+
+    def _density_layers(self, ax, x, y, groups):
+        """Draw one binned density layer per class (color = class, opacity = log count)"""
+        x_edges = np.linspace(np.min(x), np.max(x), DENSITY_BINS + 1)
+        y_edges = np.linspace(np.min(y), np.max(y), DENSITY_BINS + 1)
+        extent = (x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
+        labels = list(groups.cat.categories) if hasattr(groups, 'cat') else sorted(set(groups))
+        palette = sns.color_palette(n_colors=len(labels))
+        groups = np.asarray(groups)
+
+        handles = []
+        for label, color in zip(labels, palette):
+            mask = groups == label
+            if not mask.any():
+                continue
+            counts, _, _ = np.histogram2d(x[mask], y[mask], bins=(x_edges, y_edges))
+            layer = np.zeros(counts.shape[::-1] + (4,))
+            layer[..., :3] = to_rgb(color)
+            layer[..., 3] = 0.75 * np.log1p(counts.T) / np.log1p(counts.max())
+            ax.imshow(layer, extent=extent, origin='lower', aspect='auto', interpolation='nearest')
+            handles.append(Patch(color=color, label=f'{label} ({int(mask.sum())})'))
+        return handles
+
+    def scatter_plot(self, df):
+        fig = self._figure((5.5, 5.5))
+        ax = fig.subplots()
+
+        if len(df) > DENSITY_THRESHOLD:
+            handles = self._density_layers(ax, df['MW'].to_numpy(dtype='float64'),
+                                           df['LogP'].to_numpy(dtype='float64'), df['class'])
+            ax.legend(handles=handles, title='class', bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0)
+        else:
+            sns.scatterplot(x='MW', y='LogP', data=df, hue='class', size='pIC50', edgecolor='black', alpha=0.7, ax=ax)
+            ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0)
+
+        ax.set_xlabel('MW', fontsize=14, fontweight='bold')
+        ax.set_ylabel('LogP', fontsize=14, fontweight='bold')
+        self._save(fig, PLOT_FILES['scatter_plot'])
+
+    def pIC_50_plot(self, df):
+        self._class_boxplot(df, 'pIC50', 'pIC50 value', 'pIC_50_plot')
+
+    def mol_weight(self, df):
+        self._class_boxplot(df, 'MW', 'MW', 'mol_weight')
+
+    def logP(self, df):
+        self._class_boxplot(df, 'LogP', 'LogP', 'logP')
+
+    def num_hdonors(self, df):
+        self._class_boxplot(df, 'NumHDonors', 'NumHDonors', 'num_hdonors')
+
+    def num_hacceptors(self, df):
+        self._class_boxplot(df, 'NumHAcceptors', 'NumHAcceptors', 'num_hacceptors')
+
+    def prediction_scatter(self, experimental_pic50, predicted_pic50, filename=REGRESSION_PLOT_FILE):
+        """Create scatter plot of experimental vs predicted pIC50 values"""
+        fig = self._figure((10, 10))
+        ax = fig.subplots()
+
+        # Create scatter plot (binned density for large test sets)
+        if len(experimental_pic50) > DENSITY_THRESHOLD:
+            counts, x_edges, y_edges = np.histogram2d(experimental_pic50, predicted_pic50, bins=DENSITY_BINS)
+            # Empty bins are masked so they stay background-colored
+            image = ax.imshow(np.ma.masked_equal(np.log1p(counts.T), 0),
+                              extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]),
+                              origin='lower', aspect='auto', interpolation='nearest', cmap='viridis')
+            fig.colorbar(image, ax=ax, label='log(1 + compounds)')
+        else:
+            ax.scatter(experimental_pic50, predicted_pic50, alpha=0.4)
+
+        # Add diagonal line for perfect prediction
+        min_val = min(np.min(experimental_pic50), np.min(predicted_pic50))
+        max_val = max(np.max(experimental_pic50), np.max(predicted_pic50))
+        ax.plot([min_val, max_val], [min_val, max_val], 'r--', alpha=0.8)
+
+        # Labels and formatting
+        ax.set_xlabel('Experimental pIC50', fontsize=14, fontweight='bold')
+        ax.set_ylabel('Predicted pIC50', fontsize=14, fontweight='bold')
+        ax.set_title('Predicted vs Experimental pIC50', fontsize=16, fontweight='bold')
+
+        # Save plot (the file name already carries the task prefix)
+        fig.savefig(os.path.join(self.output_dir, filename), dpi=self._dpi(fig), bbox_inches='tight')
+
+
+def render_plot(method, df, file_prefix=""):
+    """
+    Render one plot of the class and time it (runs in a worker process)
+
+    Returns:
+        tuple: (method, render time in ms)
+    """
+    start = time.perf_counter()
+    getattr(lipinski_plots(df, file_prefix), method)(df)
+    return method, (time.perf_counter() - start) * 1000
+
+
+def render_plots(df, file_prefix="", methods=None, parallel=True):
+    """
+    Render several plots, in parallel on the plot process pool
+
+    Args:
+        df (pd.DataFrame): Plot data
+        file_prefix (str): Prefix for the plot file names
+        methods (list): Plot methods to render (defaults to all in PLOT_FILES)
+        parallel (bool): Render in worker processes instead of the calling thread
+
+    Returns:
+        dict: Render time in ms per plot method
+    """
+    methods = list(methods or PLOT_FILES)
+    if parallel and len(methods) > 1:
+        pool = get_process_pool()
+        futures = [pool.submit(render_plot, method, df, file_prefix) for method in methods]
+        results = [future.result() for future in futures]
+    else:
+        results = [render_plot(method, df, file_prefix) for method in methods]
+
+    render_times = dict(results)
+    logger.info("Plot render times: " + ", ".join(f"{m}={ms:.0f}ms" for m, ms in render_times.items()))
+    return render_times
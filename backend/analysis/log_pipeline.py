@@ -0,0 +1,247 @@
+#DrugPredict - Non-blocking logging
+#Log calls only put the record on a bounded queue; a background listener thread
+#formats it and writes it to the log file and the console, so a slow disk or terminal
+#never stalls an analysis or request thread. Repeated info messages from one call site
+#are rate limited (warnings and errors never are), and conditions that occur per row or
+#per chunk are counted per stage (count) and logged as one summary line when the stage
+#ends (stage_counters).
+#The listener only exists in the process that called setup_logging: process pool
+#workers log synchronously (see process_pool), and a forked child replaces the queue
+#handler it inherited with synchronous handlers.
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Write log records on a background thread (0 writes them in the logging thread)
+ASYNC_LOGGING = os.getenv('DRUGPREDICT_ASYNC_LOGGING', '1') != '0'
+
+# Records waiting for the writer; further records are dropped (and counted) while it is full
+LOG_QUEUE_SIZE = int(os.getenv('DRUGPREDICT_LOG_QUEUE_SIZE', 10000))
+
+# Info and debug messages per call site and window before further ones from it are suppressed
+LOG_RATE_LIMIT = int(os.getenv('DRUGPREDICT_LOG_RATE_LIMIT', 20))
+LOG_RATE_WINDOW = 10.0
+
+_listener = None
+_config = None
+_stage = contextvars.ContextVar('log_stage', default=None)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Pass at most `limit` records below WARNING per call site (file and line) in each
+    `window` seconds
+
+    Warnings and errors always pass. The first record after a suppressed stretch
+    reports how many were suppressed.
+    Messages are f-strings, so the call site rather than the text identifies a
+    repeated message.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, passed, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - started >= self.window:
+                started, passed = now, 0
+            if passed >= self.limit:
+                self._sites[site] = (started, passed, suppressed + 1)
+                return False
+            self._sites[site] = (started, passed + 1, 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a bounded queue that drops records instead of blocking when it is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.dropped_total = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        try:
+            if dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"Dropped {dropped} log records (log queue full)"}))
+                dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += dropped + 1
+                self.dropped_total += 1
+
+
+def setup_logging(log_file, level=logging.INFO, async_logging=ASYNC_LOGGING, queue_size=LOG_QUEUE_SIZE,
+                  rate_limit=LOG_RATE_LIMIT, stream=None):
+    """
+    Configure the root logger to write to log_file and the console
+
+    With async_logging the root logger only gets a queue handler and a listener thread
+    owns the file and console handlers; it is stopped (and the queue flushed) at exit.
+
+    Args:
+        log_file (str): Path of the log file
+        level (int): Root log level
+        async_logging (bool): Write records on a background thread
+        queue_size (int): Maximum records waiting for the writer
+        rate_limit (int): Messages below WARNING per call site and LOG_RATE_WINDOW (0 disables the limit)
+        stream: Console stream (defaults to sys.stderr)
+
+    Returns:
+        logging.handlers.QueueListener: The running listener, or None for synchronous logging
+    """
+    global _listener, _config
+    stop_logging()
+    _config = {"log_file": log_file, "level": level, "rate_limit": rate_limit}
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    writers = [logging.FileHandler(log_file), logging.StreamHandler(stream)]
+    for handler in writers:
+        handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level)
+
+    if async_logging:
+        handlers = [DroppingQueueHandler(queue.Queue(maxsize=queue_size))]
+        _listener = logging.handlers.QueueListener(handlers[0].queue, *writers, respect_handler_level=True)
+        _listener.start()
+    else:
+        handlers = writers
+    for handler in handlers:
+        if rate_limit > 0:
+            handler.addFilter(RateLimitFilter(rate_limit))
+        root.addHandler(handler)
+    return _listener
+
+
+def logging_config():
+    """Arguments of the last setup_logging call (None if logging was not set up)"""
+    # The API imports this module as backend.analysis.log_pipeline, the analysis
+    # modules import it by plain name
+    for name in ('log_pipeline', 'backend.analysis.log_pipeline'):
+        module = sys.modules.get(name)
+        if module is not None and module._config:
+            return dict(module._config)
+    return None
+
+
+def _after_fork_in_child():
+    # The listener thread was not copied into the child and the inherited queue (and
+    # its mutex) may be in any state: write synchronously instead
+    global _listener
+    if _listener is None:
+        return
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    setup_logging(**_config, async_logging=False)
+
+
+def stop_logging():
+    """Write the queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class StageCounters:
+    """Event counts of one pipeline stage (thread-safe)"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, event, n=1):
+        with self._lock:
+            self.counts[event] += n
+
+    def summary(self):
+        with self._lock:
+            return ", ".join(f"{event}={n}" for event, n in sorted(self.counts.items()))
+
+
+@contextmanager
+def stage_counters(stage):
+    """
+    Collect the count() calls of the current thread during a stage
+
+    Logs one line with all counts when the stage ends, instead of one message per
+    row or chunk.
+
+    Yields:
+        StageCounters: Counts of the stage
+    """
+    counters = StageCounters(stage)
+    token = _stage.set(counters)
+    try:
+        yield counters
+    finally:
+        _stage.reset(token)
+        if counters.counts:
+            logger.info(f"Stage '{stage}' counts: {counters.summary()}")
+
+
+def count(event, n=1, message=None, log=logger, level=logging.WARNING):
+    """
+    Count an event in the current stage
+
+    Outside of a stage (e.g. when a pipeline function is called directly) the message
+    is logged instead.
+
+    Args:
+        event (str): Counter name
+        n (int): Occurrences
+        message (str): Logged when no stage is collecting counts
+        log (logging.Logger): Logger for the message
+        level (int): Level of the message
+    """
+    if not n:
+        return
+    counters = _stage.get()
+    if counters is not None:
+        counters.add(event, n)
+    elif message:
+        # Attributed to the caller, so the rate limit of info messages tells the call sites apart
+        log.log(level, message, stacklevel=2)
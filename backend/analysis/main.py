@@ -5,28 +5,97 @@
 import logging
 import pandas as pd
 import numpy as np
-from chembl_webresource_client.new_client import new_client
-from rdkit import Chem
-from rdkit.Chem import Descriptors, Lipinski
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
-from lipinski_plots import lipinski_plots as lp
+from data_sources import get_data_source
+from rdkit import Chem
+from rdkit.Chem import Descriptors, Lipinski
+from lipinski_plots import lipinski_plots as lp, render_plots, PLOT_FILES, REGRESSION_PLOT_FILE
+import plot_cache
+import artifacts
+import checkpoints
+from stage_graph import Stage, run_graph
+import target_store
+import columnar
+from similarity import get_similarity_index
+from standardize import standardize_structures, parent_lookup, parent_aggregates, merge_parent_aggregates, finalize_parents
+import tuning
+import chunked
+import cancellation
+from cancellation import TaskCancelled, NEVER
+import forest_model
+import chemical_space
+import activity_cliffs
+from log_pipeline import count
 from numpy.random import seed
 from scipy.stats import mannwhitneyu
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.feature_selection import VarianceThreshold
-import seaborn as sns
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend for web
-import matplotlib.pyplot as plt
 import os
-import subprocess
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Activity record fields used by the pipeline; everything else is never fetched
+ACTIVITY_FIELDS = ['activity_id', 'molecule_chembl_id', 'canonical_smiles', 'standard_value']
+
+# Plot method, title, description and chart type of the analysis plots
+PLOT_DESCRIPTIONS = [
+    ('bar_graph', "Bioactivity Class Distribution", "Count of compounds by bioactivity classification", "bar"),
+    ('scatter_plot', "Molecular Weight vs LogP", "Relationship between molecular weight and lipophilicity", "scatter"),
+    ('pIC_50_plot', "pIC50 Distribution", "Box plot of pIC50 values by bioactivity class", "box"),
+    ('mol_weight', "Molecular Weight Distribution", "Box plot of molecular weights by bioactivity class", "box"),
+    ('logP', "LogP Distribution", "Box plot of LogP values by bioactivity class", "box"),
+    ('num_hdonors', "Hydrogen Donors Distribution", "Box plot of H-bond donors by bioactivity class", "box"),
+    ('num_hacceptors', "Hydrogen Acceptors Distribution", "Box plot of H-bond acceptors by bioactivity class", "box")
+]
+
+# Random Forest model configuration (part of the ML checkpoint key)
+ML_PARAMS = {
+    "n_estimators": 100,
+    "test_size": 0.2,
+    "random_state": 42,
+    "variance_threshold": 0.8 * (1 - 0.8),
+    "tune": False,
+    "tune_budget_seconds": float(os.getenv('DRUGPREDICT_TUNE_BUDGET_SECONDS', 120))
+}
+
+# ChemBL data is re-fetched once a stored fetch checkpoint is older than this
+FETCH_CHECKPOINT_MAX_AGE_HOURS = float(os.getenv('DRUGPREDICT_FETCH_CHECKPOINT_HOURS', 24))
+
+# Seconds a resolved target name is reused before ChemBL is asked again
+TARGET_RESOLVE_CACHE_SECONDS = 3600
+
+# Maximum number of pipeline stages running at the same time
+PIPELINE_WORKERS = int(os.getenv('DRUGPREDICT_PIPELINE_WORKERS', 4))
+
+# Stream very large targets through the preprocessing stages in chunks (see chunked.py)
+OUT_OF_CORE = os.getenv('DRUGPREDICT_OUT_OF_CORE', '0') != '0'
+
+# Trees added per training step of the Random Forest (cancellation is checked in between)
+FOREST_BATCH_TREES = 25
+
+# Molecules between cancellation checks in per-molecule loops
+CANCEL_CHECK_ROWS = 1000
+
+# Render plots on first request instead of during the analysis
+LAZY_PLOTS = os.getenv('DRUGPREDICT_LAZY_PLOTS', '1') != '0'
+
+# Resolution of the plot thumbnails shown in the results view
+THUMBNAIL_DPI = 72
+
+# Bioactivity classes, stored as a categorical column
+BIOACTIVITY_CLASSES = ['active', 'intermediate', 'inactive']
+
 # Reduce ChemBL client logging verbosity
 logging.getLogger('chembl_webresource_client').setLevel(logging.WARNING)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -46,6 +115,142 @@ def get_data_directory(subdir=None):
         return os.path.join(base_dir, subdir)
     return base_dir
 
+_resolved_targets = {}
+_resolved_lock = threading.Lock()
+
+def resolve_target(target_name):
+    """
+    Resolve a target name or ChemBL ID to its ChemBL ID
+    
+    Resolutions are reused for TARGET_RESOLVE_CACHE_SECONDS.
+    
+    Args:
+        target_name (str): Target name or ChemBL ID (if starts with CHEMBL, treated as ID)
+        
+    Returns:
+        tuple: (str, str) - (display_target_name, chembl_id)
+    """
+    with _resolved_lock:
+        cached = _resolved_targets.get(target_name)
+    if cached and time.time() - cached[0] < TARGET_RESOLVE_CACHE_SECONDS:
+        return cached[1]
+    
+    resolved = _resolve_target_uncached(target_name)
+    with _resolved_lock:
+        _resolved_targets[target_name] = (time.time(), resolved)
+    return resolved
+
+def _resolve_target_uncached(target_name):
+    logger.info(f"Searching for target: {target_name}")
+    
+    source = get_data_source()
+    original_target_name = target_name  # Store the original name for display
+    
+    # Check if target_name is a ChemBL ID (starts with CHEMBL)
+    if target_name.upper().startswith('CHEMBL'):
+        # Use the ID directly
+        selected_target = target_name.upper()
+        logger.info(f"Using provided ChemBL ID: {selected_target}")
+        # For ChemBL IDs, try to get the human-readable name
+        try:
+            pref_name = source.target_name(selected_target)
+            if pref_name:
+                original_target_name = pref_name
+        except:
+            # If we can't get the name, keep the ChemBL ID
+            pass
+    else:
+        logger.info(f"Searching for target by name: {target_name}")
+        # Search by name and select first result
+        targets = source.search_targets(target_name, limit=1)
+        
+        if not targets:
+            raise ValueError(f"No targets found for: {target_name}")
+            
+        selected_target = targets[0]['target_chembl_id']
+        logger.info(f"Found target by name search: {selected_target}")
+        # Keep the original human-readable name
+    
+    return original_target_name, selected_target
+
+def activity_query(target_id, limit='1000', min_activity_id=None):
+    """
+    Lazy query of the IC50 activity records of a target (records are fetched while iterating)
+    
+    The records come from the data source selected by DRUGPREDICT_DATA_SOURCE
+    (the ChemBL web service by default, see data_sources).
+    
+    Args:
+        target_id (str): ChemBL target ID
+        limit (str): Number of compounds to retrieve ('all' for all available)
+        min_activity_id (int): Only fetch activities with a higher activity_id (incremental sync)
+    """
+    if min_activity_id is not None:
+        logger.info(f"Fetching activities newer than activity_id {min_activity_id}")
+    
+    # Apply limit if specified
+    if limit == 'all':
+        logger.info("Retrieving all available compounds (no limit)")
+        limit_int = None
+    else:
+        limit_int = int(limit)
+        logger.info(f"Limiting to {limit_int} compounds")
+    
+    return get_data_source().activities(target_id, ACTIVITY_FIELDS, standard_type='IC50', limit=limit_int,
+                                        min_activity_id=min_activity_id)
+
+def fetch_activities(target_id, limit='1000', min_activity_id=None):
+    """
+    Fetch IC50 activity records for a resolved target
+    
+    Args:
+        target_id (str): ChemBL target ID
+        limit (str): Number of compounds to retrieve ('all' for all available)
+        min_activity_id (int): Only fetch activities with a higher activity_id (incremental sync)
+        
+    Returns:
+        pd.DataFrame: Activity records with compact column types
+    """
+    return compact_activities(pd.DataFrame.from_dict(activity_query(target_id, limit, min_activity_id)))
+
+def iter_activity_batches(target_id, limit='1000', batch_rows=chunked.CHUNK_ROWS):
+    """
+    Stream the IC50 activity records of a target in compact batches of batch_rows records
+    
+    Yields:
+        pd.DataFrame: Activity records with compact column types
+    """
+    batch = []
+    for record in activity_query(target_id, limit):
+        batch.append(record)
+        if len(batch) >= batch_rows:
+            yield compact_activities(pd.DataFrame.from_dict(batch))
+            batch = []
+    if batch:
+        yield compact_activities(pd.DataFrame.from_dict(batch))
+
+def compact_activities(df):
+    """
+    Convert activity records to compact column types
+    
+    standard_value becomes float32 (unparseable values become NaN), activity_id int64
+    and the ID/SMILES columns Arrow-backed strings, which keep all values in one
+    contiguous buffer instead of one Python object per row.
+    
+    Args:
+        df (pd.DataFrame): Activity records
+        
+    Returns:
+        pd.DataFrame: Records restricted to ACTIVITY_FIELDS
+    """
+    df = df.reindex(columns=ACTIVITY_FIELDS)
+    return pd.DataFrame({
+        'activity_id': pd.to_numeric(df['activity_id'], errors='coerce').fillna(-1).astype('int64'),
+        'molecule_chembl_id': df['molecule_chembl_id'].astype('string[pyarrow]'),
+        'canonical_smiles': df['canonical_smiles'].astype('string[pyarrow]'),
+        'standard_value': pd.to_numeric(df['standard_value'], errors='coerce').astype('float32')
+    })
+
 def retrievedata_for_target(target_name, limit='1000'):
     """
     Retrieve data for a specific target from ChemBL database
@@ -58,93 +263,104 @@ def retrievedata_for_target(target_name, limit='1000'):
         tuple: (pd.DataFrame, str, str) - (data, original_target_name, chembl_id)
     """
     try:
-        logger.info(f"Searching for target: {target_name}")
+        original_target_name, selected_target = resolve_target(target_name)
         
-        target = new_client.target
-        original_target_name = target_name  # Store the original name for display
+        df = fetch_activities(selected_target, limit)
         
-        # Check if target_name is a ChemBL ID (starts with CHEMBL)
-        if target_name.upper().startswith('CHEMBL'):
-            # Use the ID directly
-            selected_target = target_name.upper()
-            logger.info(f"Using provided ChemBL ID: {selected_target}")
-            # For ChemBL IDs, try to get the human-readable name
-            try:
-                target_details = target.get(selected_target)
-                if target_details and 'pref_name' in target_details:
-                    original_target_name = target_details['pref_name']
-            except:
-                # If we can't get the name, keep the ChemBL ID
-                pass
-        else:
-            logger.info(f"Searching for target by name: {target_name}")
-            # Search by name and select first result
-            target_query = target.search(target_name)
-            targets = pd.DataFrame.from_dict(target_query)
+        if df.empty or len(df) < 10:
+            raise ValueError(f"Insufficient IC50 data for target: {target_name} (found {len(df)} compounds, minimum 10 required)")
             
-            if targets.empty:
-                raise ValueError(f"No targets found for: {target_name}")
-                
-            selected_target = targets.target_chembl_id[0]
-            logger.info(f"Found target by name search: {selected_target}")
-            # Keep the original human-readable name
+        logger.info(f"Retrieved {len(df)} compounds for {original_target_name}")
+        return df, original_target_name, selected_target
         
-        activity = new_client.activity
-        activity_query = activity.filter(target_chembl_id=selected_target).filter(standard_type="IC50")
+    except Exception as e:
+        logger.error(f"Failed to retrieve data for {target_name}: {str(e)}")
+        raise
+
+def refresh_data_for_target(target_name):
+    """
+    Incrementally sync the stored activities of a target with ChemBL
+    
+    Only activities with an activity_id above the stored watermark are fetched, so the
+    cost of a refresh is proportional to the number of new records.
+    
+    Args:
+        target_name (str): Target name or ChemBL ID
         
-        # Apply limit if specified
-        if limit == 'all':
-            logger.info("Retrieving all available compounds (no limit)")
-            res = activity_query
-        else:
-            limit_int = int(limit)
-            logger.info(f"Limiting to {limit_int} compounds")
-            res = activity_query[:limit_int]
+    Returns:
+        tuple: (pd.DataFrame, str, str, int) - (all stored activities, original_target_name, chembl_id, new record count)
+    """
+    try:
+        original_target_name, selected_target = resolve_target(target_name)
         
-        df = pd.DataFrame.from_dict(res)
+        watermark = target_store.load_watermark(selected_target)
+        min_activity_id = watermark['maxActivityId'] if watermark else None
+        
+        df_new = fetch_activities(selected_target, 'all', min_activity_id=min_activity_id)
+        df, new_count = target_store.merge_activities(selected_target, df_new)
         
         if df.empty or len(df) < 10:
             raise ValueError(f"Insufficient IC50 data for target: {target_name} (found {len(df)} compounds, minimum 10 required)")
-            
-        logger.info(f"Retrieved {len(df)} compounds for {original_target_name}")
-        return df, original_target_name, selected_target
+        
+        logger.info(f"Synced {new_count} new activities for {original_target_name} ({len(df)} total)")
+        return df, original_target_name, selected_target, new_count
         
     except Exception as e:
-        logger.error(f"Failed to retrieve data for {target_name}: {str(e)}")
+        logger.error(f"Failed to refresh data for {target_name}: {str(e)}")
         raise
 
-def preprocess_data(df):
+def filter_activities(df):
     """
-    Preprocess the raw ChemBL data
+    Drop activity records without a usable IC50 value or SMILES and unused columns
     
     Args:
         df (pd.DataFrame): Raw ChemBL data
         
     Returns:
-        pd.DataFrame: Preprocessed data
+        pd.DataFrame: molecule_chembl_id, canonical_smiles and standard_value of the usable records
     """
-    logger.info("Starting data preprocessing...")
-    
-    initial_count = len(df)
-    
     # Remove NAs in standard_value
     df = df[df.standard_value.notna()]
     logger.info(f"After removing NA values: {len(df)} compounds")
     
     # Remove zero IC50 values
-    df = df.loc[df.standard_value != '0.0']
+    df = df.loc[df.standard_value != 0]
     logger.info(f"After removing zero IC50: {len(df)} compounds")
     
     # Keep only compounds with canonical SMILES
     df = df[df.canonical_smiles.notna()]
     logger.info(f"After requiring SMILES: {len(df)} compounds")
     
-    # Remove duplicates based on canonical SMILES
-    df = df.drop_duplicates(['canonical_smiles'])
-    logger.info(f"After removing duplicates: {len(df)} compounds")
-    
     # Select only needed columns
-    df = df[['molecule_chembl_id', 'canonical_smiles', 'standard_value']]
+    return df[['molecule_chembl_id', 'canonical_smiles', 'standard_value']]
+
+def preprocess_data(df, standardize=True):
+    """
+    Preprocess the raw ChemBL data
+    
+    With standardize=True, records are deduplicated on their standardized parent
+    structure (salts stripped, charges neutralized) and replicate measurements are
+    combined, so descriptors are calculated once per unique structure.
+    
+    Args:
+        df (pd.DataFrame): Raw ChemBL data
+        standardize (bool): Deduplicate on parent structure instead of the raw SMILES string
+        
+    Returns:
+        pd.DataFrame: Preprocessed data
+    """
+    logger.info("Starting data preprocessing...")
+    
+    initial_count = len(df)
+    
+    df = filter_activities(df)
+    
+    # Remove duplicates based on the parent structure (or the canonical SMILES string)
+    if standardize:
+        df = standardize_structures(df)
+    else:
+        df = df.drop_duplicates(['canonical_smiles'])
+    logger.info(f"After removing duplicates: {len(df)} compounds")
     
     if df.empty:
         raise ValueError("No compounds remaining after preprocessing")
@@ -152,6 +368,48 @@ def preprocess_data(df):
     logger.info(f"Preprocessing complete: {initial_count} → {len(df)} compounds")
     return df
 
+def preprocess_data_incremental(df, target_id):
+    """
+    Preprocess the stored activities of a target, standardizing only new records
+    
+    The per-parent aggregates of the stored activities and the parent structure of
+    every input SMILES are kept in the target store. Only the activities stored since
+    the aggregates were saved are filtered and aggregated, and only input SMILES that
+    were never standardized for the target go through RDKit; the result equals
+    preprocess_data(df).
+    
+    Args:
+        df (pd.DataFrame): All stored activities of the target (target_store.load_activities order)
+        target_id (str): ChemBL target ID owning the store
+        
+    Returns:
+        pd.DataFrame: Preprocessed data
+    """
+    aggregates, covered = target_store.load_parent_aggregates(target_id)
+    if covered > len(df):
+        # The activities were stored anew: start over
+        aggregates, covered = None, 0
+    logger.info(f"Preprocessing {len(df) - covered} new of {len(df)} stored activities")
+    
+    df_new = filter_activities(df.iloc[covered:])
+    if len(df_new) > 0:
+        cache = target_store.load_parent_cache(target_id)
+        input_smiles = pd.Series(df_new['canonical_smiles'].unique())
+        new_parents = parent_lookup(input_smiles[~input_smiles.isin(cache.index)])
+        logger.info(f"Parent structure cache hit for {len(input_smiles) - len(new_parents)} structures, "
+                    f"standardizing {len(new_parents)} new structures")
+        target_store.append_parent_cache(target_id, new_parents)
+        partial = parent_aggregates(df_new, covered, pd.concat([cache, new_parents]))
+        aggregates = partial if aggregates is None else merge_parent_aggregates(pd.concat([aggregates, partial]))
+    if covered < len(df) and aggregates is not None:
+        target_store.save_parent_aggregates(target_id, aggregates, len(df))
+    
+    if aggregates is None or aggregates.empty:
+        raise ValueError("No compounds remaining after preprocessing")
+    df = finalize_parents(aggregates)
+    logger.info(f"Preprocessing complete: {len(df)} unique structures")
+    return df
+
 def labelcompounds_data(df):
     """
     Label compounds based on IC50 values and clean SMILES
@@ -162,23 +420,20 @@ def labelcompounds_data(df):
     Returns:
         pd.DataFrame: Labeled data with cleaned SMILES
     """
-    logger.info("Labeling compounds by bioactivity...")
+    logger.debug("Labeling compounds by bioactivity...")
+    
+    df = df.reset_index(drop=True)
     
     # Classify compounds based on IC50 thresholds
-    bioactivity_threshold = []
-    for ic50_value in df.standard_value:
-        ic50_float = float(ic50_value)
-        if ic50_float >= 10000:
-            bioactivity_threshold.append("inactive")
-        elif ic50_float <= 1000:
-            bioactivity_threshold.append("active")
-        else:
-            bioactivity_threshold.append("intermediate")
+    ic50 = df.standard_value.to_numpy(dtype='float32')
+    bioactivity_threshold = np.select(
+        [ic50 >= 10000, ic50 <= 1000],
+        ["inactive", "active"],
+        default="intermediate"
+    )
     
     # Add bioactivity class
-    bioactivity_class = pd.Series(bioactivity_threshold, name='class')
-    df = df.reset_index(drop=True)
-    df = pd.concat([df, bioactivity_class], axis=1)
+    df['class'] = pd.Categorical(bioactivity_threshold, categories=BIOACTIVITY_CLASSES)
     
     # Clean SMILES - take longest fragment
     cleaned_smiles = []
@@ -188,7 +443,7 @@ def labelcompounds_data(df):
         longest_fragment = max(fragments, key=len)
         cleaned_smiles.append(longest_fragment)
     
-    df['canonical_smiles'] = cleaned_smiles
+    df['canonical_smiles'] = pd.array(cleaned_smiles, dtype='string[pyarrow]')
     
     # Count by class
     class_counts = df['class'].value_counts()
@@ -196,22 +451,34 @@ def labelcompounds_data(df):
     
     return df
 
-def add_lipinski_descriptors(df):
+def compact_descriptors(df):
+    """Store Lipinski descriptors as float32 and the H-bond counts as int16"""
+    return df.astype({
+        "MW": "float32",
+        "LogP": "float32",
+        "NumHDonors": "int16",
+        "NumHAcceptors": "int16"
+    })
+
+def add_lipinski_descriptors(df, cancel=NEVER):
     """
     Calculate and add Lipinski descriptors
     
     Args:
         df (pd.DataFrame): Data with cleaned SMILES
+        cancel (CancelToken): Checked every CANCEL_CHECK_ROWS molecules
         
     Returns:
         pd.DataFrame: Data with Lipinski descriptors
     """
-    logger.info("Calculating Lipinski descriptors...")
+    logger.debug("Calculating Lipinski descriptors...")
     
     descriptors_data = []
     failed_smiles = 0
     
-    for smiles in df.canonical_smiles:
+    for i, smiles in enumerate(df.canonical_smiles):
+        if i % CANCEL_CHECK_ROWS == 0:
+            cancel.check()
         try:
             mol = Chem.MolFromSmiles(smiles)
             if mol is not None:
@@ -229,8 +496,7 @@ def add_lipinski_descriptors(df):
             descriptors_data.append([np.nan, np.nan, np.nan, np.nan])
             failed_smiles += 1
     
-    if failed_smiles > 0:
-        logger.warning(f"Failed to calculate descriptors for {failed_smiles} compounds")
+    count('failed_descriptors', failed_smiles, f"Failed to calculate descriptors for {failed_smiles} compounds", logger)
     
     # Create descriptors DataFrame
     descriptors_df = pd.DataFrame(
@@ -242,11 +508,52 @@ def add_lipinski_descriptors(df):
     result_df = pd.concat([df.reset_index(drop=True), descriptors_df], axis=1)
     
     # Remove rows with NaN descriptors
-    result_df = result_df.dropna()
+    result_df = compact_descriptors(result_df.dropna())
     
     logger.info(f"Lipinski descriptors calculated for {len(result_df)} compounds")
     return result_df
 
+def add_lipinski_descriptors_cached(df, target_id, cancel=NEVER):
+    """
+    Add Lipinski descriptors using the descriptor cache of a target
+
+    Descriptors are only calculated for structures that are not cached yet; the new
+    results are appended to the cache.
+
+    Args:
+        df (pd.DataFrame): Data with cleaned SMILES
+        target_id (str): ChemBL target ID owning the cache
+        cancel (CancelToken): Cancellation of the task
+
+    Returns:
+        pd.DataFrame: Data with Lipinski descriptors
+    """
+    descriptor_columns = ["MW", "LogP", "NumHDonors", "NumHAcceptors"]
+    cache = target_store.load_descriptor_cache(target_id)
+
+    new_smiles = pd.Series(df.canonical_smiles.unique())
+    new_smiles = new_smiles[~new_smiles.isin(cache.index)]
+    logger.info(f"Descriptor cache hit for {len(df) - len(new_smiles)} compounds, calculating {len(new_smiles)} new structures")
+
+    if len(new_smiles) > 0:
+        # Calculate without dropping failures so they are cached as well
+        new_descriptors = add_lipinski_descriptors(pd.DataFrame({'canonical_smiles': new_smiles}), cancel)
+        failed = new_smiles[~new_smiles.isin(new_descriptors.canonical_smiles)]
+        new_descriptors = pd.concat([
+            new_descriptors[['canonical_smiles'] + descriptor_columns],
+            pd.DataFrame({'canonical_smiles': failed})
+        ], ignore_index=True).set_index('canonical_smiles')
+        target_store.append_descriptor_cache(target_id, new_descriptors)
+        cache = pd.concat([cache, new_descriptors])
+
+    result_df = df.reset_index(drop=True).join(cache[descriptor_columns], on='canonical_smiles')
+
+    # Remove rows with NaN descriptors
+    result_df = compact_descriptors(result_df.dropna())
+
+    logger.info(f"Lipinski descriptors available for {len(result_df)} compounds")
+    return result_df
+
 def process_ic50_values(df):
     """
     Normalize IC50 values and convert to pIC50
@@ -257,62 +564,44 @@ def process_ic50_values(df):
     Returns:
         pd.DataFrame: Data with normalized IC50 and pIC50
     """
-    logger.info("Processing IC50 values...")
+    logger.debug("Processing IC50 values...")
     
-    # Normalize IC50 values
-    normalized_values = []
-    for value in df['standard_value']:
-        try:
-            val_float = float(value)
-            if val_float <= 0:
-                logger.warning(f"Invalid IC50 value: {value} (setting to NaN)")
-                normalized_values.append(np.nan)
-            elif val_float > 100000000:
-                normalized_values.append(100000000)
-            else:
-                normalized_values.append(val_float)
-        except (ValueError, TypeError):
-            logger.warning(f"Could not convert IC50 value to float: {value}")
-            normalized_values.append(np.nan)
+    # Normalize IC50 values (standard_value is already numeric, see compact_activities)
+    values = df['standard_value'].to_numpy(dtype='float64')
+    invalid = ~(values > 0)
+    count('invalid_ic50', int(invalid.sum()), f"Invalid IC50 values for {int(invalid.sum())} compounds (setting to NaN)",
+          logger)
+    normalized_values = np.where(invalid, np.nan, np.minimum(values, 100000000))
     
+    df = df.copy()
     df['standard_value_norm'] = normalized_values
     
-    # Convert to pIC50
-    pic50_values = []
-    for norm_value in df['standard_value_norm']:
-        try:
-            if pd.isna(norm_value) or norm_value <= 0:
-                pic50_values.append(np.nan)
-            else:
-                molar = norm_value * (10 ** -9)  # Convert nM to M
-                pic50 = -np.log10(molar)
-                pic50_values.append(pic50)
-        except Exception as e:
-            logger.warning(f"Error calculating pIC50 for value {norm_value}: {str(e)}")
-            pic50_values.append(np.nan)
-    
-    df['pIC50'] = pic50_values
+    # Convert to pIC50 (nM to M: pIC50 = -log10(IC50 * 1e-9))
+    df['pIC50'] = (-np.log10(normalized_values * (10 ** -9))).astype('float32')
     
     # Remove rows with NaN pIC50 values
     initial_count = len(df)
     df = df.dropna(subset=['pIC50'])
     final_count = len(df)
     
-    if initial_count != final_count:
-        logger.info(f"Removed {initial_count - final_count} compounds with invalid pIC50 values")
+    count('dropped_pic50', initial_count - final_count,
+          f"Removed {initial_count - final_count} compounds with invalid pIC50 values", logger, logging.INFO)
     
     # Remove the intermediate normalized column
     df = df.drop('standard_value_norm', axis=1)
     
-    logger.info("IC50 processing complete")
+    logger.debug("IC50 processing complete")
     return df
 
-def perform_statistical_analysis(df):
+def perform_statistical_analysis(df, output_dir=None, aggregate=None):
     """
     Perform Mann-Whitney U tests for each descriptor
     
     Args:
         df (pd.DataFrame): Final processed data
+        output_dir (str): Directory for the test result files (defaults to data/processed)
+        aggregate (chunked.StatisticsAggregate): Class and value counts of an out-of-core
+            run; the tests and counts are computed from it instead of from df
         
     Returns:
         dict: Statistical test results
@@ -320,9 +609,16 @@ def perform_statistical_analysis(df):
     logger.info("Performing statistical analysis...")
     
     # Filter to active and inactive only
-    testing_df = df[df['class'] != 'intermediate']
+    if aggregate is not None:
+        class_counts = aggregate.class_counts
+        testing_df = None
+        testing_count = int(class_counts.get('active', 0) + class_counts.get('inactive', 0))
+    else:
+        class_counts = df['class'].value_counts()
+        testing_df = df[df['class'] != 'intermediate']
+        testing_count = len(testing_df)
     
-    if len(testing_df) == 0:
+    if testing_count == 0:
         logger.warning("No active/inactive compounds for statistical testing")
         return {"mannWhitneyTests": [], "summary": {}}
     
@@ -331,7 +627,7 @@ def perform_statistical_analysis(df):
     
     for descriptor in descriptors:
         try:
-            result = mannwhitney_test(testing_df, descriptor)
+            result = mannwhitney_test(testing_df, descriptor, output_dir, aggregate)
             test_results.append({
                 "descriptor": descriptor,
                 "statistic": float(result['Statistics'].iloc[0]),
@@ -343,7 +639,6 @@ def perform_statistical_analysis(df):
             logger.error(f"Failed Mann-Whitney test for {descriptor}: {str(e)}")
     
     # Summary statistics
-    class_counts = df['class'].value_counts()
     summary = {
         "activeCount": int(class_counts.get('active', 0)),
         "inactiveCount": int(class_counts.get('inactive', 0)),
@@ -355,21 +650,26 @@ def perform_statistical_analysis(df):
         "summary": summary
     }
 
-def mannwhitney_test(df_2class, descriptor):
+def mannwhitney_test(df_2class, descriptor, output_dir=None, aggregate=None):
     """
     Perform Mann-Whitney U test for a specific descriptor
+    
+    With an aggregate (out-of-core runs) the test is computed from its value counts.
     """
     seed(1)
     
-    # Get active and inactive groups
-    active = df_2class[df_2class['class'] == 'active'][descriptor]
-    inactive = df_2class[df_2class['class'] == 'inactive'][descriptor]
-    
-    if len(active) == 0 or len(inactive) == 0:
-        raise ValueError(f"Insufficient data for {descriptor} comparison")
-    
-    # Perform test
-    stat, p = mannwhitneyu(active, inactive)
+    if aggregate is not None:
+        stat, p = aggregate.mannwhitney(descriptor)
+    else:
+        # Get active and inactive groups
+        active = df_2class[df_2class['class'] == 'active'][descriptor]
+        inactive = df_2class[df_2class['class'] == 'inactive'][descriptor]
+        
+        if len(active) == 0 or len(inactive) == 0:
+            raise ValueError(f"Insufficient data for {descriptor} comparison")
+        
+        # Perform test
+        stat, p = mannwhitneyu(active, inactive)
     
     # Interpret results
     alpha = 0.05
@@ -384,100 +684,65 @@ def mannwhitney_test(df_2class, descriptor):
     })
     
     # Save individual result
-    processed_dir = get_data_directory('processed')
+    processed_dir = output_dir or get_data_directory('processed')
     os.makedirs(processed_dir, exist_ok=True)
     filename = os.path.join(processed_dir, f'mannwhitneyu_{descriptor}.csv')
     results.to_csv(filename, index=False)
     
     return results
 
-def generate_plots(df):
+def generate_plots(df, file_prefix=""):
     """
     Generate all visualization plots
     
+    With lazy plots (the default) only the plot data is stored and the returned URLs
+    render each image on first request. Otherwise all plots of the task are rendered
+    in parallel on the plot process pool; the render time of each plot is reported
+    in its renderMs field.
+    
     Args:
         df (pd.DataFrame): Final processed data
+        file_prefix (str): Prefix for the plot file names (keeps concurrent tasks apart)
         
     Returns:
         list: List of generated plot information
     """
     logger.info("Generating visualization plots...")
     
-    # Close any existing matplotlib figures
-    plt.close('all')
-    
     # Filter for plotting (exclude intermediate for some plots)
-    plot_df = df[df['class'] != 'intermediate']
+    plot_df = df[df['class'] != 'intermediate'].copy()
+    plot_df['class'] = plot_df['class'].cat.remove_unused_categories()
     
     try:
-        # Initialize plotting class
-        plotter = lp(plot_df)
-        
-        # Generate plots
         plot_info = []
-        
-        # Bioactivity class distribution
-        plotter.bar_graph(plot_df)
-        plot_info.append({
-            "name": "Bioactivity Class Distribution",
-            "description": "Count of compounds by bioactivity classification",
-            "imagePath": "/outputs/plot_bioactivity_class.png",
-            "type": "bar"
-        })
-        
-        # Scatter plot MW vs LogP
-        plotter.scatter_plot(plot_df)
-        plot_info.append({
-            "name": "Molecular Weight vs LogP",
-            "description": "Relationship between molecular weight and lipophilicity",
-            "imagePath": "/outputs/plot_MW_vs_LogP.png",
-            "type": "scatter"
-        })
-        
-        # pIC50 distribution
-        plotter.pIC_50_plot(plot_df)
-        plot_info.append({
-            "name": "pIC50 Distribution",
-            "description": "Box plot of pIC50 values by bioactivity class",
-            "imagePath": "/outputs/plot_ic50.png",
-            "type": "box"
-        })
-        
-        # Molecular weight distribution
-        plotter.mol_weight(plot_df)
-        plot_info.append({
-            "name": "Molecular Weight Distribution",
-            "description": "Box plot of molecular weights by bioactivity class",
-            "imagePath": "/outputs/plot_MW.png",
-            "type": "box"
-        })
-        
-        # LogP distribution
-        plotter.logP(plot_df)
-        plot_info.append({
-            "name": "LogP Distribution",
-            "description": "Box plot of LogP values by bioactivity class",
-            "imagePath": "/outputs/plot_LogP.png",
-            "type": "box"
-        })
-        
-        # H-donors distribution
-        plotter.num_hdonors(plot_df)
-        plot_info.append({
-            "name": "Hydrogen Donors Distribution",
-            "description": "Box plot of H-bond donors by bioactivity class",
-            "imagePath": "/outputs/plot_NumHDonors.png",
-            "type": "box"
-        })
-        
-        # H-acceptors distribution
-        plotter.num_hacceptors(plot_df)
-        plot_info.append({
-            "name": "Hydrogen Acceptors Distribution",
-            "description": "Box plot of H-bond acceptors by bioactivity class",
-            "imagePath": "/outputs/plot_NumHAcceptors.png",
-            "type": "box"
-        })
+        # The plot data also backs the pre-aggregated /api/plots/<key> summary
+        data_key = plot_cache.save_plot_data(
+            plot_df[['class', 'MW', 'LogP', 'NumHDonors', 'NumHAcceptors', 'pIC50']]
+        )
+        if LAZY_PLOTS:
+            # Images are rendered when first requested
+            for method, name, description, plot_type in PLOT_DESCRIPTIONS:
+                plot_info.append({
+                    "name": name,
+                    "description": description,
+                    "imagePath": plot_cache.plot_url(data_key, PLOT_FILES[method]),
+                    "thumbnailPath": plot_cache.plot_url(data_key, PLOT_FILES[method], dpi=THUMBNAIL_DPI),
+                    "dataPath": f"/api/plots/{data_key}",
+                    "type": plot_type
+                })
+        else:
+            render_times = render_plots(plot_df, file_prefix)
+            output_dir = get_data_directory('outputs')
+            for method, name, description, plot_type in PLOT_DESCRIPTIONS:
+                plot_info.append({
+                    "name": name,
+                    "description": description,
+                    "imagePath": "/outputs/" + artifacts.publish(
+                        os.path.join(output_dir, f"{file_prefix}{PLOT_FILES[method]}")),
+                    "dataPath": f"/api/plots/{data_key}",
+                    "type": plot_type,
+                    "renderMs": round(render_times[method], 1)
+                })
         
         logger.info(f"Generated {len(plot_info)} plots")
         return plot_info
@@ -486,54 +751,150 @@ def generate_plots(df):
         logger.error(f"Plot generation failed: {str(e)}")
         return []
 
-def run_ml_analysis(df):
+def compute_padel_features(df, processed_dir=None, cancel=NEVER):
+    """
+    Calculate PaDEL fingerprint descriptors for the compounds
+    
+    Args:
+        df (pd.DataFrame): Data with canonical_smiles and molecule_chembl_id
+        processed_dir (str): Directory for intermediate files (defaults to data/processed)
+        cancel (CancelToken): Kills the PaDEL process when the task is cancelled
+        
+    Returns:
+        pa.Table: float32 feature matrix with the molecule ID in the Name column, or None if PaDEL failed
+    """
+    processed_dir = processed_dir or get_data_directory('processed')
+    os.makedirs(processed_dir, exist_ok=True)
+    
+    df_selection = df[['canonical_smiles', 'molecule_chembl_id']]
+    smi_file = os.path.join(processed_dir, 'molecule.smi')
+    df_selection.to_csv(smi_file, sep='\t', index=False, header=False)
+    
+    # Run PaDEL descriptor calculation
+    logger.info("Calculating PaDEL descriptors...")
+    descriptors_file = os.path.join(processed_dir, 'descriptors_output.csv')
+    result = cancellation.run_subprocess(['bash', 'scripts/padel.sh', processed_dir, descriptors_file],
+                                         cancel, timeout=300)
+    
+    if result.returncode != 0:
+        logger.warning("PaDEL calculation failed")
+        return None
+    
+    # Load PaDEL descriptors
+    if not os.path.exists(descriptors_file):
+        logger.warning("PaDEL output not found")
+        return None
+    
+    # Parse the PaDEL CSV once into a memory-mapped float32 feature matrix
+    features_file = os.path.join(processed_dir, 'descriptors_output.arrow')
+    return columnar.convert_descriptor_csv(descriptors_file, features_file, key_column='Name')
+
+def padel_feature_stage(df, processed_dir=None, resume=True, cancel=NEVER):
+    """PaDEL features of the compounds in df, resumed from a checkpoint when possible"""
+    compounds = df[['canonical_smiles', 'molecule_chembl_id']]
+    return checkpoints.run_stage(
+        'padel', {"compounds": checkpoints.frame_fingerprint(compounds)},
+        lambda: (compute_padel_features(compounds, processed_dir, cancel), None),
+        persist=lambda data, meta: data is not None, enabled=resume
+    ).data
+
+def fit_random_forest(X_train, Y_train, params, cancel=NEVER):
+    """
+    Train the Random Forest, optionally with hyperparameters found by successive halving
+    
+    The forest is grown FOREST_BATCH_TREES trees at a time (warm start, same trees as
+    a single fit), so a cancelled task stops between batches.
+    
+    Args:
+        X_train: Training features (selected once and shared by all tuning candidates)
+        Y_train: Training targets
+        params (dict): Model configuration; params['tune'] enables the search
+        cancel (CancelToken): Cancellation of the task
+        
+    Returns:
+        tuple: (fitted model, tuning report or None)
+    """
+    config = {"n_estimators": params['n_estimators']}
+    tuning_report = None
+    if params.get('tune'):
+        with tempfile.TemporaryDirectory(prefix='tuning_') as work_dir:
+            best, tuning_report = tuning.successive_halving(
+                X_train, Y_train, work_dir, params['tune_budget_seconds'], params['random_state'], cancel=cancel)
+        if best:
+            config = best
+    
+    n_estimators = config['n_estimators']
+    model = RandomForestRegressor(random_state=params['random_state'], warm_start=True, **config)
+    for trees in range(FOREST_BATCH_TREES, n_estimators + FOREST_BATCH_TREES, FOREST_BATCH_TREES):
+        cancel.check()
+        model.set_params(n_estimators=min(trees, n_estimators)).fit(X_train, Y_train)
+    model.set_params(warm_start=False)
+    return model, tuning_report
+
+def export_model(model, feature_names):
+    """
+    Store a trained model in the compact memory-mappable format for serving predictions
+    
+    Returns:
+        str: Model key, or None if the export failed
+    """
+    try:
+        return forest_model.save_forest(model, feature_names)
+    except Exception as e:
+        logger.warning(f"Could not export model: {str(e)}")
+        return None
+
+def run_ml_analysis(df, processed_dir=None, file_prefix="", params=None, features=None, cancel=NEVER):
     """
     Run machine learning analysis with Random Forest
     
+    The PaDEL feature matrix is checkpointed by the compounds it was calculated for,
+    so a different model configuration reuses it.
+    
     Args:
         df (pd.DataFrame): Final processed data
+        processed_dir (str): Directory for intermediate files (defaults to data/processed)
+        file_prefix (str): Prefix for the regression plot file name
+        params (dict): Model configuration (defaults to ML_PARAMS)
+        features (pa.Table): Precomputed PaDEL features (calculated here if None)
+        cancel (CancelToken): Cancellation of the task
         
     Returns:
         dict: ML results and metrics
     """
     logger.info("Starting machine learning analysis...")
+    params = {**ML_PARAMS, **(params or {})}
     
     try:
-        # Prepare data for PaDEL descriptors
-        processed_dir = get_data_directory('processed')
-        os.makedirs(processed_dir, exist_ok=True)
+        if features is None:
+            features = padel_feature_stage(df, processed_dir, cancel=cancel)
         
-        df_selection = df[['canonical_smiles', 'molecule_chembl_id']]
-        smi_file = os.path.join(processed_dir, 'molecule.smi')
-        df_selection.to_csv(smi_file, sep='\t', index=False, header=False)
+        if features is None:
+            logger.warning("No PaDEL descriptors, using simplified ML analysis")
+            return run_simplified_ml(df, file_prefix, params, cancel)
         
-        # Run PaDEL descriptor calculation
-        logger.info("Calculating PaDEL descriptors...")
-        result = subprocess.run(['bash', 'scripts/padel.sh'], capture_output=True, text=True, timeout=300)
-        
-        if result.returncode != 0:
-            logger.warning("PaDEL calculation failed, using simplified ML analysis")
-            return run_simplified_ml(df)
-        
-        # Load PaDEL descriptors
-        descriptors_file = os.path.join(processed_dir, 'descriptors_output.csv')
-        if not os.path.exists(descriptors_file):
-            logger.warning("PaDEL output not found, using simplified ML analysis")
-            return run_simplified_ml(df)
-        
-        X = pd.read_csv(descriptors_file).drop(columns=['Name'])
-        Y = df['pIC50']
+        # Align the feature rows with the compounds by molecule ID
+        X = features.to_pandas()
+        if 'Name' in X.columns:
+            X = X.drop_duplicates('Name').set_index('Name').reindex(df['molecule_chembl_id'].astype(str))
+        X = X.reset_index(drop=True)
+        Y = df['pIC50'].reset_index(drop=True)
+        complete = X.notna().all(axis=1).to_numpy()
+        X, Y = X[complete], Y[complete]
         
         # Feature selection
-        selector = VarianceThreshold(threshold=(.8 * (1 - .8)))
+        selector = VarianceThreshold(threshold=params['variance_threshold'])
         X_selected = selector.fit_transform(X)
+        feature_names = X.columns[selector.get_support()]
         
         # Train-test split
-        X_train, X_test, Y_train, Y_test = train_test_split(X_selected, Y, test_size=0.2, random_state=42)
+        X_train, X_test, Y_train, Y_test = train_test_split(
+            X_selected, Y, test_size=params['test_size'], random_state=params['random_state'])
         
         # Train Random Forest
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, Y_train)
+        model, tuning_report = fit_random_forest(X_train, Y_train, params, cancel)
+        
+        model_key = export_model(model, feature_names)
         
         # Make predictions
         predictions = model.predict(X_test)
@@ -545,7 +906,7 @@ def run_ml_analysis(df):
         rmse = np.sqrt(mse)
         
         # Generate regression plot
-        generate_regression_plot(Y_test, predictions)
+        regression_plot_paths = generate_regression_plot(Y_test, predictions, f'{file_prefix}{REGRESSION_PLOT_FILE}')
         
         logger.info(f"ML analysis complete. R² = {r2_score:.3f}")
         
@@ -558,27 +919,32 @@ def run_ml_analysis(df):
             },
             "modelInfo": {
                 "algorithm": "Random Forest Regressor",
-                "nEstimators": 100,
+                "nEstimators": int(model.n_estimators),
+                "modelKey": model_key,
                 "features": int(X_selected.shape[1]),
-                "trainingSize": 80,  # 80% training split
-                "testSize": 20       # 20% test split
+                "trainingSize": round((1 - params['test_size']) * 100),
+                "testSize": round(params['test_size'] * 100),
+                **({"tuning": tuning_report} if tuning_report else {})
             },
             "regressionPlot": {
                 "name": "Predicted vs Experimental pIC50",
                 "description": "Scatter plot showing model predictions against experimental values with perfect prediction line",
-                "imagePath": "/outputs/predicted_experimental_pIC50.png"
+                **regression_plot_paths
             }
         }
         
+    except TaskCancelled:
+        raise
     except Exception as e:
         logger.error(f"ML analysis failed: {str(e)}")
-        return run_simplified_ml(df)
+        return run_simplified_ml(df, file_prefix, params, cancel)
 
-def run_simplified_ml(df):
+def run_simplified_ml(df, file_prefix="", params=None, cancel=NEVER):
     """
     Simplified ML analysis using only Lipinski descriptors
     """
     logger.info("Running simplified ML with Lipinski descriptors only...")
+    params = {**ML_PARAMS, **(params or {})}
     
     try:
         # Use only Lipinski descriptors and pIC50
@@ -595,11 +961,13 @@ def run_simplified_ml(df):
         Y = ml_df['pIC50']
         
         # Train-test split
-        X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.2, random_state=42)
+        X_train, X_test, Y_train, Y_test = train_test_split(
+            X, Y, test_size=params['test_size'], random_state=params['random_state'])
         
         # Train Random Forest
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, Y_train)
+        model, tuning_report = fit_random_forest(X_train, Y_train, params, cancel)
+        
+        model_key = export_model(model, X.columns)
         
         # Make predictions
         predictions = model.predict(X_test)
@@ -611,7 +979,7 @@ def run_simplified_ml(df):
         rmse = np.sqrt(mse)
         
         # Generate regression plot
-        generate_regression_plot(Y_test, predictions)
+        regression_plot_paths = generate_regression_plot(Y_test, predictions, f'{file_prefix}{REGRESSION_PLOT_FILE}')
         
         return {
             "metrics": {
@@ -622,18 +990,22 @@ def run_simplified_ml(df):
             },
             "modelInfo": {
                 "algorithm": "Random Forest Regressor (Lipinski only)",
-                "nEstimators": 100,
+                "nEstimators": int(model.n_estimators),
+                "modelKey": model_key,
                 "features": 4,
-                "trainingSize": 80,  # 80% training split
-                "testSize": 20       # 20% test split
+                "trainingSize": round((1 - params['test_size']) * 100),
+                "testSize": round(params['test_size'] * 100),
+                **({"tuning": tuning_report} if tuning_report else {})
             },
             "regressionPlot": {
                 "name": "Predicted vs Experimental pIC50",
                 "description": "Scatter plot showing model predictions against experimental values with perfect prediction line",
-                "imagePath": "/outputs/predicted_experimental_pIC50.png"
+                **regression_plot_paths
             }
         }
         
+    except TaskCancelled:
+        raise
     except Exception as e:
         logger.error(f"Simplified ML analysis failed: {str(e)}")
         return {
@@ -642,45 +1014,56 @@ def run_simplified_ml(df):
             "regressionPlot": None
         }
 
-def generate_regression_plot(y_test, predictions):
-    """Generate and save regression plot"""
+def generate_regression_plot(y_test, predictions, filename=REGRESSION_PLOT_FILE):
+    """
+    Generate the regression plot
+    
+    The plotted values are stored as plot data. With lazy plots the image is rendered
+    on first request; otherwise the plot is saved to data/outputs/<filename>.
+    
+    Returns:
+        dict: imagePath of the plot image and dataPath of its pre-aggregated data
+    """
+    paths = {"imagePath": f"/outputs/{filename}"}
     try:
-        # Close any existing figures
-        plt.close('all')
-        
-        plt.figure(figsize=(10, 10))
-        plt.scatter(y_test, predictions, alpha=0.4)
+        data_key = plot_cache.save_plot_data(pd.DataFrame({
+            'experimental': np.asarray(y_test, dtype='float32'),
+            'predicted': np.asarray(predictions, dtype='float32')
+        }))
+        paths["dataPath"] = f"/api/plots/{data_key}"
+        if LAZY_PLOTS:
+            paths["imagePath"] = plot_cache.plot_url(data_key, REGRESSION_PLOT_FILE)
+            return paths
         
-        # Add perfect prediction line
-        min_val = min(min(y_test), min(predictions))
-        max_val = max(max(y_test), max(predictions))
-        plt.plot([min_val, max_val], [min_val, max_val], 'r--', alpha=0.8)
-        
-        plt.xlabel('Experimental pIC50', fontsize=14, fontweight='bold')
-        plt.ylabel('Predicted pIC50', fontsize=14, fontweight='bold')
-        plt.title('Predicted vs Experimental pIC50', fontsize=16, fontweight='bold')
-        
-        # Save plot to data/outputs directory
-        output_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'outputs')
-        os.makedirs(output_dir, exist_ok=True)
-        plot_path = os.path.join(output_dir, 'predicted_experimental_pIC50.png')
-        plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        logger.info(f"Regression plot saved to: {plot_path}")
+        plotter = lp(None)
+        plotter.prediction_scatter(list(y_test), list(predictions), filename)
+        published_name = artifacts.publish(os.path.join(plotter.output_dir, filename))
+        paths["imagePath"] = f"/outputs/{published_name}"
+        logger.info(f"Regression plot saved to: {os.path.join(plotter.output_dir, published_name)}")
         
     except Exception as e:
         logger.error(f"Failed to generate regression plot: {str(e)}")
+    return paths
 
 def cleanup_old_files():
     """
     Clean up old plot files and data files before starting new analysis
+    
+    Logs one summary line; only failed removals are logged individually.
     """
-    logger.info("=== STARTING FILE CLEANUP ===")
+    removed = Counter()
+    
+    def remove(directory, file, kind):
+        try:
+            os.remove(os.path.join(directory, file))
+            removed[kind] += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to remove {file}: {str(e)}")
     
     # Clean up output plots
     output_dir = get_data_directory('outputs')
-    logger.info(f"Checking output directory: {output_dir}")
     
     if os.path.exists(output_dir):
         plot_files = [
@@ -694,112 +1077,351 @@ def cleanup_old_files():
             'predicted_experimental_pIC50.png'
         ]
         
-        for plot_file in plot_files:
-            file_path = os.path.join(output_dir, plot_file)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.info(f"Successfully removed old plot: {plot_file}")
-                except Exception as e:
-                    logger.error(f"Failed to remove {plot_file}: {str(e)}")
-            else:
-                logger.info(f"Plot file does not exist: {plot_file}")
-    else:
-        logger.info(f"Output directory does not exist: {output_dir}")
+        # Plots are stored under content-hashed names (plot_MW.<hash>.png) plus gzip variants
+        for file in os.listdir(output_dir):
+            plot_file = artifacts.base_name(file[:-3] if file.endswith('.gz') else file)
+            if plot_file in plot_files:
+                remove(output_dir, file, 'plots')
     
     # Clean up processed data files
     processed_dir = get_data_directory('processed')
-    logger.info(f"Checking processed directory: {processed_dir}")
     
     if os.path.exists(processed_dir):
         data_files = [
-            'bioactivity_final.csv',
+            'bioactivity_final.parquet',
             'molecule.smi',
-            'descriptors_output.csv'
+            'descriptors_output.csv',
+            'descriptors_output.arrow'
         ]
         
         for data_file in data_files:
-            file_path = os.path.join(processed_dir, data_file)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.info(f"Successfully removed old data file: {data_file}")
-                except Exception as e:
-                    logger.error(f"Failed to remove {data_file}: {str(e)}")
-            else:
-                logger.info(f"Data file does not exist: {data_file}")
+            remove(processed_dir, data_file, 'data files')
         
         # Also clean up Mann-Whitney test result files
         for file in os.listdir(processed_dir):
             if file.startswith('mannwhitneyu_') and file.endswith('.csv'):
-                file_path = os.path.join(processed_dir, file)
-                try:
+                remove(processed_dir, file, 'test results')
+    
+    if removed:
+        logger.info("File cleanup removed " + ", ".join(f"{n} {kind}" for kind, n in removed.items()))
+
+def get_task_workspace(task_key):
+    """
+    Get the scratch directory for the intermediate files of one analysis task
+    
+    Args:
+        task_key (str): Filesystem-safe task key
+        
+    Returns:
+        str: Path to the task workspace
+    """
+    return os.path.join(get_data_directory('processed'), 'work', task_key)
+
+def cleanup_task_workspace(task_key):
+    """Remove the scratch directory of a finished task"""
+    workspace = get_task_workspace(task_key)
+    if os.path.exists(workspace):
+        shutil.rmtree(workspace, ignore_errors=True)
+        logger.info(f"Removed task workspace: {workspace}")
+
+def prune_task_outputs(max_age_hours=24):
+    """
+    Remove task-prefixed plot files, task datasets, plot data, checkpoints, models and maps unused for max_age_hours
+    
+    Returns:
+        int: Number of removed files
+    """
+    output_dir = get_data_directory('outputs')
+    if not os.path.exists(output_dir):
+        return 0
+    
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for file in os.listdir(output_dir):
+        # Files without a task prefix belong to the single-run mode
+        if not file.endswith(('.png', '.png.gz')) or file.startswith(('plot_', 'predicted_')):
+            continue
+        file_path = os.path.join(output_dir, file)
+        try:
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
+                removed += 1
+        except OSError as e:
+            logger.error(f"Failed to remove {file}: {str(e)}")
+    
+    # Final datasets of tasks (see flask_app.save_task_dataset); the task rows are pruned by the task store
+    tasks_dir = os.path.join(get_data_directory('processed'), 'tasks')
+    if os.path.exists(tasks_dir):
+        for file in os.listdir(tasks_dir):
+            file_path = os.path.join(tasks_dir, file)
+            try:
+                if file.endswith('.parquet') and os.path.getmtime(file_path) < cutoff:
                     os.remove(file_path)
-                    logger.info(f"Successfully removed old test result: {file}")
-                except Exception as e:
-                    logger.error(f"Failed to remove {file}: {str(e)}")
-    else:
-        logger.info(f"Processed directory does not exist: {processed_dir}")
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Failed to remove {file}: {str(e)}")
+    
+    if removed:
+        logger.info(f"Removed {removed} expired task plot files and datasets")
+    removed += plot_cache.prune_plot_data(max_age_hours)
+    removed += checkpoints.prune(max_age_hours)
+    removed += forest_model.prune_models(max_age_hours)
+    removed += chemical_space.prune_maps(max_age_hours)
+    return removed
+
+def _ml_outputs_exist(ml_results):
+    """Check that the regression plot and model referenced by stored ML results were not pruned"""
+    model_key = ml_results.get('modelInfo', {}).get('modelKey')
+    if model_key and not os.path.exists(os.path.join(forest_model.MODEL_DIR, model_key, 'meta.json')):
+        return False
+    plot = ml_results.get('regressionPlot') or {}
+    image_path = plot.get('imagePath', '').split('?')[0]
+    if image_path.startswith('/outputs/plots/'):
+        try:
+            plot_cache.plot_data_path(image_path.split('/')[3])
+            return True
+        except (ValueError, FileNotFoundError):
+            return False
+    if image_path.startswith('/outputs/'):
+        return os.path.exists(os.path.join(get_data_directory('outputs'), image_path[len('/outputs/'):]))
+    return False
+
+def fetch_checkpoint_inputs(target_id, limit='1000'):
+    """Checkpoint inputs of the fetch stage of a resolved target (activities differ per data source)"""
+    return {"target": target_id, "limit": str(limit), "source": get_data_source().key()}
+
+def is_target_warm(target_id, limit='1000', tune=False):
+    """
+    True if the analysis of a resolved target is checkpointed up to the trained model
     
-    logger.info("=== FILE CLEANUP COMPLETE ===")
+    A new analysis of a warm target resumes from the stored stages instead of
+    querying ChemBL and training the model (used by the background warm-up of popular
+    targets). The checkpoint keys are followed from the fresh fetch checkpoint to the
+    ML checkpoint of the tuning flag, so tuned and untuned analyses are warmed apart.
+    """
+    checkpoint = checkpoints.peek('fetch', fetch_checkpoint_inputs(target_id, limit), FETCH_CHECKPOINT_MAX_AGE_HOURS)
+    for stage in ('preprocess', 'label', 'descriptors', 'ic50'):
+        if checkpoint is None:
+            return False
+        checkpoint = checkpoints.peek(stage, {"input": checkpoint.fingerprint})
+    if checkpoint is None:
+        return False
+    ml = checkpoints.peek('ml', {"input": checkpoint.fingerprint, "params": {**ML_PARAMS, "tune": bool(tune)}})
+    return ml is not None and _ml_outputs_exist(ml.meta)
 
 # Utility function for API
-def run_complete_analysis_pipeline(target_name, limit='1000', tracker=None):
+def run_complete_analysis_pipeline(target_name, limit='1000', tracker=None, incremental=False, task_key=None,
+                                   ml_params=None, resume=True, out_of_core=None, cancel=None):
     """
     Main function to run the complete analysis pipeline
-    """
-    logger.info(f"Starting complete analysis for: {target_name} with limit: {limit}")
     
-    # Clean up old plots and data files first
-    cleanup_old_files()
+    With incremental=True the stored activities of the target are synced with ChemBL
+    (only records newer than the stored watermark are fetched, limit is ignored) and
+    descriptors are only calculated for structures that were not seen before.
     
-    # Step 1: Retrieve data
-    if tracker:
-        tracker.update('retrieving', 15, f'Searching ChemBL database for {target_name}...')
-    df_raw, display_target_name, target_id = retrievedata_for_target(target_name, limit)
+    With a task_key, intermediate files go to a private task workspace and plot files
+    are prefixed with the key, so several analyses can run at the same time.
     
-    # Step 2: Preprocess
-    if tracker:
-        tracker.update('preprocessing', 25, 'Cleaning and filtering compound data...')
-    df_preprocessed = preprocess_data(df_raw)
+    With resume=True every stage output is checkpointed under a hash of its inputs and
+    parameters; a re-run (e.g. after a PaDEL timeout) resumes after the last completed
+    stage and a different ml_params only re-runs the model training.
     
-    # Step 3: Label compounds
-    if tracker:
-        tracker.update('labeling', 35, 'Classifying compounds by bioactivity...')
-    df_labeled = labelcompounds_data(df_preprocessed)
+    The stages form a dependency graph (see stage_graph.run_graph): independent stages
+    run in parallel and a failing optional stage (features, stats, plots, map, cliffs, ML)
+    falls back to an empty result without failing the analysis.
     
-    # Step 4: Add descriptors
-    if tracker:
-        tracker.update('descriptors', 50, 'Computing molecular properties and Lipinski descriptors...')
-    df_with_descriptors = add_lipinski_descriptors(df_labeled)
+    With out_of_core=True (default: DRUGPREDICT_OUT_OF_CORE) the activities are streamed
+    to partitioned Parquet and preprocessed in chunks (see chunked.run_chunked), so the
+    peak memory of the stages up to the pIC50 conversion is bounded by the chunk size.
+    These stages are not checkpointed; incremental syncs always run in memory.
     
-    # Step 5: Process IC50
-    if tracker:
-        tracker.update('analysis', 60, 'Processing IC50 values and performing statistical analysis...')
-    df_final = process_ic50_values(df_with_descriptors)
+    The cancel token (see cancellation.CancelToken) is checked between stages and
+    inside the long loops, and kills the PaDEL process; a cancelled or timed out
+    analysis raises TaskCancelled once its running stages have stopped.
+    """
+    logger.info(f"Starting complete analysis for: {target_name} with limit: {limit}")
     
-    # Save final dataset
-    processed_dir = get_data_directory('processed')
-    os.makedirs(processed_dir, exist_ok=True)
-    final_dataset_path = os.path.join(processed_dir, 'bioactivity_final.csv')
-    df_final.to_csv(final_dataset_path, index=False)
-    logger.info(f"Final dataset saved to: {final_dataset_path}")
+    if task_key:
+        processed_dir = get_task_workspace(task_key)
+        file_prefix = f"{task_key}_"
+    else:
+        # Clean up old plots and data files first
+        cleanup_old_files()
+        processed_dir = get_data_directory('processed')
+        file_prefix = ""
+    ml_params = {**ML_PARAMS, **(ml_params or {})}
+    out_of_core = (OUT_OF_CORE if out_of_core is None else out_of_core) and not incremental
+    cancel = cancel or NEVER
+    
+    def run_stage(stage, inputs, compute, **options):
+        return checkpoints.run_stage(stage, inputs, compute, enabled=resume, **options)
+    
+    # Stage functions: each receives the results of the stages it depends on
+    def fetch():
+        if incremental:
+            df_raw, display_name, chembl_id, _ = refresh_data_for_target(target_name)
+            return checkpoints.Checkpoint(df_raw, {"displayName": display_name, "targetId": chembl_id},
+                                          checkpoints.frame_fingerprint(df_raw), False)
+        
+        display_name, chembl_id = resolve_target(target_name)
+        
+        def retrieve():
+            df, _, _ = retrievedata_for_target(target_name, limit)
+            return df, {"displayName": display_name, "targetId": chembl_id}
+        # Keyed by the resolved target, so all names of a target (and warm-up runs) share the data
+        checkpoint = run_stage('fetch', fetch_checkpoint_inputs(chembl_id, limit), retrieve,
+                               max_age_hours=FETCH_CHECKPOINT_MAX_AGE_HOURS)
+        return checkpoint._replace(meta={**checkpoint.meta, "displayName": display_name})
+    
+    def preprocess(fetch):
+        if incremental:
+            compute = lambda: (preprocess_data_incremental(fetch.data, fetch.meta['targetId']), None)
+        else:
+            compute = lambda: (preprocess_data(fetch.data), None)
+        return run_stage('preprocess', {"input": fetch.fingerprint}, compute)
     
-    # Step 6: Statistical analysis
-    if tracker:
-        tracker.update('analysis', 70, 'Performing Mann-Whitney U tests...')
-    stats_results = perform_statistical_analysis(df_final)
+    def label(preprocess):
+        return run_stage('label', {"input": preprocess.fingerprint},
+                         lambda: (labelcompounds_data(preprocess.data), None))
     
-    # Step 7: Generate plots
-    if tracker:
-        tracker.update('plotting', 80, 'Creating visualization plots and charts...')
-    plot_results = generate_plots(df_final)
+    def descriptors(fetch, label):
+        if incremental:
+            compute = lambda: (add_lipinski_descriptors_cached(label.data, fetch.meta['targetId'], cancel), None)
+        else:
+            compute = lambda: (add_lipinski_descriptors(label.data, cancel), None)
+        return run_stage('descriptors', {"input": label.fingerprint}, compute)
     
-    # Step 8: ML analysis (after plots for proper progress order)
-    if tracker:
-        tracker.update('ml', 90, 'Training Random Forest model and making predictions...')
-    ml_results = run_ml_analysis(df_final)
+    def features(label):
+        # Fingerprint featurization only needs the structures, not the descriptors
+        try:
+            return padel_feature_stage(label.data, processed_dir, resume, cancel)
+        except TaskCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"PaDEL featurization failed: {str(e)}")
+            return None
+    
+    def ic50(descriptors):
+        return run_stage('ic50', {"input": descriptors.fingerprint},
+                         lambda: (process_ic50_values(descriptors.data), None))
+    
+    # Out-of-core replacements of the stages from fetch to ic50
+    def fetch_partitioned():
+        display_name, chembl_id = resolve_target(target_name)
+        raw_dir = os.path.join(processed_dir, 'raw_activities')
+        records = chunked.write_partitions(iter_activity_batches(chembl_id, limit), raw_dir, cancel)
+        if records < 10:
+            raise ValueError(f"Insufficient IC50 data for target: {target_name} (found {records} compounds, minimum 10 required)")
+        logger.info(f"Retrieved {records} compounds for {display_name} into {raw_dir}")
+        return checkpoints.Checkpoint(None, {"displayName": display_name, "targetId": chembl_id, "rawDir": raw_dir},
+                                      None, False)
+    
+    def ic50_chunked(fetch):
+        transform = lambda df: process_ic50_values(add_lipinski_descriptors(labelcompounds_data(df), cancel))
+        output_dir, statistics, _ = chunked.run_chunked(fetch.meta['rawDir'], os.path.join(processed_dir, 'chunked'),
+                                                        filter_activities, transform, cancel=cancel)
+        if statistics.rows == 0:
+            raise ValueError("No compounds remaining after preprocessing")
+        df_final = chunked.read_output(output_dir)
+        return checkpoints.Checkpoint(df_final, {"statistics": statistics},
+                                      checkpoints.frame_fingerprint(df_final), False)
+    
+    def features_from_ic50(ic50):
+        return features(ic50)
+    
+    def save(fetch, ic50):
+        df_final = ic50.data
+        os.makedirs(processed_dir, exist_ok=True)
+        final_dataset_path = os.path.join(processed_dir, 'bioactivity_final.parquet')
+        columnar.write_dataset(df_final, final_dataset_path)
+        logger.info(f"Final dataset saved to: {final_dataset_path}")
+        # Keep a per-target copy for incremental refresh and substructure search
+        target_store.save_dataset(fetch.meta['targetId'], df_final)
+        
+        # Make the analysed compounds available to similarity search
+        try:
+            get_similarity_index().add_compounds(df_final, fetch.meta['targetId'])
+        except Exception as e:
+            logger.error(f"Failed to update similarity index: {str(e)}")
+        return final_dataset_path
+    
+    def stats(ic50):
+        return perform_statistical_analysis(ic50.data, processed_dir, (ic50.meta or {}).get('statistics'))
+    
+    def plots(ic50):
+        return generate_plots(ic50.data, file_prefix)
+    
+    def space(ic50):
+        return chemical_space.build_chemical_space(ic50.data, cancel=cancel)
+    
+    def cliffs(ic50):
+        return activity_cliffs.find_activity_cliffs(ic50.data, cancel=cancel)
+    
+    def ml(ic50, features):
+        if features is None:
+            # PaDEL failed or timed out: not checkpointed, so a re-run retries
+            return run_simplified_ml(ic50.data, file_prefix, ml_params, cancel)
+        return run_stage(
+            'ml', {"input": ic50.fingerprint, "params": ml_params},
+            lambda: (None, run_ml_analysis(ic50.data, processed_dir, file_prefix, ml_params, features, cancel)),
+            persist=lambda data, meta: meta['modelInfo']['algorithm'] == "Random Forest Regressor",
+            valid=lambda checkpoint: _ml_outputs_exist(checkpoint.meta)
+        ).meta
+    
+    failed_ml = {
+        "metrics": {"r2Score": 0.0, "mse": 0.0, "mae": 0.0, "rmse": 0.0},
+        "modelInfo": {"algorithm": "Failed", "nEstimators": 0, "features": 0, "trainingSize": 0, "testSize": 0},
+        "regressionPlot": None
+    }
+    
+    # Stats, plots, the chemical-space map, activity cliffs and ML only depend on the final dataset
+    # and run at the same time, as do the Lipinski descriptors and the PaDEL featurization
+    if out_of_core:
+        stages = [
+            Stage('fetch', fetch_partitioned, step='retrieving', weight=3,
+                  message=f'Streaming ChemBL activities for {target_name}...'),
+            Stage('ic50', ic50_chunked, ['fetch'], step='preprocessing', weight=4,
+                  message='Standardizing, labelling and computing descriptors in chunks...'),
+            Stage('features', features_from_ic50, ['ic50'], step='descriptors', weight=3,
+                  message='Calculating PaDEL fingerprints...'),
+        ]
+    else:
+        stages = [
+            Stage('fetch', fetch, step='retrieving', weight=3,
+                  message=f'Searching ChemBL database for {target_name}...'),
+            Stage('preprocess', preprocess, ['fetch'], step='preprocessing', weight=1,
+                  message='Cleaning, standardizing and deduplicating compound structures...'),
+            Stage('label', label, ['preprocess'], step='labeling', weight=0.5,
+                  message='Classifying compounds by bioactivity...'),
+            Stage('descriptors', descriptors, ['fetch', 'label'], step='descriptors', weight=2,
+                  message='Computing molecular properties and Lipinski descriptors...'),
+            Stage('features', features, ['label'], step='descriptors', weight=3,
+                  message='Calculating PaDEL fingerprints...'),
+            Stage('ic50', ic50, ['descriptors'], step='analysis', weight=0.5,
+                  message='Processing IC50 values...'),
+        ]
+    stages += [
+        Stage('save', save, ['fetch', 'ic50'], step='analysis', weight=0.5,
+              message='Saving the analysed dataset...'),
+        Stage('stats', stats, ['ic50'], step='analysis', weight=0.5, fallback={},
+              message='Performing Mann-Whitney U tests...'),
+        Stage('plots', plots, ['ic50'], step='plotting', weight=1, fallback=[],
+              message='Creating visualization plots and charts...'),
+        Stage('space', space, ['ic50'], step='plotting', weight=1, fallback=None,
+              message='Projecting compounds onto a chemical-space map...'),
+        Stage('cliffs', cliffs, ['ic50'], step='analysis', weight=1, fallback=None,
+              message='Finding activity cliffs...'),
+        Stage('ml', ml, ['ic50', 'features'], step='ml', weight=3, fallback=failed_ml,
+              message='Training Random Forest model and making predictions...'),
+    ]
+    results, errors, _ = run_graph(stages, tracker, progress_range=(15, 90), max_workers=PIPELINE_WORKERS,
+                                   cancel=cancel)
+    if errors:
+        logger.warning(f"Stages completed with fallbacks: {errors}")
     
     logger.info("Analysis pipeline completed successfully")
     
-    return df_final, display_target_name, target_id, stats_results, plot_results, ml_results
+    df_final = results['ic50'].data
+    meta = results['fetch'].meta
+    return (df_final, meta['displayName'], meta['targetId'], results['stats'], results['plots'], results['ml'],
+            results['space'], results['cliffs'])
@@ -0,0 +1,200 @@
+#DrugPredict - On-demand plot rendering
+#The analysis only stores the data behind its plots (content-addressed Parquet);
+#images are rendered on first request at the requested DPI and width and kept in a
+#size-bounded cache, so rendering is off the critical path of the analysis.
+
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+import artifacts
+
+logger = logging.getLogger(__name__)
+
+DATA_ROOT = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+PLOT_DATA_DIR = os.path.join(DATA_ROOT, 'processed', 'plots')
+PLOT_CACHE_DIR = os.path.join(DATA_ROOT, 'outputs', 'cache')
+
+# Rendered images are evicted least-recently-used first above this size
+PLOT_CACHE_MAX_BYTES = int(os.getenv('DRUGPREDICT_PLOT_CACHE_MB', '256')) * 1024 * 1024
+
+# Accepted render parameters (DPI and image width in pixels)
+MIN_DPI, MAX_DPI = 50, 300
+MIN_WIDTH, MAX_WIDTH = 100, 4000
+
+_DATA_KEY_PATTERN = re.compile(r'^[0-9a-f]{20}$')
+
+# Renders of one image are serialized by one of a fixed set of locks (renders of
+# different images only wait for each other when their keys share a stripe)
+RENDER_LOCK_STRIPES = 64
+_render_locks = [threading.Lock() for _ in range(RENDER_LOCK_STRIPES)]
+
+
+def _render_lock(cache_key):
+    return _render_locks[hash(cache_key) % RENDER_LOCK_STRIPES]
+
+
+def save_plot_data(df):
+    """
+    Store the data behind a set of plots
+
+    The key is a hash of the content, so re-running an analysis with the same result
+    reuses the stored data and every image rendered from it.
+
+    Args:
+        df (pd.DataFrame): Plot data
+
+    Returns:
+        str: Plot data key
+    """
+    digest = hashlib.sha1(','.join(df.columns).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    data_key = digest.hexdigest()[:20]
+
+    os.makedirs(PLOT_DATA_DIR, exist_ok=True)
+    data_path = os.path.join(PLOT_DATA_DIR, f'{data_key}.parquet')
+    if os.path.exists(data_path):
+        # Keep data that is still referenced from being pruned
+        os.utime(data_path)
+    else:
+        columnar.write_dataset(df, data_path)
+    return data_key
+
+
+def plot_data_path(data_key):
+    """
+    Path of stored plot data
+
+    Raises:
+        ValueError: If the key is malformed
+        FileNotFoundError: If there is no data for the key
+    """
+    if not _DATA_KEY_PATTERN.match(data_key):
+        raise ValueError(f"Invalid plot data key: {data_key}")
+    data_path = os.path.join(PLOT_DATA_DIR, f'{data_key}.parquet')
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f"No plot data for key: {data_key}")
+    return data_path
+
+
+def plot_url(data_key, filename, **params):
+    """URL path of a lazily rendered plot (params: dpi, width)"""
+    query = '&'.join(f'{name}={value}' for name, value in params.items() if value)
+    return f"/outputs/plots/{data_key}/{filename}" + (f"?{query}" if query else "")
+
+
+def _evict(max_bytes=PLOT_CACHE_MAX_BYTES):
+    """Remove least recently used images until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(PLOT_CACHE_DIR):
+        path = os.path.join(PLOT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        if total <= max_bytes:
+            break
+    logger.info(f"Evicted {removed} cached plot images")
+    return removed
+
+
+def get_plot(data_key, filename, dpi=None, width=None):
+    """
+    Path of a rendered plot, rendering it on first access
+
+    Args:
+        data_key (str): Key returned by save_plot_data
+        filename (str): Plot file name (e.g. plot_MW.png)
+        dpi (int): Resolution (None for the default plot resolution)
+        width (int): Image width in pixels (None for the default figure size)
+
+    Returns:
+        str: Path of the cached PNG
+    """
+    # Matplotlib is only imported by processes that actually render
+    from lipinski_plots import lipinski_plots, PLOT_FILES, REGRESSION_PLOT_FILE, PLOT_DPI
+
+    plot_methods = {plot_file: method for method, plot_file in PLOT_FILES.items()}
+    if filename not in plot_methods and filename != REGRESSION_PLOT_FILE:
+        raise ValueError(f"Unknown plot: {filename}")
+    dpi = min(max(int(dpi or PLOT_DPI), MIN_DPI), MAX_DPI)
+    width = min(max(int(width), MIN_WIDTH), MAX_WIDTH) if width else None
+    data_path = plot_data_path(data_key)
+
+    cache_key = hashlib.sha1(f'{data_key}|{filename}|{dpi}|{width}'.encode()).hexdigest()[:24]
+    cache_name = f'{cache_key}-{filename}'
+    cache_path = os.path.join(PLOT_CACHE_DIR, cache_name)
+
+    with _render_lock(cache_key):
+        if os.path.exists(cache_path):
+            # Mark as recently used for the LRU eviction
+            os.utime(cache_path)
+            return cache_path
+
+        os.makedirs(PLOT_CACHE_DIR, exist_ok=True)
+        start = time.perf_counter()
+        df = columnar.read_dataset(data_path)
+
+        # Render under a temporary name and move it into place
+        tmp_prefix = f'.{cache_key}.{os.getpid()}.{threading.get_ident()}-'
+        plotter = lipinski_plots(df, tmp_prefix, dpi=dpi, width=width, output_dir=PLOT_CACHE_DIR)
+        if filename == REGRESSION_PLOT_FILE:
+            plotter.prediction_scatter(df['experimental'].tolist(), df['predicted'].tolist(), tmp_prefix + filename)
+        else:
+            getattr(plotter, plot_methods[filename])(df)
+        os.replace(os.path.join(PLOT_CACHE_DIR, tmp_prefix + filename), cache_path)
+        artifacts.precompress(cache_path)
+
+        logger.info(f"Rendered {filename} ({data_key}, dpi={dpi}, width={width}) "
+                    f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    _evict()
+    return cache_path
+
+
+def prune_plot_data(max_age_hours=24):
+    """
+    Remove plot data that was not saved or re-used for max_age_hours
+
+    Returns:
+        int: Number of removed files
+    """
+    if not os.path.exists(PLOT_DATA_DIR):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for file in os.listdir(PLOT_DATA_DIR):
+        file_path = os.path.join(PLOT_DATA_DIR, file)
+        try:
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
+                removed += 1
+        except OSError as e:
+            logger.error(f"Failed to remove {file}: {str(e)}")
+
+    if removed:
+        logger.info(f"Removed {removed} expired plot data files")
+    return removed
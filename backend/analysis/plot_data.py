@@ -0,0 +1,153 @@
+#DrugPredict - Pre-aggregated plot data
+#Compact JSON summaries of the stored plot data (class counts, box-plot statistics,
+#downsampled or binned scatter), so the frontend can draw the charts natively
+#without rendering or downloading PNGs.
+
+import logging
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+from plot_cache import plot_data_path
+
+logger = logging.getLogger(__name__)
+
+# Descriptors shown as box plots by bioactivity class
+BOX_COLUMNS = ['pIC50', 'MW', 'LogP', 'NumHDonors', 'NumHAcceptors']
+
+# Scatter plots up to this many points are returned point by point, larger ones binned
+SCATTER_MAX_POINTS = 2000
+
+# Bins per axis of a binned scatter plot
+SCATTER_BINS = 40
+
+
+def _round(values, digits=4):
+    return [round(float(v), digits) for v in values]
+
+
+def box_statistics(df, columns=BOX_COLUMNS):
+    """
+    Tukey box-plot statistics of each column by bioactivity class
+
+    All quartiles come from one groupby; the whiskers (most extreme values within
+    1.5 IQR of the box) from one masked groupby over all columns. Classes without
+    values of a column are left out of its list (every list is empty for a frame
+    without labelled rows).
+
+    Returns:
+        dict: {column: [{class, q1, median, q3, whiskerLow, whiskerHigh, outliers}, ...]}
+    """
+    df = df[df['class'].notna()]
+    if df.empty:
+        return {column: [] for column in columns}
+    values = df[columns].astype('float64')
+    groups = df['class']
+
+    quartiles = values.groupby(groups, observed=True).quantile([0.25, 0.5, 0.75]).unstack()
+    q1 = quartiles.xs(0.25, axis=1, level=1)
+    q3 = quartiles.xs(0.75, axis=1, level=1)
+    iqr = q3 - q1
+
+    # Fences of every row's class, aligned with the rows
+    low_fence = (q1 - 1.5 * iqr).reindex(groups.to_numpy()).to_numpy()
+    high_fence = (q3 + 1.5 * iqr).reindex(groups.to_numpy()).to_numpy()
+    inside = (values.to_numpy() >= low_fence) & (values.to_numpy() <= high_fence)
+
+    within = values.where(inside)
+    grouped = within.groupby(groups, observed=True)
+    whisker_low = grouped.min()
+    whisker_high = grouped.max()
+    outliers = (~pd.DataFrame(inside, columns=columns, index=values.index) & values.notna()).groupby(
+        groups, observed=True).sum()
+    counts = values.groupby(groups, observed=True).count()
+
+    summary = {}
+    for column in columns:
+        summary[column] = [{
+            "class": str(cls),
+            "q1": round(float(q1.at[cls, column]), 4),
+            "median": round(float(quartiles.at[cls, (column, 0.5)]), 4),
+            "q3": round(float(q3.at[cls, column]), 4),
+            "whiskerLow": round(float(whisker_low.at[cls, column]), 4),
+            "whiskerHigh": round(float(whisker_high.at[cls, column]), 4),
+            "outliers": int(outliers.at[cls, column])
+        } for cls in q1.index if counts.at[cls, column]]
+    return summary
+
+
+def scatter_summary(x, y, groups=None, max_points=SCATTER_MAX_POINTS, bins=SCATTER_BINS):
+    """
+    Scatter data: all points up to max_points, otherwise counts on a bins x bins grid
+
+    Args:
+        x, y (np.ndarray): Coordinates
+        groups (np.ndarray): Optional class label per point (binned counts are per class)
+
+    Returns:
+        dict: {"mode": "points", "x", "y"[, "class"]} or
+              {"mode": "binned", "xEdges", "yEdges", "cells": [[ix, iy, count, ...], ...]}
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if len(x) <= max_points:
+        result = {"mode": "points", "x": _round(x), "y": _round(y)}
+        if groups is not None:
+            result["class"] = [str(g) for g in groups]
+        return result
+
+    x_edges = np.linspace(x.min(), x.max(), bins + 1)
+    y_edges = np.linspace(y.min(), y.max(), bins + 1)
+    ix = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, bins - 1)
+    iy = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, bins - 1)
+
+    result = {"mode": "binned", "xEdges": _round(x_edges), "yEdges": _round(y_edges)}
+    if groups is None:
+        counts = np.bincount(ix * bins + iy, minlength=bins * bins)
+        cells = np.flatnonzero(counts)
+        result["cells"] = [[int(c // bins), int(c % bins), int(counts[c])] for c in cells]
+    else:
+        labels, codes = np.unique(np.asarray(groups).astype(str), return_inverse=True)
+        counts = np.bincount((ix * bins + iy) * len(labels) + codes, minlength=bins * bins * len(labels))
+        counts = counts.reshape(bins * bins, len(labels))
+        cells = np.flatnonzero(counts.sum(axis=1))
+        result["classes"] = labels.tolist()
+        result["cells"] = [[int(c // bins), int(c % bins)] + counts[c].tolist() for c in cells]
+    return result
+
+
+@lru_cache(maxsize=64)
+def load_plot_summary(data_key):
+    """
+    Compact summary of stored plot data (keys are content hashes, so results never go stale)
+
+    Args:
+        data_key (str): Key returned by plot_cache.save_plot_data
+
+    Returns:
+        dict: Summary of the descriptor plots or of the regression plot
+    """
+    df = columnar.read_dataset(plot_data_path(data_key))
+
+    if 'experimental' in df.columns:
+        residuals = (df['predicted'] - df['experimental']).to_numpy(dtype='float64')
+        return {
+            "type": "regression",
+            "count": len(df),
+            "meanAbsoluteError": round(float(np.abs(residuals).mean()), 4) if len(df) else None,
+            "scatter": scatter_summary(df['experimental'].to_numpy(), df['predicted'].to_numpy())
+        }
+
+    class_counts = df['class'].value_counts(sort=False)
+    return {
+        "type": "descriptors",
+        "count": len(df),
+        "classCounts": {str(cls): int(count) for cls, count in class_counts.items() if count},
+        "boxPlots": box_statistics(df),
+        "scatter": scatter_summary(df['MW'].to_numpy(), df['LogP'].to_numpy(), df['class'].to_numpy())
+    }
@@ -0,0 +1,59 @@
+#DrugPredict - Shared process pool
+#Substructure matching, plot rendering, hyperparameter tuning and activity-cliff
+#tiles run on one process pool per API process. Its workers are started by a
+#forkserver rather than forked from the multithreaded API process (job threads,
+#stage threads, the log listener and the warm-up scheduler may hold locks at any
+#moment), and its size is shared by all of them, so several gunicorn workers
+#together do not oversubscribe the CPUs.
+
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(__file__))
+import log_pipeline
+
+logger = logging.getLogger(__name__)
+
+# API processes sharing the machine (gunicorn's WEB_CONCURRENCY)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Worker processes of the pool (defaults to this process' share of the CPUs)
+PROCESS_WORKERS = int(os.getenv('DRUGPREDICT_PROCESS_WORKERS', 0)) or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+# How pool workers are started: 'forkserver' or 'spawn' ('fork' is unsafe in threaded processes)
+POOL_START_METHOD = os.getenv('DRUGPREDICT_POOL_START_METHOD', 'forkserver')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(logging_config):
+    """Log to the API's log file from the worker, without a listener thread"""
+    if logging_config:
+        log_pipeline.setup_logging(**logging_config, async_logging=False)
+
+
+def get_process_pool():
+    """
+    Get the process pool shared by the analysis modules of this process
+
+    Returns:
+        ProcessPoolExecutor: Pool with PROCESS_WORKERS workers
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(POOL_START_METHOD)
+            if POOL_START_METHOD == 'forkserver':
+                # Preloading makes the forkserver inherit sys.path, which the analysis
+                # modules extend to import their siblings by plain name
+                context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=context,
+                                        initializer=_init_worker,
+                                        initargs=(log_pipeline.logging_config(),))
+            logger.info(f"Started process pool with {PROCESS_WORKERS} workers ({POOL_START_METHOD})")
+        return _pool
@@ -0,0 +1,363 @@
+#DrugPredict - Tanimoto similarity search
+#Bit-packed Morgan fingerprints of every analysed compound are stored in an
+#append-only, memory-mapped index. Queries compute Tanimoto similarity with a
+#vectorized popcount and skip compounds whose bit count makes the requested
+#similarity impossible.
+
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from rdkit import Chem
+from rdkit.Chem import rdFingerprintGenerator
+
+logger = logging.getLogger(__name__)
+
+FP_BITS = 2048
+FP_BYTES = FP_BITS // 8
+MORGAN_RADIUS = 2
+
+# Number of candidate fingerprints scored per vectorized block
+SEARCH_BLOCK_SIZE = 65536
+
+# Maximum number of hits of one search
+MAX_SEARCH_K = 1000
+
+# Bit counts of every byte value, used when numpy has no bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+_morgan_generator = rdFingerprintGenerator.GetMorganGenerator(radius=MORGAN_RADIUS, fpSize=FP_BITS)
+
+
+def popcount_rows(packed):
+    """
+    Count the set bits of each row of a bit-packed fingerprint matrix
+
+    Args:
+        packed (np.ndarray): uint8 array of shape (n, FP_BYTES) or (FP_BYTES,)
+
+    Returns:
+        np.ndarray: Bit count per row (int64)
+    """
+    packed = np.ascontiguousarray(packed)
+    if packed.shape[-1] % 8 == 0:
+        # Count 64 bits at a time
+        packed = packed.view(np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(packed).sum(axis=-1, dtype=np.int64)
+    return _POPCOUNT_TABLE[packed.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def pack_fingerprint(mol):
+    """
+    Calculate the bit-packed Morgan fingerprint of a molecule
+
+    Args:
+        mol (rdkit.Chem.Mol): Molecule
+
+    Returns:
+        np.ndarray: uint8 array of FP_BYTES bytes
+    """
+    return np.packbits(_morgan_generator.GetFingerprintAsNumPy(mol))
+
+
+def fingerprint_smiles(smiles):
+    """
+    Calculate bit-packed fingerprints for a list of SMILES
+
+    Args:
+        smiles (iterable): SMILES strings
+
+    Returns:
+        tuple: (np.ndarray, np.ndarray) - (fingerprints of shape (n, FP_BYTES), boolean mask of parsed SMILES)
+    """
+    smiles = list(smiles)
+    fps = np.zeros((len(smiles), FP_BYTES), dtype=np.uint8)
+    valid = np.zeros(len(smiles), dtype=bool)
+    for i, smi in enumerate(smiles):
+        mol = Chem.MolFromSmiles(str(smi))
+        if mol is not None:
+            fps[i] = pack_fingerprint(mol)
+            valid[i] = True
+    return fps, valid
+
+
+def tanimoto_upper_bound(query_count, counts):
+    """
+    Upper bound of the Tanimoto similarity given only bit counts
+
+    Two fingerprints with a and b bits set share at most min(a, b) bits, so their
+    similarity can never exceed min(a, b) / max(a, b).
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    high = np.maximum(counts, query_count)
+    low = np.minimum(counts, query_count)
+    return np.divide(low, high, out=np.zeros_like(counts), where=high > 0)
+
+
+def tanimoto(query, query_count, fps, counts):
+    """
+    Tanimoto similarity of one packed fingerprint against a block of packed fingerprints
+
+    Returns:
+        np.ndarray: Similarities (float64)
+    """
+    common = popcount_rows(fps & query)
+    union = counts + query_count - common
+    return np.divide(common, union, out=np.zeros(len(common)), where=union > 0)
+
+
+class FingerprintIndex:
+    """
+    Append-only similarity index of analysed compounds
+
+    Layout of the index directory:
+        fingerprints.bin - packed fingerprints, FP_BYTES per compound
+        counts.bin       - uint16 bit count per compound (used for pruning)
+        compounds.db     - SQLite metadata (row -> molecule ID, SMILES, target)
+
+    Fingerprints are read through np.memmap, so only the pages touched by a query are
+    loaded and the index can grow well beyond available memory.
+
+    Compounds are appended to fingerprints.bin, then counts.bin, and their metadata is
+    committed last. counts.bin defines the number of rows: a fingerprint tail left by
+    an interrupted append is truncated before the next append (and when the index is
+    opened), so rows never shift against their metadata, and searches only score the
+    rows whose metadata is committed.
+    """
+
+    def __init__(self, index_dir=None):
+        if index_dir is None:
+            index_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'index', 'similarity')
+        self.index_dir = index_dir
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.fps_path = os.path.join(self.index_dir, 'fingerprints.bin')
+        self.counts_path = os.path.join(self.index_dir, 'counts.bin')
+        self.db_path = os.path.join(self.index_dir, 'compounds.db')
+        self.lock_path = os.path.join(self.index_dir, '.lock')
+        self._lock = threading.Lock()
+        self._mapped_size = -1
+        self._fps = None
+        self._counts = None
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS compounds ("
+                " row INTEGER PRIMARY KEY,"
+                " molecule_chembl_id TEXT UNIQUE,"
+                " smiles TEXT,"
+                " target_id TEXT)"
+            )
+
+        with self._lock, open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._connect() as conn:
+                self._repair(conn)
+
+    @contextmanager
+    def _connect(self):
+        """Metadata connection that is committed (or rolled back) and closed on exit"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _repair(self, conn):
+        """
+        Undo the parts of an interrupted append (call with the writer lock held)
+
+        Truncates fingerprint bytes beyond the rows of counts.bin and deletes metadata
+        of rows whose bit count was never written.
+        """
+        rows = len(self)
+        fps_size = rows * FP_BYTES
+        if os.path.exists(self.fps_path) and os.path.getsize(self.fps_path) > fps_size:
+            logger.warning(f"Truncating {os.path.getsize(self.fps_path) - fps_size} bytes of an interrupted "
+                           f"append from {self.fps_path}")
+            os.truncate(self.fps_path, fps_size)
+        if os.path.exists(self.counts_path) and os.path.getsize(self.counts_path) % 2:
+            os.truncate(self.counts_path, rows * 2)
+        deleted = conn.execute("DELETE FROM compounds WHERE row >= ?", (rows,)).rowcount
+        if deleted:
+            logger.warning(f"Removed {deleted} compounds without fingerprints from the similarity index")
+
+    def __len__(self):
+        if not os.path.exists(self.counts_path):
+            return 0
+        return os.path.getsize(self.counts_path) // 2
+
+    def _arrays(self):
+        """Memory-map the fingerprint and count files, remapping when the index has grown"""
+        size = len(self)
+        if size != self._mapped_size:
+            if size == 0:
+                self._fps = np.zeros((0, FP_BYTES), dtype=np.uint8)
+                self._counts = np.zeros(0, dtype=np.uint16)
+            else:
+                self._fps = np.memmap(self.fps_path, dtype=np.uint8, mode='r', shape=(size, FP_BYTES))
+                self._counts = np.memmap(self.counts_path, dtype=np.uint16, mode='r', shape=(size,))
+            self._mapped_size = size
+        return self._fps, self._counts
+
+    def add_compounds(self, df, target_id=None):
+        """
+        Add compounds to the index, skipping molecule IDs that are already indexed
+
+        Args:
+            df (pd.DataFrame): Data with molecule_chembl_id and canonical_smiles columns
+            target_id (str): ChemBL target the compounds were analysed for
+
+        Returns:
+            int: Number of compounds added
+        """
+        with self._lock, open(self.lock_path, 'w') as lock_file:
+            # Serialize writers across worker processes as well as threads
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            with self._connect() as conn:
+                known = set()
+                ids = df['molecule_chembl_id'].astype(str).unique().tolist()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = conn.execute(
+                        f"SELECT molecule_chembl_id FROM compounds WHERE molecule_chembl_id IN ({placeholders})",
+                        chunk
+                    )
+                    known.update(r[0] for r in rows)
+
+                new_df = df[~df['molecule_chembl_id'].astype(str).isin(known)]
+                new_df = new_df.drop_duplicates('molecule_chembl_id')
+                if new_df.empty:
+                    return 0
+
+                fps, valid = fingerprint_smiles(new_df['canonical_smiles'])
+                fps = fps[valid]
+                new_df = new_df[valid]
+                if new_df.empty:
+                    return 0
+
+                self._repair(conn)
+                start_row = len(self)
+                # Fingerprints, then counts (which define the rows), then metadata
+                for path, data in ((self.fps_path, fps), (self.counts_path, popcount_rows(fps).astype(np.uint16))):
+                    with open(path, 'ab') as f:
+                        f.write(data.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                conn.executemany(
+                    "INSERT INTO compounds (row, molecule_chembl_id, smiles, target_id) VALUES (?, ?, ?, ?)",
+                    [
+                        (start_row + i, str(mol_id), str(smi), target_id)
+                        for i, (mol_id, smi) in enumerate(zip(new_df['molecule_chembl_id'], new_df['canonical_smiles']))
+                    ]
+                )
+
+        logger.info(f"Added {len(new_df)} compounds to similarity index ({len(self)} total)")
+        return len(new_df)
+
+    def search(self, smiles, k=10, threshold=0.0):
+        """
+        Find the indexed compounds most similar to a query structure
+
+        Candidates are visited in order of decreasing bit-count bound; the search stops
+        as soon as no remaining candidate can beat the current k-th best similarity.
+
+        Args:
+            smiles (str): Query SMILES
+            k (int): Maximum number of hits, 1 to MAX_SEARCH_K (None for every hit above the threshold)
+            threshold (float): Minimum Tanimoto similarity
+
+        Returns:
+            list: Hits ({'id', 'smiles', 'targetId', 'similarity'}) sorted by similarity
+        """
+        if k is not None and not 1 <= k <= MAX_SEARCH_K:
+            raise ValueError(f"k must be between 1 and {MAX_SEARCH_K}")
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            raise ValueError(f"Invalid SMILES: {smiles}")
+
+        query = pack_fingerprint(mol)
+        query_count = int(popcount_rows(query))
+
+        # Rows are committed in order, after their fingerprints: only score committed rows,
+        # so rows of an append in progress never displace hits
+        with self._connect() as conn:
+            committed = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM compounds").fetchone()[0]
+        with self._lock:
+            fps, counts = self._arrays()
+        fps, counts = fps[:committed], counts[:committed]
+
+        bounds = tanimoto_upper_bound(query_count, counts)
+        candidates = np.flatnonzero(bounds >= threshold)
+        candidates = candidates[np.argsort(-bounds[candidates], kind='stable')]
+
+        hit_rows = np.zeros(0, dtype=np.int64)
+        hit_scores = np.zeros(0)
+        scored = 0
+
+        for start in range(0, len(candidates), SEARCH_BLOCK_SIZE):
+            block = candidates[start:start + SEARCH_BLOCK_SIZE]
+            if k is not None and len(hit_scores) >= k and bounds[block[0]] < hit_scores.min():
+                break
+            # Read rows in file order for sequential page access
+            block = np.sort(block)
+            scores = tanimoto(query, query_count, fps[block], counts[block].astype(np.int64))
+            scored += len(block)
+
+            keep = scores >= threshold
+            hit_rows = np.concatenate([hit_rows, block[keep]])
+            hit_scores = np.concatenate([hit_scores, scores[keep]])
+            if k is not None and len(hit_scores) > k:
+                top = np.argpartition(-hit_scores, k - 1)[:k]
+                hit_rows, hit_scores = hit_rows[top], hit_scores[top]
+
+        order = np.argsort(-hit_scores, kind='stable')
+        hit_rows, hit_scores = hit_rows[order], hit_scores[order]
+        logger.info(f"Similarity search scored {scored} of {len(counts)} compounds, {len(hit_rows)} hits")
+
+        metadata = {}
+        with self._connect() as conn:
+            rows = [int(r) for r in hit_rows]
+            for start in range(0, len(rows), 500):
+                chunk = rows[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for row in conn.execute(
+                    f"SELECT row, molecule_chembl_id, smiles, target_id FROM compounds WHERE row IN ({placeholders})",
+                    chunk
+                ):
+                    metadata[row[0]] = row[1:]
+
+        results = []
+        for row, score in zip(hit_rows, hit_scores):
+            if int(row) not in metadata:
+                # Removed by the repair of an interrupted append since the search started
+                continue
+            mol_id, smi, target_id = metadata[int(row)]
+            results.append({
+                "id": mol_id,
+                "smiles": smi,
+                "targetId": target_id,
+                "similarity": round(float(score), 4)
+            })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index():
+    """Get the shared similarity index of this process"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex()
+        return _index
@@ -0,0 +1,173 @@
+#DrugPredict - Pipeline stage scheduler
+#The analysis is a small dependency graph of stages. Stages whose inputs are ready
+#run at the same time in a thread pool (the heavy stages release the GIL or wait on
+#subprocesses), so the end-to-end time approaches the critical path.
+
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.append(os.path.dirname(__file__))
+from cancellation import TaskCancelled, CANCEL_POLL_INTERVAL, NEVER
+from log_pipeline import stage_counters
+
+logger = logging.getLogger(__name__)
+
+# Marker for the fallback of a stage that must not fail silently
+REQUIRED = object()
+
+
+class Stage:
+    """
+    One pipeline stage
+
+    Args:
+        name (str): Stage name (also the key of its result)
+        func (callable): Called with the results of the dependencies as keyword arguments
+        deps (list): Names of the stages whose results this stage needs
+        step (str): Progress step reported while the stage runs
+        message (str): Progress message reported while the stage runs
+        weight (float): Share of the total progress
+        fallback: Result used if the stage (or one of its dependencies) fails;
+            REQUIRED makes a failure abort the pipeline
+    """
+
+    def __init__(self, name, func, deps=(), step=None, message=None, weight=1.0, fallback=REQUIRED):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.step = step or name
+        self.message = message or f'Running {name}...'
+        self.weight = weight
+        self.fallback = fallback
+
+
+class StageFailed(Exception):
+    """A required stage failed"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def _check_graph(stages):
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in names]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+    # Kahn's algorithm: every stage must become ready at some point
+    remaining = {stage.name: set(stage.deps) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle among: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_graph(stages, tracker=None, progress_range=(10, 90), max_workers=4, cancel=None):
+    """
+    Run a graph of stages, starting every stage as soon as its dependencies are done
+
+    Progress is reported as one aggregate over all stages: each completed stage adds
+    its weight to the progress within progress_range. A failing stage with a fallback
+    only affects the stages that depend on it.
+
+    Events a stage counts with log_pipeline.count are logged as one line per stage.
+
+    The cancel token is checked before each stage starts and while stages run; a
+    cancelled task starts no further stages and raises TaskCancelled (never replaced
+    by a fallback) once the running stages have stopped at their own checks.
+
+    Args:
+        stages (list): Stage objects
+        tracker: Progress tracker with update(step, progress, message)
+        progress_range (tuple): Progress at the start and at the end of the graph
+        max_workers (int): Maximum number of stages running at once
+        cancel (CancelToken): Cancellation and deadline of the task
+
+    Returns:
+        tuple: (results by stage name, errors by stage name, run time in ms by stage name)
+    """
+    _check_graph(stages)
+    cancel = cancel or NEVER
+    by_name = {stage.name: stage for stage in stages}
+    total_weight = sum(stage.weight for stage in stages) or 1.0
+    start_progress, end_progress = progress_range
+
+    results = {}
+    errors = {}
+    timings = {}
+    pending = dict(by_name)
+    running = {}
+    done_weight = 0.0
+    lock = threading.Lock()
+
+    def progress():
+        return int(start_progress + (end_progress - start_progress) * done_weight / total_weight)
+
+    def execute(stage, inputs):
+        with lock:
+            if tracker:
+                tracker.update(stage.step, progress(), stage.message)
+        started = time.perf_counter()
+        try:
+            with stage_counters(stage.name):
+                return stage.func(**inputs)
+        finally:
+            timings[stage.name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def fail(stage, error):
+        if isinstance(error, TaskCancelled):
+            raise error
+        if stage.fallback is REQUIRED:
+            raise StageFailed(stage.name, error)
+        logger.error(f"Stage '{stage.name}' failed, continuing with fallback: {error}")
+        errors[stage.name] = str(error)
+        results[stage.name] = stage.fallback
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage') as pool:
+        try:
+            while pending or running:
+                cancel.check()
+                # Start every stage whose dependencies are finished
+                for name, stage in list(pending.items()):
+                    if not all(dep in results for dep in stage.deps):
+                        continue
+                    del pending[name]
+                    failed_deps = [dep for dep in stage.deps if dep in errors]
+                    if failed_deps:
+                        fail(stage, f"dependency failed: {', '.join(failed_deps)}")
+                        done_weight += stage.weight
+                        continue
+                    inputs = {dep: results[dep] for dep in stage.deps}
+                    running[pool.submit(execute, stage, inputs)] = stage
+
+                if not running:
+                    continue
+
+                finished, _ = wait(list(running), timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        results[stage.name] = future.result()
+                    except Exception as e:
+                        fail(stage, e)
+                    with lock:
+                        done_weight += stage.weight
+        except (StageFailed, TaskCancelled):
+            # Let running stages finish before reporting the failure
+            for future in running:
+                future.cancel()
+            raise
+
+    logger.info("Stage times: " + ", ".join(f"{name}={ms:.0f}ms" for name, ms in timings.items()))
+    return results, errors, timings
@@ -0,0 +1,171 @@
+#DrugPredict - Structure standardization
+#Maps every input SMILES to the canonical SMILES of its neutral parent structure,
+#so salt forms and differently written duplicates collapse into one row before
+#descriptors and fingerprints are calculated.
+
+import logging
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from rdkit import Chem, RDLogger
+from rdkit.Chem.MolStandardize import rdMolStandardize
+
+sys.path.append(os.path.dirname(__file__))
+from log_pipeline import count
+
+logger = logging.getLogger(__name__)
+
+# Number of input SMILES whose parent structure is kept in memory
+STANDARDIZE_CACHE_SIZE = 200000
+
+_uncharger = rdMolStandardize.Uncharger()
+
+# RDKit reports every unparsable structure on stderr, while the pipeline counts them
+# (see count). Its log is process-wide, so it is disabled once here: toggling it around
+# a call would also silence or re-enable it for the stages running in other threads.
+RDLogger.DisableLog('rdApp.*')
+
+
+@lru_cache(maxsize=STANDARDIZE_CACHE_SIZE)
+def standardize_smiles(smiles):
+    """
+    Canonical SMILES of the neutral parent structure of a molecule
+
+    Keeps the largest organic fragment (strips salts and solvents), neutralizes charges
+    and writes canonical isomeric SMILES. Results are cached by input SMILES.
+
+    Args:
+        smiles (str): Input SMILES
+
+    Returns:
+        str: Parent canonical SMILES, or None if the SMILES cannot be parsed
+    """
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    try:
+        parent = _uncharger.uncharge(rdMolStandardize.FragmentParent(mol))
+        return Chem.MolToSmiles(parent)
+    except Exception:
+        return None
+
+
+def parent_lookup(input_smiles):
+    """
+    Parent structures of distinct input SMILES
+
+    Args:
+        input_smiles (pd.Series): Distinct input SMILES
+
+    Returns:
+        pd.Series: Parent canonical SMILES (None if unparsable) indexed by input SMILES
+    """
+    parents = input_smiles.map(lambda smi: standardize_smiles(str(smi)))
+
+    failed = int(parents.isna().sum())
+    count('unparsable_structures', failed, f"Could not standardize {failed} structures", logger)
+    return pd.Series(parents.to_numpy(), index=input_smiles.to_numpy(), dtype=object)
+
+
+def parent_aggregates(df, row_offset=0, parents=None):
+    """
+    Partial aggregates of activity records per parent structure
+
+    Each distinct input SMILES is standardized once. The aggregates of separately
+    processed chunks can be combined with merge_parent_aggregates, so the records
+    never have to be in memory at the same time.
+
+    Args:
+        df (pd.DataFrame): Records with molecule_chembl_id, canonical_smiles and standard_value (nM)
+        row_offset (int): Position of the first record in the whole dataset
+        parents (pd.Series): Parent structures of the input SMILES (from parent_lookup);
+            standardized here if not given
+
+    Returns:
+        pd.DataFrame: parent_smiles, first_row, molecule_chembl_id (of the first record),
+            log_ic50_sum and n_measurements per parent structure
+    """
+    if parents is None:
+        parents = parent_lookup(pd.Series(df['canonical_smiles'].unique()))
+
+    values = df['standard_value'].to_numpy(dtype='float64')
+    records = pd.DataFrame({
+        'parent_smiles': df['canonical_smiles'].map(parents).to_numpy(),
+        'row': np.arange(row_offset, row_offset + len(df)),
+        'molecule_chembl_id': df['molecule_chembl_id'].to_numpy(),
+        'log_ic50': np.log10(np.where(values > 0, values, np.nan))
+    }).dropna(subset=['parent_smiles', 'log_ic50'])
+
+    return records.groupby('parent_smiles', sort=False, as_index=False).agg(
+        first_row=('row', 'first'),
+        molecule_chembl_id=('molecule_chembl_id', 'first'),
+        log_ic50_sum=('log_ic50', 'sum'),
+        n_measurements=('log_ic50', 'size')
+    )
+
+
+def merge_parent_aggregates(partials):
+    """
+    Combine partial aggregates of the same or of different chunks
+
+    Args:
+        partials (pd.DataFrame): Concatenated output of parent_aggregates
+
+    Returns:
+        pd.DataFrame: One row per parent structure, in order of first appearance
+    """
+    partials = partials.sort_values('first_row', kind='stable')
+    return partials.groupby('parent_smiles', sort=False, as_index=False).agg(
+        first_row=('first_row', 'first'),
+        molecule_chembl_id=('molecule_chembl_id', 'first'),
+        log_ic50_sum=('log_ic50_sum', 'sum'),
+        n_measurements=('n_measurements', 'sum')
+    )
+
+
+def finalize_parents(aggregates):
+    """
+    Activity records of the parent structures from merged aggregates
+
+    Replicate IC50 measurements are combined as their geometric mean (the mean in log
+    space, i.e. the mean pIC50).
+
+    Returns:
+        pd.DataFrame: molecule_chembl_id, canonical_smiles, standard_value and n_measurements
+    """
+    return pd.DataFrame({
+        'molecule_chembl_id': pd.array(aggregates['molecule_chembl_id'].to_numpy(), dtype='string[pyarrow]'),
+        'canonical_smiles': pd.array(aggregates['parent_smiles'].to_numpy(), dtype='string[pyarrow]'),
+        'standard_value': np.power(10.0, (aggregates['log_ic50_sum'] / aggregates['n_measurements']).to_numpy()
+                                   ).astype('float32'),
+        'n_measurements': np.minimum(aggregates['n_measurements'].to_numpy(), np.iinfo('int16').max).astype('int16')
+    })
+
+
+def standardize_structures(df):
+    """
+    Deduplicate activity records on their parent structure
+
+    Replicate measurements of the same parent are aggregated (see finalize_parents);
+    the first molecule ID is kept as representative.
+
+    Args:
+        df (pd.DataFrame): Records with molecule_chembl_id, canonical_smiles and standard_value (nM)
+
+    Returns:
+        pd.DataFrame: One row per parent structure with an additional n_measurements column
+    """
+    logger.info("Standardizing structures...")
+    initial_count = len(df)
+
+    result_df = finalize_parents(merge_parent_aggregates(parent_aggregates(df)))
+
+    if result_df.empty:
+        raise ValueError("No compounds remaining after structure standardization")
+
+    logger.info(f"Standardization complete: {initial_count} records → {len(result_df)} unique structures "
+                f"({df['canonical_smiles'].nunique()} distinct input SMILES)")
+    return result_df
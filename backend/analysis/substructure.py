@@ -0,0 +1,241 @@
+#DrugPredict - Substructure search within an analysed target
+#Candidates are screened with pattern fingerprints (a compound can only contain
+#the query if its fingerprint is a bit superset of the query fingerprint) before
+#exact RDKit matching runs on the survivors in a process pool.
+
+import logging
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+from rdkit import Chem, DataStructs
+
+sys.path.append(os.path.dirname(__file__))
+import target_store
+import columnar
+from process_pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+PATTERN_FP_BITS = 2048
+
+# Survivor counts below this are matched inline instead of in the process pool
+PARALLEL_MATCH_THRESHOLD = 2000
+MATCH_CHUNK_SIZE = 1000
+
+# Number of target indexes kept in memory
+INDEX_CACHE_SIZE = 8
+
+# Largest number of matches returned by one search
+MAX_SEARCH_RESULTS = 1000
+
+PATTERN_FP_FILE = 'pattern_fps.npy'
+MOLECULES_FILE = 'molecules.pkl'
+INDEX_META_FILE = 'substructure_meta.pkl'
+
+
+def pattern_fingerprint(mol):
+    """
+    Calculate the bit-packed pattern fingerprint of a molecule or query
+
+    Returns:
+        np.ndarray: uint8 array of PATTERN_FP_BITS // 8 bytes
+    """
+    bits = np.zeros(PATTERN_FP_BITS, dtype=np.uint8)
+    DataStructs.ConvertToNumpyArray(Chem.PatternFingerprint(mol, fpSize=PATTERN_FP_BITS), bits)
+    return np.packbits(bits)
+
+
+def screen_superset(fps, query_fp):
+    """
+    Vectorized superset test: rows whose fingerprint contains every bit of the query
+
+    Args:
+        fps (np.ndarray): Packed fingerprints of shape (n, PATTERN_FP_BITS // 8)
+        query_fp (np.ndarray): Packed query fingerprint
+
+    Returns:
+        np.ndarray: Indices of rows passing the screen
+    """
+    fps = np.ascontiguousarray(fps).view(np.uint64)
+    query = np.ascontiguousarray(query_fp).view(np.uint64)
+    return np.flatnonzero(((fps & query) == query).all(axis=1))
+
+
+@lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _load_molecules(molecules_path, version):
+    """Load the pickled molecules of a target once per process (when the first search runs)"""
+    with open(molecules_path, 'rb') as f:
+        stored = pickle.load(f)
+    if stored['version'] != version:
+        raise ValueError("The substructure index was rebuilt during the search, please retry")
+    return stored['mols']
+
+
+def _match_chunk(molecules_path, version, smarts, rows):
+    """Exact substructure matching of one chunk of survivors (runs in pool workers)"""
+    mols = _load_molecules(molecules_path, version)
+    query = Chem.MolFromSmarts(smarts)
+    return [row for row in rows if Chem.Mol(mols[row]).HasSubstructMatch(query)]
+
+
+class SubstructureIndex:
+    """
+    Screening index of the processed dataset of one target
+
+    The index keeps packed pattern fingerprints (pattern_fps.npy, memory-mapped) and
+    the RDKit molecules in binary form (molecules.pkl) next to the target dataset, so
+    SMILES are parsed once per dataset version instead of once per query. The dataset
+    version and the compound metadata are in a small sidecar (substructure_meta.pkl),
+    so opening an index does not unpickle the molecules.
+    """
+
+    def __init__(self, target_id):
+        self.target_id = target_id.upper()
+        self.target_dir = target_store.get_target_directory(self.target_id, create=False)
+        self.dataset_path = os.path.join(self.target_dir, target_store.DATASET_FILE)
+        self.fps_path = os.path.join(self.target_dir, PATTERN_FP_FILE)
+        self.molecules_path = os.path.join(self.target_dir, MOLECULES_FILE)
+        self.meta_path = os.path.join(self.target_dir, INDEX_META_FILE)
+
+        if not os.path.exists(self.dataset_path):
+            raise FileNotFoundError(f"No analysed dataset for target: {self.target_id}")
+
+        stat = os.stat(self.dataset_path)
+        self.version = f"{stat.st_mtime_ns}-{stat.st_size}"
+
+        if not self._load():
+            self._build()
+            self._load()
+
+    def _load(self):
+        if not all(os.path.exists(path) for path in (self.fps_path, self.molecules_path, self.meta_path)):
+            return False
+        with open(self.meta_path, 'rb') as f:
+            stored = pickle.load(f)
+        if stored.get('version') != self.version:
+            return False
+        self.metadata = stored['metadata']
+        self.fps = np.load(self.fps_path, mmap_mode='r')
+        return True
+
+    def _build(self):
+        logger.info(f"Building substructure index for {self.target_id}...")
+        df = columnar.read_dataset(self.dataset_path)
+
+        fps = np.zeros((len(df), PATTERN_FP_BITS // 8), dtype=np.uint8)
+        mols = []
+        for i, smiles in enumerate(df['canonical_smiles']):
+            mol = Chem.MolFromSmiles(str(smiles))
+            if mol is None:
+                mol = Chem.Mol()
+            else:
+                fps[i] = pattern_fingerprint(mol)
+            mols.append(mol.ToBinary())
+
+        metadata = df[[c for c in ['molecule_chembl_id', 'canonical_smiles', 'class', 'pIC50'] if c in df.columns]]
+
+        # Replace files atomically; other processes may have the old version mapped
+        def write_fps(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.save(f, fps)
+
+        def write_pickle(content):
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+            return write
+
+        # The sidecar is written last and marks the index of this version complete
+        columnar.replace_atomically(self.fps_path, write_fps)
+        columnar.replace_atomically(self.molecules_path, write_pickle({'version': self.version, 'mols': mols}))
+        columnar.replace_atomically(self.meta_path, write_pickle({'version': self.version, 'metadata': metadata}))
+        logger.info(f"Substructure index built for {len(df)} compounds")
+
+    def search(self, smarts, bioactivity_class=None, max_results=None):
+        """
+        Find compounds of the target containing a SMARTS pattern
+
+        Args:
+            smarts (str): Query SMARTS
+            bioactivity_class (str): Only return compounds of this class (e.g. 'active')
+            max_results (int): Maximum number of matches returned (1 to MAX_SEARCH_RESULTS)
+
+        Returns:
+            dict: Matches and screening statistics
+        """
+        if max_results is not None and not 1 <= max_results <= MAX_SEARCH_RESULTS:
+            raise ValueError(f"max_results must be between 1 and {MAX_SEARCH_RESULTS}")
+        query = Chem.MolFromSmarts(smarts)
+        if query is None:
+            raise ValueError(f"Invalid SMARTS: {smarts}")
+        query.UpdatePropertyCache(strict=False)
+
+        candidates = screen_superset(self.fps, pattern_fingerprint(query))
+        if bioactivity_class and 'class' in self.metadata.columns:
+            in_class = (self.metadata['class'].to_numpy() == bioactivity_class)
+            candidates = candidates[in_class[candidates]]
+
+        rows = candidates.tolist()
+        if len(rows) < PARALLEL_MATCH_THRESHOLD:
+            matches = _match_chunk(self.molecules_path, self.version, smarts, rows)
+        else:
+            pool = get_process_pool()
+            futures = [
+                pool.submit(_match_chunk, self.molecules_path, self.version, smarts, rows[i:i + MATCH_CHUNK_SIZE])
+                for i in range(0, len(rows), MATCH_CHUNK_SIZE)
+            ]
+            matches = [row for future in futures for row in future.result()]
+
+        logger.info(f"Substructure search on {self.target_id}: {len(self.metadata)} compounds, "
+                    f"{len(rows)} passed screen, {len(matches)} matched")
+
+        matched = self.metadata.iloc[matches]
+        total_matches = len(matched)
+        if max_results:
+            matched = matched.head(max_results)
+
+        compounds = []
+        for _, row in matched.iterrows():
+            compound = {
+                "id": row['molecule_chembl_id'],
+                "smiles": row['canonical_smiles']
+            }
+            if 'class' in row:
+                compound["classification"] = row['class']
+            if 'pIC50' in row:
+                compound["pic50"] = float(row['pIC50'])
+            compounds.append(compound)
+
+        return {
+            "totalCompounds": len(self.metadata),
+            "screenedCandidates": len(rows),
+            "totalMatches": total_matches,
+            "compounds": compounds
+        }
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_substructure_index(target_id):
+    """Get the substructure index of a target, rebuilding it when the dataset has changed"""
+    target_id = target_id.upper()
+    with _indexes_lock:
+        index = _indexes.get(target_id)
+        if index is not None:
+            stat = os.stat(index.dataset_path)
+            if f"{stat.st_mtime_ns}-{stat.st_size}" == index.version:
+                _indexes.move_to_end(target_id)
+                return index
+
+        index = SubstructureIndex(target_id)
+        _indexes[target_id] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+        return index
@@ -0,0 +1,261 @@
+#DrugPredict - Per-target dataset store
+#Keeps the activities, descriptors and processed dataset of each analysed target
+#on disk together with an activity watermark, so a target can be refreshed
+#incrementally instead of re-downloading every record from ChemBL.
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.dirname(__file__))
+import columnar
+
+logger = logging.getLogger(__name__)
+
+# Columns kept from the raw ChemBL activity records
+ACTIVITY_COLUMNS = ['activity_id', 'molecule_chembl_id', 'canonical_smiles', 'standard_value']
+
+# Columns of the per-structure descriptor cache
+DESCRIPTOR_COLUMNS = ['canonical_smiles', 'MW', 'LogP', 'NumHDonors', 'NumHAcceptors']
+
+# Columns of the per-structure cache of standardized parent structures
+PARENT_COLUMNS = ['canonical_smiles', 'parent_smiles']
+
+# Activities, descriptors and parents are stored as Parquet part files; every sync adds a part
+ACTIVITIES_DIR = 'activities'
+DESCRIPTORS_DIR = 'descriptors'
+PARENTS_DIR = 'parents'
+DATASET_FILE = 'bioactivity_final.parquet'
+PARENT_AGGREGATES_FILE = 'parent_aggregates.parquet'
+WATERMARK_FILE = 'watermark.json'
+LOCK_FILE = '.lock'
+
+
+def get_target_directory(target_id, create=True):
+    """
+    Get the storage directory for a target
+
+    Args:
+        target_id (str): ChemBL target ID
+        create (bool): Create the directory if it does not exist
+
+    Returns:
+        str: Path to the target directory
+    """
+    target_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed',
+                              'targets', target_id.upper())
+    if create:
+        os.makedirs(target_dir, exist_ok=True)
+    return target_dir
+
+
+@contextmanager
+def target_lock(target_id):
+    """Hold the lock of a target's store across processes (for read-modify-write updates)"""
+    with open(os.path.join(get_target_directory(target_id), LOCK_FILE), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _write_part(target_id, subdir, df):
+    """
+    Write a new Parquet part file into a store directory of a target
+
+    Part names start with the write time, so they sort in write order, and end with a
+    random suffix, so concurrent writers never replace each other's parts.
+    """
+    part_dir = os.path.join(get_target_directory(target_id), subdir)
+    os.makedirs(part_dir, exist_ok=True)
+    columnar.write_dataset(df, os.path.join(part_dir, f'part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet'))
+
+
+def _read_parts(target_id, subdir, columns):
+    part_dir = os.path.join(get_target_directory(target_id, create=False), subdir)
+    parts = sorted(glob.glob(os.path.join(part_dir, 'part-*.parquet')))
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat([columnar.read_dataset(p) for p in parts], ignore_index=True)
+
+
+def load_watermark(target_id):
+    """
+    Load the activity watermark recorded for a target
+
+    Args:
+        target_id (str): ChemBL target ID
+
+    Returns:
+        dict: Watermark ({'maxActivityId', 'activityCount', 'updated'}) or None if the target was never synced
+    """
+    path = os.path.join(get_target_directory(target_id, create=False), WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable watermark for {target_id}: {str(e)}")
+        return None
+
+
+def save_watermark(target_id, max_activity_id, activity_count):
+    """Record the highest activity ID stored for a target"""
+    watermark = {
+        "targetId": target_id.upper(),
+        "maxActivityId": int(max_activity_id),
+        "activityCount": int(activity_count),
+        "updated": datetime.now().isoformat()
+    }
+    path = os.path.join(get_target_directory(target_id), WATERMARK_FILE)
+    def write(tmp_path):
+        with open(tmp_path, 'w') as f:
+            json.dump(watermark, f)
+
+    columnar.replace_atomically(path, write)
+    return watermark
+
+
+def load_activities(target_id):
+    """
+    Load the stored activity records of a target
+
+    Returns:
+        pd.DataFrame: Stored activities (empty if nothing is stored yet)
+    """
+    df = _read_parts(target_id, ACTIVITIES_DIR, ACTIVITY_COLUMNS)
+    # Parts written before values were stored as float32 hold strings
+    df['standard_value'] = pd.to_numeric(df['standard_value'], errors='coerce').astype('float32')
+    return df
+
+
+def merge_activities(target_id, df_new):
+    """
+    Merge newly fetched activity records into the stored activities and advance the watermark
+
+    Records are keyed by activity_id, so re-fetching an overlapping page never duplicates rows.
+    The merge holds the target's lock, so concurrent refreshes of a target add each
+    record once.
+
+    Args:
+        target_id (str): ChemBL target ID
+        df_new (pd.DataFrame): Activity records fetched since the last watermark
+
+    Returns:
+        tuple: (pd.DataFrame, int) - (all stored activities, number of new records)
+    """
+    with target_lock(target_id):
+        df_stored = load_activities(target_id)
+
+        if df_new is None or df_new.empty:
+            return df_stored, 0
+
+        df_new = df_new[[c for c in ACTIVITY_COLUMNS if c in df_new.columns]].copy()
+        df_new['activity_id'] = df_new['activity_id'].astype('int64')
+        df_new['standard_value'] = pd.to_numeric(df_new['standard_value'], errors='coerce').astype('float32')
+        df_new = df_new[~df_new['activity_id'].isin(df_stored['activity_id'])]
+        new_count = len(df_new)
+
+        if new_count == 0:
+            return df_stored, 0
+
+        df_all = pd.concat([df_stored, df_new], ignore_index=True)
+        df_all['activity_id'] = df_all['activity_id'].astype('int64')
+
+        # Write only the delta as a new part instead of rewriting the stored activities
+        _write_part(target_id, ACTIVITIES_DIR, df_new)
+
+        save_watermark(target_id, df_all['activity_id'].max(), len(df_all))
+        logger.info(f"Merged {new_count} new activities for {target_id} ({len(df_all)} stored)")
+        return df_all, new_count
+
+
+def load_descriptor_cache(target_id):
+    """
+    Load the per-structure descriptor cache of a target
+
+    Returns:
+        pd.DataFrame: Cached descriptors indexed by canonical SMILES
+    """
+    df = _read_parts(target_id, DESCRIPTORS_DIR, DESCRIPTOR_COLUMNS)
+    return df.drop_duplicates('canonical_smiles').set_index('canonical_smiles')
+
+
+def append_descriptor_cache(target_id, df_descriptors):
+    """Append descriptors of newly seen structures to the cache of a target"""
+    if df_descriptors.empty:
+        return
+    df_descriptors = df_descriptors.reset_index()[DESCRIPTOR_COLUMNS]
+    # float32 for every column so failed structures can be cached as NaN
+    df_descriptors = df_descriptors.astype({c: 'float32' for c in DESCRIPTOR_COLUMNS[1:]})
+    _write_part(target_id, DESCRIPTORS_DIR, df_descriptors)
+
+
+def load_parent_cache(target_id):
+    """
+    Load the cache of standardized parent structures of a target
+
+    Returns:
+        pd.Series: Parent SMILES (None for unparsable structures) indexed by input SMILES
+    """
+    df = _read_parts(target_id, PARENTS_DIR, PARENT_COLUMNS).drop_duplicates('canonical_smiles')
+    return pd.Series(df['parent_smiles'].to_numpy(), index=df['canonical_smiles'].to_numpy(), dtype=object)
+
+
+def append_parent_cache(target_id, parents):
+    """Append the parent structures of newly seen input SMILES to the cache of a target"""
+    if parents.empty:
+        return
+    _write_part(target_id, PARENTS_DIR, pd.DataFrame({
+        'canonical_smiles': parents.index.astype(str),
+        'parent_smiles': parents.to_numpy(dtype=object)
+    }))
+
+
+def load_parent_aggregates(target_id):
+    """
+    Load the per-parent aggregates of the stored activities of a target
+
+    Returns:
+        tuple: (pd.DataFrame, int) - (aggregates from standardize.parent_aggregates, number of
+               stored activity records they cover), or (None, 0) if none were saved
+    """
+    path = os.path.join(get_target_directory(target_id, create=False), PARENT_AGGREGATES_FILE)
+    if not os.path.exists(path):
+        return None, 0
+    try:
+        table = pq.read_table(path)
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f"Ignoring unreadable parent aggregates for {target_id}: {str(e)}")
+        return None, 0
+    return table.to_pandas(), int(table.schema.metadata[b'activity_rows'])
+
+
+def save_parent_aggregates(target_id, aggregates, activity_rows):
+    """Save the per-parent aggregates of the first activity_rows stored activities of a target"""
+    table = pa.Table.from_pandas(aggregates, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'activity_rows': str(int(activity_rows)).encode()})
+    path = os.path.join(get_target_directory(target_id), PARENT_AGGREGATES_FILE)
+    columnar.replace_atomically(path, lambda tmp: pq.write_table(table, tmp, compression=columnar.PARQUET_COMPRESSION))
+
+
+def save_dataset(target_id, df_final):
+    """
+    Save the processed dataset of a target
+
+    Returns:
+        str: Path of the saved dataset
+    """
+    path = os.path.join(get_target_directory(target_id), DATASET_FILE)
+    return columnar.write_dataset(df_final, path)
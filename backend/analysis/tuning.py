@@ -0,0 +1,188 @@
+#DrugPredict - Random Forest hyperparameter search
+#Successive halving: many configurations are trained with few trees, and only the
+#best third is re-trained with three times as many trees in the next rung. The
+#candidates of a rung are trained in a process pool on one shared, memory-mapped
+#copy of the training features, and the search stops at a wall-clock budget: the
+#forests are grown a few trees at a time, so candidates still running when the search
+#ends stop within one batch of trees and give their pool workers back.
+
+import itertools
+import logging
+import os
+import sys
+import time
+from concurrent.futures import wait
+from functools import lru_cache
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+sys.path.append(os.path.dirname(__file__))
+from cancellation import CANCEL_POLL_INTERVAL, NEVER, StopFlag
+from process_pool import get_process_pool
+
+logger = logging.getLogger(__name__)
+
+# Hyperparameters searched (every combination is a candidate)
+SEARCH_SPACE = {
+    "max_depth": [None, 8, 16, 32],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": [1.0, 'sqrt', 0.3]
+}
+
+# Trees per candidate in the first rung; each rung multiplies trees by ETA and keeps 1/ETA
+MIN_ESTIMATORS = 25
+MAX_ESTIMATORS = 400
+ETA = 3
+
+# Share of the training set held out to score candidates
+VALIDATION_FRACTION = 0.2
+
+# Trees grown between checks of the stop flag
+TREES_PER_CHECK = 5
+
+def candidate_configs(space=SEARCH_SPACE):
+    """All combinations of the search space as parameter dicts"""
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+@lru_cache(maxsize=4)
+def _load_split(split_dir):
+    """Memory-map the shared training/validation arrays (once per worker process)"""
+    return tuple(np.load(os.path.join(split_dir, f'{name}.npy'), mmap_mode='r')
+                 for name in ('X_fit', 'y_fit', 'X_val', 'y_val'))
+
+
+def _score_candidate(split_dir, config, n_estimators, random_state, flag):
+    """
+    Train one candidate and return its validation R² (runs in a worker process)
+
+    The forest is grown TREES_PER_CHECK trees at a time (warm start gives the same
+    trees as a single fit) and abandoned once the search stopped its flag.
+
+    Returns:
+        tuple: (validation R², fit seconds), or None if the search stopped
+    """
+    X_fit, y_fit, X_val, y_val = _load_split(split_dir)
+    start = time.perf_counter()
+    model = RandomForestRegressor(random_state=random_state, n_jobs=1, warm_start=True, **config)
+    for trees in range(TREES_PER_CHECK, n_estimators + TREES_PER_CHECK, TREES_PER_CHECK):
+        if flag.stopped():
+            return None
+        model.set_params(n_estimators=min(trees, n_estimators))
+        model.fit(X_fit, y_fit)
+    return model.score(X_val, y_val), time.perf_counter() - start
+
+
+def _wait_rung(futures, deadline, cancel):
+    """
+    Wait for the candidates of a rung until the deadline
+
+    On cancellation the queued candidates are dropped and TaskCancelled is raised;
+    running ones stop when successive_halving stops its flag.
+    """
+    while True:
+        done, not_done = wait(futures, timeout=min(max(deadline - time.perf_counter(), 0), CANCEL_POLL_INTERVAL))
+        if not not_done or time.perf_counter() >= deadline:
+            return done, not_done
+        if cancel.reason:
+            for future in not_done:
+                future.cancel()
+            cancel.check()
+
+
+def successive_halving(X, y, work_dir, budget_seconds=120, random_state=42, space=SEARCH_SPACE, cancel=NEVER):
+    """
+    Search Random Forest hyperparameters with successive halving
+
+    The features are written once to work_dir and memory-mapped by every worker.
+    Rungs are started as long as the budget allows; candidates still running at the
+    deadline (or on cancellation) are stopped and the best candidate of the last
+    finished rung wins.
+
+    Args:
+        X (np.ndarray): Training features
+        y (np.ndarray): Training targets
+        work_dir (str): Directory for the shared arrays
+        budget_seconds (float): Wall-clock budget of the search
+        random_state (int): Seed for the validation split and the forests
+        space (dict): Values searched per hyperparameter
+        cancel (CancelToken): Cancellation of the task, checked while a rung runs
+
+    Returns:
+        tuple: (best parameters incl. n_estimators, search report for modelInfo)
+    """
+    start = time.perf_counter()
+    deadline = start + budget_seconds
+
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        np.asarray(X, dtype='float32'), np.asarray(y, dtype='float32'),
+        test_size=VALIDATION_FRACTION, random_state=random_state)
+    split_dir = os.path.join(work_dir, 'tuning')
+    os.makedirs(split_dir, exist_ok=True)
+    for name, array in (('X_fit', X_fit), ('y_fit', y_fit), ('X_val', X_val), ('y_val', y_val)):
+        np.save(os.path.join(split_dir, f'{name}.npy'), np.ascontiguousarray(array))
+
+    candidates = candidate_configs(space)
+    n_estimators = MIN_ESTIMATORS
+    best = None
+    rungs = []
+    budget_exhausted = False
+    pool = get_process_pool()
+    flag = StopFlag(split_dir)
+
+    try:
+        while candidates:
+            rung_start = time.perf_counter()
+            futures = {pool.submit(_score_candidate, split_dir, config, n_estimators, random_state, flag): i
+                       for i, config in enumerate(candidates)}
+            done, not_done = _wait_rung(futures, deadline, cancel)
+            for future in not_done:
+                future.cancel()
+
+            scored = []
+            for future in done:
+                try:
+                    score, fit_seconds = future.result()
+                except Exception as e:
+                    logger.warning(f"Tuning candidate failed: {str(e)}")
+                    continue
+                scored.append((score, fit_seconds, candidates[futures[future]]))
+
+            if not_done:
+                # Incomplete rung: only a complete rung ranks its candidates fairly
+                budget_exhausted = True
+                logger.info(f"Tuning budget of {budget_seconds}s reached during rung with {n_estimators} trees")
+                break
+
+            scored.sort(key=lambda item: item[0], reverse=True)
+            best = dict(scored[0][2], n_estimators=n_estimators) if scored else best
+            rungs.append({
+                "nEstimators": n_estimators,
+                "candidates": len(candidates),
+                "bestScore": round(float(scored[0][0]), 4) if scored else None,
+                "meanFitSeconds": round(float(np.mean([s[1] for s in scored])), 3) if scored else None,
+                "seconds": round(time.perf_counter() - rung_start, 2)
+            })
+
+            if len(scored) <= 1 or n_estimators * ETA > MAX_ESTIMATORS:
+                break
+            candidates = [config for _, _, config in scored[:max(1, len(scored) // ETA)]]
+            n_estimators *= ETA
+    finally:
+        # Candidates still running stop at their next batch of trees
+        flag.stop()
+
+    report = {
+        "method": "successive halving",
+        "candidates": len(candidate_configs(space)),
+        "rungs": rungs,
+        "searchSeconds": round(time.perf_counter() - start, 2),
+        "budgetSeconds": budget_seconds,
+        "budgetExhausted": budget_exhausted,
+        "bestParams": best
+    }
+    logger.info(f"Tuning finished in {report['searchSeconds']}s: {best}")
+    return best, report
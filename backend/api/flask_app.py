@@ -1,14 +1,17 @@
-from flask import Flask, request, jsonify, Response, send_file
+import time
+_boot_start = time.perf_counter()
+
+from flask import Flask, Blueprint, current_app, request, jsonify, Response, send_file, stream_with_context
+from werkzeug.utils import secure_filename
 from flask_cors import CORS
+import importlib
 import logging
-import pandas as pd
-import numpy as np
 import os
 import json
-import time
 from datetime import datetime
 import traceback
 import threading
+import uuid
 from queue import Queue
 
 # Import your analysis functions
@@ -16,110 +19,496 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from backend.analysis.main import (
-    run_complete_analysis_pipeline
-)
+from backend.api.task_store import create_task_store, COMPLETE, CANCELLED, RUNNING, TASK_HEARTBEAT_SECONDS
+from backend.api import warmup
+from backend.analysis.artifacts import content_hash
+from backend.analysis.log_pipeline import setup_logging
+
+# The analysis stack (RDKit, scikit-learn, scipy, seaborn, matplotlib) takes seconds
+# to import, so it is loaded on first use instead of at boot. The ChemBL client is not
+# part of it: importing it fetches the service description over the network, so
+# data_sources.ChemblWebSource imports it on its first query (never with the local source).
+# DRUGPREDICT_STARTUP_MODE: 'lazy' (default) defers the imports until the first analysis,
+# 'warm' starts a background thread that imports them right after boot,
+# 'eager' imports them before the app starts serving.
+STARTUP_MODE = os.getenv('DRUGPREDICT_STARTUP_MODE', 'lazy').lower()
+
+# Imported in this order so each timing only covers the module's own cost
+ANALYSIS_MODULES = [
+    'numpy',
+    'pandas',
+    'pyarrow',
+    'scipy.stats',
+    'sklearn.ensemble',
+    'rdkit.Chem',
+    'matplotlib',
+    'seaborn',
+    'backend.analysis.data_sources',
+    'backend.analysis.main'
+]
+
+# Import time per module in milliseconds
+import_timings = {}
+_analysis_lock = threading.Lock()
+_analysis_main = None
 
-app = Flask(__name__)
+# Analysis job threads per process (0 for processes that only serve requests)
+JOB_WORKERS = int(os.getenv('DRUGPREDICT_JOB_WORKERS', 1))
+
+# Warm-up scheduler of this process (see warmup.py), started with the job workers
+_warmup_scheduler = None
+
+# Seconds between queue polls of an idle job worker
+JOB_POLL_INTERVAL = float(os.getenv('DRUGPREDICT_JOB_POLL_INTERVAL', 0.5))
+
+# Maximum run time of an analysis in seconds; requests can ask for a shorter deadline
+TASK_TIMEOUT_SECONDS = float(os.getenv('DRUGPREDICT_TASK_TIMEOUT_SECONDS', 1800))
+
+# Cache lifetime of content-addressed files (one year)
+IMMUTABLE_MAX_AGE = 31536000
+
+api = Blueprint('api', __name__)
 
 # Configure CORS for production
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
-CORS(app, origins=allowed_origins)  # Enable CORS for Next.js frontend
 
 # Configure logging
 log_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'logs')
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'drugpredict.log')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+# Records are written by a background thread (see log_pipeline.setup_logging)
+setup_logging(log_file)
 logger = logging.getLogger(__name__)
 
 # Reduce ChemBL client logging verbosity
 logging.getLogger('chembl_webresource_client').setLevel(logging.WARNING)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
 
-# Global progress tracking
-progress_store = {}
+def load_analysis_modules():
+    """
+    Import the analysis stack on first use, recording the import time of each module
+    
+    Returns:
+        module: backend.analysis.main
+    """
+    global _analysis_main
+    if _analysis_main is not None:
+        return _analysis_main
+    
+    with _analysis_lock:
+        if _analysis_main is None:
+            total_start = time.perf_counter()
+            for module_name in ANALYSIS_MODULES:
+                start = time.perf_counter()
+                importlib.import_module(module_name)
+                import_timings[module_name] = round((time.perf_counter() - start) * 1000, 1)
+            _analysis_main = sys.modules['backend.analysis.main']
+            logger.info(f"Analysis modules loaded in {(time.perf_counter() - total_start) * 1000:.0f} ms: {import_timings}")
+    return _analysis_main
+
+def warm_up_analysis_modules():
+    """Import the analysis stack in a background thread"""
+    def warm_up():
+        try:
+            load_analysis_modules()
+        except Exception as e:
+            logger.error(f"Analysis warm-up failed: {str(e)}")
+    
+    thread = threading.Thread(target=warm_up, name='analysis-warmup')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def get_task_store():
+    """Task store of the current app"""
+    return current_app.extensions['task_store']
 
 class ProgressTracker:
-    def __init__(self, task_id):
+    """
+    Reports the progress of one task to the shared task store
+    
+    While the task runs, a heartbeat thread renews its lease every TASK_HEARTBEAT_SECONDS,
+    also during long stages without progress updates; tasks whose heartbeat stops (the
+    worker process died) are failed by the next claim of any worker.
+    """
+    
+    def __init__(self, task_id, store):
         self.task_id = task_id
-        self.current_step = 'starting'
-        self.progress = 0
-        self.status = 'running'
-        self.message = 'Initializing analysis...'
-        progress_store[task_id] = self
+        self.store = store
+        self.dataset_path = None
+        self._stopped = threading.Event()
+    
+    def start_heartbeat(self, interval=TASK_HEARTBEAT_SECONDS):
+        def beat():
+            while not self._stopped.wait(interval):
+                try:
+                    self.store.heartbeat(self.task_id)
+                except Exception as e:
+                    logger.error(f"Heartbeat of task {self.task_id} failed: {str(e)}")
+        
+        threading.Thread(target=beat, daemon=True, name=f'heartbeat-{self.task_id}').start()
+    
+    def stop_heartbeat(self):
+        self._stopped.set()
     
     def update(self, step, progress, message):
-        self.current_step = step
-        self.progress = progress
-        self.message = message
+        self.store.update_progress(self.task_id, step, progress, message)
         logger.info(f"Progress {self.task_id}: {step} - {progress}% - {message}")
     
     def complete(self, results=None):
         logger.info(f"ProgressTracker.complete() called for task {self.task_id}")
-        self.status = 'complete'
-        self.progress = 100
-        self.current_step = 'complete'
-        self.message = 'Analysis completed successfully'
-        if results:
-            self.results = results
-            logger.info(f"Results stored in tracker for task {self.task_id}")
+        self.store.complete(self.task_id, results, self.dataset_path)
         logger.info(f"Progress tracker status set to complete for task {self.task_id}")
     
     def error(self, error_message):
-        self.status = 'error'
-        self.message = error_message
+        self.store.fail(self.task_id, error_message)
+
+class JobWorker(threading.Thread):
+    """
+    Picks analysis jobs from the shared task queue and runs them
+    
+    Every worker process runs JOB_WORKERS of these threads, so analyses are spread
+    over all processes that share the task store.
+    """
+    
+    def __init__(self, store, poll_interval=JOB_POLL_INTERVAL):
+        super().__init__(daemon=True)
+        self.store = store
+        self.poll_interval = poll_interval
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.name = f"job-worker-{self.worker_id}"
+    
+    def run(self):
+        logger.info(f"Job worker {self.worker_id} started")
+        while True:
+            try:
+                job = self.store.claim_next_job(self.worker_id)
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} failed to poll queue: {str(e)}")
+                job = None
+            
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            
+            run_job(self.store, job)
+
+def is_cancel_requested(store, task_id):
+    """
+    True once the task is no longer running: cancelled (by a request to any worker
+    process), failed after its lease expired, or removed
+    """
+    task = store.get(task_id)
+    return task is None or task['status'] != RUNNING
+
+def is_warmup_preempted(store, task_id):
+    """Cancel a background warm-up once a user job waits for a worker"""
+    if is_cancel_requested(store, task_id):
+        return True
+    if warmup.should_preempt(store):
+        logger.info(f"Warm-up {task_id} preempted by a waiting user analysis")
+        store.cancel(task_id, 'Warm-up preempted by a user analysis')
+        return True
+    return False
 
-@app.route('/api/health', methods=['GET'])
+def run_job(store, job):
+    """
+    Run one claimed analysis job and record its outcome
+    
+    The job stops at the next cancellation check once it is cancelled through the task
+    store or its deadline (params['timeoutSeconds'], at most TASK_TIMEOUT_SECONDS after
+    it started) has passed; its workspace is released either way. Background warm-up
+    jobs also stop as soon as a user job waits (see warmup.should_preempt), and only
+    completed user jobs count towards the popularity of a target.
+    """
+    task_id = job['taskId']
+    params = job['params']
+    target_name = params['target']
+    limit = params.get('limit', '1000')
+    tracker = ProgressTracker(task_id, store)
+    task_key = secure_filename(task_id)
+    timeout = min(float(params.get('timeoutSeconds') or TASK_TIMEOUT_SECONDS), TASK_TIMEOUT_SECONDS)
+    is_warmup = params.get('warmup', False)
+    tracker.start_heartbeat()
+    
+    try:
+        analysis = load_analysis_modules()
+        is_cancelled = is_warmup_preempted if is_warmup else is_cancel_requested
+        cancel = analysis.cancellation.CancelToken(lambda: is_cancelled(store, task_id),
+                                                   deadline=time.time() + timeout)
+        logger.info(f"Starting analysis for target: {target_name} with limit: {limit}")
+        results = run_complete_analysis(target_name, limit, tracker, params.get('incremental', False), task_key,
+                                        params.get('tune', False), cancel)
+        logger.info(f"Analysis results received, calling tracker.complete()...")
+        tracker.complete(results)
+        logger.info(f"Analysis completed and tracker updated for target: {target_name}")
+        if not is_warmup:
+            try:
+                warmup.TargetPopularity(store).record(results['targetId'], limit, params.get('tune', False))
+            except Exception as e:
+                logger.error(f"Failed to record the request of {results['targetId']}: {str(e)}")
+    except Exception as e:
+        if _analysis_main is not None and isinstance(e, _analysis_main.cancellation.TaskCancelled):
+            if e.reason == _analysis_main.cancellation.DEADLINE:
+                logger.warning(f"Analysis {task_id} stopped after its deadline of {timeout:.0f}s")
+                tracker.error(f"Analysis exceeded its deadline of {timeout:.0f} seconds")
+            else:
+                logger.info(f"Analysis {task_id} cancelled")
+            return
+        logger.error(f"Analysis failed: {str(e)}")
+        logger.error(f"Full traceback: {traceback.format_exc()}")
+        tracker.error(str(e))
+    finally:
+        tracker.stop_heartbeat()
+        if _analysis_main is not None:
+            _analysis_main.cleanup_task_workspace(task_key)
+            _analysis_main.prune_task_outputs()
+        try:
+            store.prune()
+        except Exception as e:
+            logger.error(f"Failed to prune finished tasks: {str(e)}")
+
+def start_job_workers(store, count=JOB_WORKERS):
+    """Start the job worker threads of this process and the warm-up scheduler"""
+    global _warmup_scheduler
+    workers = [JobWorker(store) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    if warmup.WARMUP_TOP_TARGETS > 0 and _warmup_scheduler is None:
+        _warmup_scheduler = warmup.WarmupScheduler(
+            store, lambda target_id, limit, tune: load_analysis_modules().is_target_warm(target_id, limit, tune),
+            timeout=TASK_TIMEOUT_SECONDS)
+        _warmup_scheduler.start()
+    return workers
+
+@api.route('/api/warmup', methods=['GET'])
+def warmup_status():
+    """Most requested targets (counted by all worker processes) and their last warm-up"""
+    return jsonify({
+        "enabled": _warmup_scheduler is not None,
+        "idleSeconds": warmup.WARMUP_IDLE_SECONDS,
+        "targets": _warmup_scheduler.status() if _warmup_scheduler else []
+    })
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "service": "DrugPredict API"
+        "service": "DrugPredict API",
+        "analysisLoaded": _analysis_main is not None
+    })
+
+@api.route('/api/startup', methods=['GET'])
+def startup_report():
+    """Startup mode and import time per module"""
+    return jsonify({
+        "mode": STARTUP_MODE,
+        "bootMs": boot_ms,
+        "analysisLoaded": _analysis_main is not None,
+        "importTimingsMs": import_timings
     })
 
-@app.route('/outputs/<filename>')
+def send_immutable_file(file_path, etag, mimetype='image/png'):
+    """
+    Send a file whose URL always refers to the same content
+    
+    The response can be cached indefinitely, carries a strong ETag for conditional
+    requests (304 Not Modified) and uses a pre-compressed .gz variant when the client
+    accepts gzip and one exists.
+    """
+    gz_path = file_path + '.gz'
+    has_gzip = os.path.exists(gz_path)
+    if has_gzip and request.accept_encodings['gzip']:
+        response = send_file(gz_path, mimetype=mimetype, etag=f"{etag}-gz", conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(file_path, mimetype=mimetype, etag=etag, conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE)
+    if has_gzip:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@api.route('/outputs/<filename>')
 def serve_output_file(filename):
-    """Serve generated plot files with cache-busting headers"""
+    """Serve generated plot files (content-hashed names are cached indefinitely)"""
     try:
         # Define the outputs directory path - relative to root project directory
         outputs_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'outputs')
         file_path = os.path.join(outputs_dir, filename)
         
-        logger.info(f"Attempting to serve file: {file_path}")
-        logger.info(f"File exists: {os.path.exists(file_path)}")
-        
-        # Check if file exists
-        if os.path.exists(file_path):
-            response = send_file(file_path, mimetype='image/png')
-            # Add cache-busting headers to force refresh
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+        if os.path.isfile(file_path):
+            digest = content_hash(filename)
+            if digest:
+                return send_immutable_file(file_path, digest)
+            
+            # Plain names are overwritten by later runs: always revalidate (ETag -> 304)
+            response = send_file(file_path, mimetype='image/png', conditional=True)
+            response.headers['Cache-Control'] = 'no-cache'
             return response
         else:
-            # List files in directory for debugging
-            if os.path.exists(outputs_dir):
-                files = os.listdir(outputs_dir)
-                logger.info(f"Available files in outputs directory: {files}")
-            else:
-                logger.error(f"Outputs directory does not exist: {outputs_dir}")
+            # Misses are frequent (expired or pruned plots): logged at info level, which is
+            # rate limited, and without a directory listing
+            logger.info(f"Output file not found: {filename}")
             return jsonify({"error": "File not found"}), 404
             
     except Exception as e:
         logger.error(f"Error serving file {filename}: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
-@app.route('/api/targets/search', methods=['GET'])
+@api.route('/outputs/plots/<data_key>/<filename>')
+def serve_plot(data_key, filename):
+    """
+    Serve a plot of an analysis, rendering it on first request
+    Query parameters: ?dpi=72 (resolution), ?width=600 (image width in pixels)
+    """
+    try:
+        from backend.analysis.plot_cache import get_plot
+        
+        params = {name: request.args.get(name, type=int) for name in ('dpi', 'width')}
+        plot_path = get_plot(data_key, filename, **{k: v for k, v in params.items() if v})
+        # The image only depends on the content-addressed data key and the parameters,
+        # which also make up the cache file name
+        return send_immutable_file(plot_path, os.path.basename(plot_path).split('-')[0])
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Plot not found"}), 404
+    except Exception as e:
+        logger.error(f"Error rendering plot {data_key}/{filename}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/plots/<data_key>', methods=['GET'])
+def plot_summary(data_key):
+    """
+    Pre-aggregated data of the plots of an analysis, for drawing charts natively
+    Returns: class counts, box-plot statistics per class and a downsampled or binned scatter
+    """
+    try:
+        from backend.analysis.plot_data import load_plot_summary
+        
+        response = jsonify(load_plot_summary(data_key))
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Plot data not found"}), 404
+    except Exception as e:
+        logger.error(f"Error summarizing plot data {data_key}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/models/<model_key>', methods=['GET'])
+def model_info(model_key):
+    """
+    Metadata of a trained model (feature names expected by the predict endpoint)
+    """
+    try:
+        from backend.analysis.forest_model import load_forest
+        
+        return jsonify(load_forest(model_key).meta)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Model not found"}), 404
+    except Exception as e:
+        logger.error(f"Error loading model {model_key}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/models/<model_key>/predict', methods=['POST'])
+def predict(model_key):
+    """
+    Predict pIC50 values with a trained model
+    Expects: {"features": [[...], ...]} with one row per compound, columns as in featureNames
+    Returns: Predictions in row order
+    """
+    try:
+        from backend.analysis.forest_model import load_forest
+        
+        data = request.get_json() or {}
+        if 'features' not in data:
+            return jsonify({"error": "features parameter is required"}), 400
+        
+        # The model is memory-mapped, so all workers share one copy
+        forest = load_forest(model_key)
+        predictions = forest.predict(data['features'])
+        
+        return jsonify({"modelKey": model_key, "predictions": [round(float(p), 4) for p in predictions]})
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Model not found"}), 404
+    except Exception as e:
+        logger.error(f"Prediction with model {model_key} failed: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/maps/<map_key>', methods=['GET'])
+def chemical_space_map(map_key):
+    """
+    2D chemical-space coordinates of the compounds of an analysis
+    Query parameters: ?offset=0&limit=1000 for a page in dataset order,
+    otherwise ?sample=2000 for a fixed random subset
+    Returns: Map summary and points (id, x, y, class, pIC50)
+    """
+    try:
+        from backend.analysis.chemical_space import map_page, map_sample
+        
+        if 'offset' in request.args or 'limit' in request.args:
+            result = map_page(map_key, request.args.get('offset', 0, type=int),
+                              request.args.get('limit', 1000, type=int))
+        else:
+            result = map_sample(map_key, request.args.get('sample', 2000, type=int))
+        
+        # Map keys are content hashes, so a response never changes
+        response = jsonify(result)
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Map not found"}), 404
+    except Exception as e:
+        logger.error(f"Error loading map {map_key}: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/maps/<map_key>/place', methods=['POST'])
+def place_on_map(map_key):
+    """
+    Place new compounds on a stored chemical-space map without refitting it
+    Expects: {"smiles": ["...", ...]}
+    Returns: [x, y] per compound (null for unparsable SMILES)
+    """
+    try:
+        from backend.analysis.chemical_space import place_compounds
+        
+        data = request.get_json() or {}
+        smiles = data.get('smiles')
+        if not isinstance(smiles, list) or not smiles:
+            return jsonify({"error": "smiles must be a non-empty list"}), 400
+        if len(smiles) > 1000:
+            return jsonify({"error": "At most 1000 compounds per request"}), 400
+        
+        return jsonify({"mapKey": map_key, "coordinates": place_compounds(map_key, smiles)})
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Map not found"}), 404
+    except Exception as e:
+        logger.error(f"Placing compounds on map {map_key} failed: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/targets/search', methods=['GET'])
 def search_targets():
     """
     Autocomplete endpoint for target suggestions
@@ -132,28 +521,21 @@ def search_targets():
         if not query or len(query) < 2:
             return jsonify({"suggestions": []})
         
-        logger.info(f"Searching targets for: {query}")
-        
-        # Import ChemBL client
-        from chembl_webresource_client.new_client import new_client
+        logger.debug(f"Searching targets for: {query}")
         
-        # Search for targets with a limit
-        target = new_client.target
-        target_query = target.search(query).only(['target_chembl_id', 'pref_name', 'organism', 'target_type'])[:10]
-        targets_df = pd.DataFrame.from_dict(target_query)
-        
-        if targets_df.empty:
-            return jsonify({"suggestions": []})
+        # Search the configured data source (ChemBL web service or local snapshot)
+        from backend.analysis.data_sources import get_data_source
+        targets = get_data_source().search_targets(query, limit=10)
         
         # Format suggestions
         suggestions = []
-        for _, row in targets_df.head(10).iterrows():  # Limit to top 10
+        for row in targets:
             suggestion = {
-                "id": row.get('target_chembl_id', ''),
-                "name": row.get('pref_name', ''),
-                "organism": row.get('organism', ''),
-                "type": row.get('target_type', ''),
-                "description": row.get('pref_name', '')
+                "id": row.get('target_chembl_id') or '',
+                "name": row.get('pref_name') or '',
+                "organism": row.get('organism') or '',
+                "type": row.get('target_type') or '',
+                "description": row.get('pref_name') or ''
             }
             suggestions.append(suggestion)
         
@@ -163,68 +545,191 @@ def search_targets():
         logger.error(f"Target search failed: {str(e)}")
         return jsonify({"suggestions": []})
 
-@app.route('/api/progress/<task_id>', methods=['GET'])
+@api.route('/api/similarity/search', methods=['GET'])
+def similarity_search():
+    """
+    Tanimoto similarity search across all analysed compounds
+    Query parameters: ?smiles=query_smiles&k=10&threshold=0.0
+    Returns: Most similar indexed compounds
+    """
+    try:
+        smiles = request.args.get('smiles', '').strip()
+        if not smiles:
+            return jsonify({"error": "smiles parameter is required"}), 400
+        
+        # Import lazily so RDKit is only loaded when the index is used
+        from backend.analysis.similarity import get_similarity_index, MAX_SEARCH_K
+        
+        k = int(request.args.get('k', 10))
+        if not 1 <= k <= MAX_SEARCH_K:
+            return jsonify({"error": f"k must be between 1 and {MAX_SEARCH_K}"}), 400
+        threshold = float(request.args.get('threshold', 0.0))
+        if not 0.0 <= threshold <= 1.0:
+            return jsonify({"error": "threshold must be between 0 and 1"}), 400
+        
+        index = get_similarity_index()
+        results = index.search(smiles, k=k, threshold=threshold)
+        
+        return jsonify({
+            "query": smiles,
+            "k": k,
+            "threshold": threshold,
+            "indexSize": len(index),
+            "results": results
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Similarity search failed: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/targets/<target_id>/substructure', methods=['GET'])
+def substructure_search(target_id):
+    """
+    Substructure search within the analysed compounds of a target
+    Query parameters: ?smarts=pattern&class=active&limit=100
+    Returns: Matching compounds with screening statistics
+    """
+    try:
+        smarts = request.args.get('smarts', '').strip()
+        if not smarts:
+            return jsonify({"error": "smarts parameter is required"}), 400
+        
+        bioactivity_class = request.args.get('class') or None
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        
+        # Import lazily so RDKit is only loaded when the index is used
+        from backend.analysis.substructure import get_substructure_index, MAX_SEARCH_RESULTS
+        limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+        
+        index = get_substructure_index(target_id)
+        results = index.search(smarts, bioactivity_class=bioactivity_class, max_results=limit)
+        results["targetId"] = target_id.upper()
+        results["smarts"] = smarts
+        
+        return jsonify(results)
+        
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Substructure search failed: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@api.route('/api/progress/<task_id>', methods=['GET'])
 def get_progress(task_id):
     """
     Get progress for a specific analysis task
     """
-    tracker = progress_store.get(task_id)
-    if not tracker:
+    task = get_task_store().get(task_id)
+    if not task:
         logger.warning(f"Progress check for unknown task_id: {task_id}")
         return jsonify({"error": "Task not found"}), 404
     
-    logger.debug(f"Progress check for {task_id}: status={tracker.status}, progress={tracker.progress}, step={tracker.current_step}")
+    logger.debug(f"Progress check for {task_id}: status={task['status']}, progress={task['progress']}, step={task['currentStep']}")
     
     response = {
         "taskId": task_id,
-        "status": tracker.status,
-        "currentStep": tracker.current_step,
-        "progress": tracker.progress,
-        "message": tracker.message
+        "status": task['status'],
+        "currentStep": task['currentStep'],
+        "progress": task['progress'],
+        "message": task['message']
     }
     
-    if tracker.status == 'complete' and hasattr(tracker, 'results'):
-        response["results"] = tracker.results
-        logger.info(f"Returning complete results for task {task_id}")
+    if task['status'] == COMPLETE and task['results']:
+        response["results"] = task['results']
+        logger.debug(f"Returning complete results for task {task_id}")
     
     return jsonify(response)
 
-@app.route('/api/search', methods=['POST'])
+@api.route('/api/tasks/<task_id>/dataset', methods=['GET'])
+def download_task_dataset(task_id):
+    """
+    Stream the final dataset of a completed task
+    Query parameter: ?format=parquet|csv (default parquet)
+    """
+    task = get_task_store().get(task_id)
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    
+    dataset_path = task['datasetPath']
+    if task['status'] != COMPLETE or not dataset_path or not os.path.exists(dataset_path):
+        return jsonify({"error": "Dataset not available"}), 404
+    
+    file_format = request.args.get('format', 'parquet').lower()
+    download_name = f"{secure_filename(task_id)}_bioactivity"
+    
+    if file_format == 'parquet':
+        return send_file(dataset_path, mimetype='application/vnd.apache.parquet',
+                         as_attachment=True, download_name=f"{download_name}.parquet")
+    
+    if file_format == 'csv':
+        from backend.analysis.columnar import iter_csv_bytes
+        
+        # Convert batch by batch so the dataset is never fully loaded
+        return Response(
+            stream_with_context(iter_csv_bytes(dataset_path)),
+            mimetype='text/csv',
+            headers={"Content-Disposition": f"attachment; filename={download_name}.csv"}
+        )
+    
+    return jsonify({"error": "format must be 'parquet' or 'csv'"}), 400
+
+@api.route('/api/tasks/<task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    """
+    Cancel a queued or running analysis
+    The worker running it stops at its next cancellation check and releases its workspace.
+    """
+    store = get_task_store()
+    task = store.get(task_id)
+    if not task:
+        return jsonify({"error": "Task not found"}), 404
+    
+    if not store.cancel(task_id):
+        return jsonify({"error": f"Task already {store.get(task_id)['status']}"}), 409
+    
+    logger.info(f"Cancellation requested for task {task_id} ({task['status']})")
+    return jsonify({"taskId": task_id, "status": CANCELLED})
+
+@api.route('/api/search', methods=['POST'])
 def analyze_target():
     """
     Main analysis endpoint - starts analysis and returns task ID for progress tracking
-    Expects: {"target": "target_name", "limit": "1000"}
+    Expects: {"target": "target_name", "limit": "1000", "incremental": false, "tune": false,
+              "timeoutSeconds": 600}
     Returns: Task ID for progress tracking
     """
     try:
         data = request.get_json()
         target_name = data.get('target')
         limit = data.get('limit', '1000')  # Default to 1000 if not specified
+        incremental = bool(data.get('incremental', False))  # Sync only new ChemBL activities
+        tune = bool(data.get('tune', False))  # Search Random Forest hyperparameters
+        timeout = data.get('timeoutSeconds')  # Deadline (capped at TASK_TIMEOUT_SECONDS)
         
         if not target_name:
             return jsonify({"error": "Target parameter is required"}), 400
         
-        # Generate unique task ID
-        task_id = f"{target_name}_{limit}_{int(time.time())}"
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            return jsonify({"error": "timeoutSeconds must be a positive number"}), 400
         
-        # Start analysis in background thread
-        def run_analysis():
-            tracker = ProgressTracker(task_id)
-            try:
-                logger.info(f"Starting analysis for target: {target_name} with limit: {limit}")
-                results = run_complete_analysis(target_name, limit, tracker)
-                logger.info(f"Analysis results received, calling tracker.complete()...")
-                tracker.complete(results)
-                logger.info(f"Analysis completed and tracker updated for target: {target_name}")
-            except Exception as e:
-                logger.error(f"Analysis failed: {str(e)}")
-                logger.error(f"Full traceback: {traceback.format_exc()}")
-                tracker.error(str(e))
+        # Generate unique task ID
+        task_id = f"{target_name}_{limit}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
         
-        # Start background thread
-        thread = threading.Thread(target=run_analysis)
-        thread.daemon = True
-        thread.start()
+        # Queue the analysis; any worker process sharing the task store picks it up
+        get_task_store().create_task(task_id, {
+            "target": target_name,
+            "limit": limit,
+            "incremental": incremental,
+            "tune": tune,
+            "timeoutSeconds": min(timeout or TASK_TIMEOUT_SECONDS, TASK_TIMEOUT_SECONDS)
+        })
         
         return jsonify({
             "taskId": task_id,
@@ -239,7 +744,8 @@ def analyze_target():
             "message": str(e)
         }), 500
 
-def run_complete_analysis(target_name, limit='1000', tracker=None):
+def run_complete_analysis(target_name, limit='1000', tracker=None, incremental=False, task_key=None, tune=False,
+                          cancel=None):
     """
     Run the complete analysis pipeline and return structured results
     """
@@ -248,13 +754,19 @@ def run_complete_analysis(target_name, limit='1000', tracker=None):
             tracker.update('retrieving', 10, 'Starting data retrieval from ChemBL...')
         
         # Run the complete analysis pipeline with the specified limit
-        df_final, display_target_name, target_id, stats_results, plot_results, ml_results = run_complete_analysis_pipeline(target_name, limit, tracker)
+        analysis = load_analysis_modules()
+        df_final, display_target_name, target_id, stats_results, plot_results, ml_results, space_results, cliff_results = analysis.run_complete_analysis_pipeline(target_name, limit, tracker, incremental, task_key,
+                                                    {"tune": tune}, cancel=cancel)
+        if cancel:
+            cancel.check()
         
         if tracker:
             tracker.update('finalizing', 95, 'Compiling final results...')
+            tracker.dataset_path = save_task_dataset(tracker.task_id, df_final)
         
         # Compile results - use display_target_name for user-friendly display
-        results = compile_results(display_target_name, target_id, df_final, stats_results, plot_results, ml_results, limit)
+        results = compile_results(display_target_name, target_id, df_final, stats_results, plot_results, ml_results, limit,
+                                  space_results, cliff_results)
         
         return results
         
@@ -262,7 +774,19 @@ def run_complete_analysis(target_name, limit='1000', tracker=None):
         logger.error(f"Analysis pipeline failed: {str(e)}")
         raise
 
-def compile_results(target_name, target_id, df_final, stats_results, plot_results, ml_results, limit='1000'):
+def save_task_dataset(task_id, df_final):
+    """Save the final dataset of a task as Parquet for later download"""
+    from backend.analysis.columnar import write_dataset
+    
+    tasks_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed', 'tasks')
+    os.makedirs(tasks_dir, exist_ok=True)
+    dataset_path = os.path.join(tasks_dir, f"{secure_filename(task_id)}.parquet")
+    write_dataset(df_final, dataset_path)
+    logger.info(f"Task dataset saved to: {dataset_path}")
+    return dataset_path
+
+def compile_results(target_name, target_id, df_final, stats_results, plot_results, ml_results, limit='1000',
+                    space_results=None, cliff_results=None):
     """Compile all analysis results into the expected format"""
     
     # Count compounds by class
@@ -288,8 +812,9 @@ def compile_results(target_name, target_id, df_final, stats_results, plot_result
     absolute_plots = []
     for plot in plot_results:
         plot_copy = plot.copy()
-        if plot_copy.get('imagePath', '').startswith('/outputs/'):
-            plot_copy['imagePath'] = base_url + plot_copy['imagePath']
+        for path_key in ('imagePath', 'thumbnailPath'):
+            if plot_copy.get(path_key, '').startswith('/outputs/'):
+                plot_copy[path_key] = base_url + plot_copy[path_key]
         absolute_plots.append(plot_copy)
     
     # Convert regression plot URL in ML results to absolute
@@ -313,10 +838,48 @@ def compile_results(target_name, target_id, df_final, stats_results, plot_result
         "statistics": stats_results,
         "plots": absolute_plots,
         "predictions": ml_results_copy,
+        "chemicalSpace": space_results,
+        "activityCliffs": cliff_results,
         "timestamp": datetime.now().isoformat()
     }
 
+def create_app(task_store=None, start_workers=True):
+    """
+    Application factory for WSGI servers (e.g. gunicorn 'backend.api.wsgi:app')
+    
+    Call it once per worker process, after the fork: the job worker threads it starts
+    do not survive a fork (so do not combine with gunicorn --preload).
+    
+    Args:
+        task_store (TaskStore): Shared task store (defaults to DRUGPREDICT_TASK_STORE)
+        start_workers (bool): Start the analysis job worker threads of this process
+        
+    Returns:
+        Flask: Configured app
+    """
+    app = Flask(__name__)
+    CORS(app, origins=allowed_origins)  # Enable CORS for Next.js frontend
+    
+    app.extensions['task_store'] = task_store or create_task_store()
+    app.register_blueprint(api)
+    
+    if start_workers and JOB_WORKERS > 0:
+        start_job_workers(app.extensions['task_store'], JOB_WORKERS)
+    
+    return app
+
+if STARTUP_MODE == 'eager':
+    load_analysis_modules()
+elif STARTUP_MODE == 'warm':
+    warm_up_analysis_modules()
+
+boot_ms = round((time.perf_counter() - _boot_start) * 1000, 1)
+logger.info(f"DrugPredict API ready in {boot_ms} ms (startup mode: {STARTUP_MODE})")
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('FLASK_ENV') != 'production'
+    # The reloader re-imports this module in a child process; only start workers there
+    start_workers = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    app = create_app(start_workers=start_workers)
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,530 @@
+#DrugPredict - Shared task state
+#Task progress, results and the analysis job queue live in a store that every
+#worker process can reach, so a progress poll can be answered by any worker.
+
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Task status values
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETE = 'complete'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+
+# Tasks in these states can still be cancelled
+ACTIVE = (QUEUED, RUNNING)
+
+# Tasks in these states are finished (and pruned once they are old enough)
+FINISHED = (COMPLETE, ERROR, CANCELLED)
+
+# Job priorities: queued jobs are claimed by priority, then in order of creation
+USER_PRIORITY = 0
+BACKGROUND_PRIORITY = -1
+
+# A running task whose worker has not sent a heartbeat for this long is failed
+# (its process was killed or recycled); workers send one every TASK_HEARTBEAT_SECONDS
+TASK_LEASE_SECONDS = float(os.getenv('DRUGPREDICT_TASK_LEASE_SECONDS', 120))
+TASK_HEARTBEAT_SECONDS = 15
+
+LEASE_EXPIRED_MESSAGE = 'Analysis worker stopped responding'
+
+# Request counts of analyses not requested for this many half-lives are forgotten
+POPULARITY_MAX_HALF_LIVES = 10
+
+
+def _json_default(value):
+    """Serialize numpy scalars and other stray values in results"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class TaskStore:
+    """
+    Interface of a task store
+
+    Tasks are dicts with the keys taskId, params, priority, status, currentStep,
+    progress, message, results, datasetPath, worker, created and updated.
+    """
+
+    def create_task(self, task_id, params, priority=USER_PRIORITY):
+        """Queue a new analysis job"""
+        raise NotImplementedError
+
+    def claim_next_job(self, worker_id):
+        """
+        Atomically move the queued job with the highest priority (the oldest among equals)
+        to running and return it (None if idle)
+
+        Running jobs without a heartbeat for TASK_LEASE_SECONDS are failed first.
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, task_id):
+        """Renew the lease of a running task"""
+        raise NotImplementedError
+
+    def prune(self, max_age_hours=24):
+        """
+        Delete finished tasks not updated for max_age_hours
+
+        Returns:
+            int: Number of deleted tasks
+        """
+        raise NotImplementedError
+
+    def queue_stats(self, min_priority=USER_PRIORITY):
+        """
+        Queued and running jobs with at least min_priority
+
+        Returns:
+            dict: {"queued": int, "running": int, "oldestQueued": creation time of the
+                  oldest queued job, or None}
+        """
+        raise NotImplementedError
+
+    def update_progress(self, task_id, step, progress, message):
+        raise NotImplementedError
+
+    def complete(self, task_id, results=None, dataset_path=None):
+        raise NotImplementedError
+
+    def fail(self, task_id, message):
+        raise NotImplementedError
+
+    def cancel(self, task_id, message='Analysis cancelled'):
+        """
+        Mark a queued or running task as cancelled
+
+        A queued task is never claimed; the worker running a task notices the status at
+        its next cancellation check. Progress, results and failures reported afterwards
+        are ignored.
+
+        Returns:
+            bool: True if the task was active and is now cancelled
+        """
+        raise NotImplementedError
+
+    def get(self, task_id):
+        """Return the task dict or None"""
+        raise NotImplementedError
+
+    def record_request(self, target_id, limit, tune, half_life, now=None):
+        """
+        Add one request to the exponentially decayed request count of an analysis
+
+        Args:
+            target_id (str): Resolved target
+            limit (str): Activity limit of the analysis
+            tune (bool): Hyperparameter tuning flag of the analysis
+            half_life (float): Seconds after which a request counts half
+        """
+        raise NotImplementedError
+
+    def queue_warmup(self, task_id, params, retry_seconds, now=None):
+        """
+        Atomically queue a background warm-up of an analysis
+
+        The job is only queued if no job with at least BACKGROUND_PRIORITY is queued or
+        running and the last warm-up of the analysis (params target, limit and tune)
+        was queued more than retry_seconds ago; its time is recorded in the same step,
+        so the schedulers of several worker processes never queue duplicates.
+
+        Returns:
+            bool: True if the warm-up was queued
+        """
+        raise NotImplementedError
+
+    def top_requests(self, n, half_life, now=None):
+        """
+        Most requested analyses
+
+        Returns:
+            list: [{"targetId", "limit", "tune", "requests": decayed request count,
+                  "lastWarmup": time of the last queued warm-up or None}], most requested first
+        """
+        raise NotImplementedError
+
+
+def _decayed(score, updated, half_life, now):
+    return score * 0.5 ** ((now - updated) / half_life)
+
+
+class MemoryTaskStore(TaskStore):
+    """In-process task store (single worker process only)"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._popularity = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_task(task_id, params, priority, now):
+        return {
+            "taskId": task_id,
+            "params": dict(params),
+            "priority": priority,
+            "status": QUEUED,
+            "currentStep": 'starting',
+            "progress": 0,
+            "message": 'Waiting for an analysis worker...',
+            "results": None,
+            "datasetPath": None,
+            "worker": None,
+            "created": now,
+            "updated": now
+        }
+
+    def create_task(self, task_id, params, priority=USER_PRIORITY):
+        with self._lock:
+            self._tasks[task_id] = self._new_task(task_id, params, priority, time.time())
+
+    def claim_next_job(self, worker_id):
+        with self._lock:
+            expired = time.time() - TASK_LEASE_SECONDS
+            for task in self._tasks.values():
+                if task['status'] == RUNNING and task['updated'] < expired:
+                    task.update(status=ERROR, message=LEASE_EXPIRED_MESSAGE, updated=time.time())
+            queued = [t for t in self._tasks.values() if t['status'] == QUEUED]
+            if not queued:
+                return None
+            task = min(queued, key=lambda t: (-t['priority'], t['created']))
+            task.update(status=RUNNING, worker=worker_id, message='Initializing analysis...', updated=time.time())
+            return dict(task)
+
+    def queue_stats(self, min_priority=USER_PRIORITY):
+        with self._lock:
+            active = [t for t in self._tasks.values() if t['status'] in ACTIVE and t['priority'] >= min_priority]
+        queued = [t['created'] for t in active if t['status'] == QUEUED]
+        return {"queued": len(queued), "running": len(active) - len(queued),
+                "oldestQueued": min(queued) if queued else None}
+
+    def _update(self, task_id, statuses=(RUNNING,), **fields):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task['status'] not in statuses:
+                return False
+            task.update(fields, updated=time.time())
+            return True
+
+    def heartbeat(self, task_id):
+        self._update(task_id)
+
+    def prune(self, max_age_hours=24):
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock:
+            expired = [task_id for task_id, task in self._tasks.items()
+                       if task['status'] in FINISHED and task['updated'] < cutoff]
+            for task_id in expired:
+                del self._tasks[task_id]
+        return len(expired)
+
+    def update_progress(self, task_id, step, progress, message):
+        self._update(task_id, currentStep=step, progress=progress, message=message)
+
+    def complete(self, task_id, results=None, dataset_path=None):
+        self._update(task_id, status=COMPLETE, currentStep='complete', progress=100,
+                     message='Analysis completed successfully', results=results, datasetPath=dataset_path)
+
+    def fail(self, task_id, message):
+        self._update(task_id, status=ERROR, message=message)
+
+    def cancel(self, task_id, message='Analysis cancelled'):
+        return self._update(task_id, ACTIVE, status=CANCELLED, message=message)
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task else None
+
+    def record_request(self, target_id, limit, tune, half_life, now=None):
+        now = now or time.time()
+        with self._lock:
+            entry = self._popularity.setdefault((target_id, limit, tune),
+                                                {"score": 0.0, "updated": now, "lastWarmup": None})
+            entry.update(score=_decayed(entry['score'], entry['updated'], half_life, now) + 1, updated=now)
+            cutoff = now - POPULARITY_MAX_HALF_LIVES * half_life
+            for key in [key for key, value in self._popularity.items() if value['updated'] < cutoff]:
+                del self._popularity[key]
+
+    def queue_warmup(self, task_id, params, retry_seconds, now=None):
+        now = now or time.time()
+        key = (params['target'], params['limit'], params['tune'])
+        with self._lock:
+            if any(t['status'] in ACTIVE and t['priority'] >= BACKGROUND_PRIORITY for t in self._tasks.values()):
+                return False
+            entry = self._popularity.get(key)
+            if entry is None or now - (entry['lastWarmup'] or 0) < retry_seconds:
+                return False
+            entry['lastWarmup'] = now
+            self._tasks[task_id] = self._new_task(task_id, params, BACKGROUND_PRIORITY, now)
+        return True
+
+    def top_requests(self, n, half_life, now=None):
+        now = now or time.time()
+        with self._lock:
+            requests = [{"targetId": target_id, "limit": limit, "tune": tune,
+                         "requests": _decayed(entry['score'], entry['updated'], half_life, now),
+                         "lastWarmup": entry['lastWarmup']}
+                        for (target_id, limit, tune), entry in self._popularity.items()]
+        return sorted(requests, key=lambda request: -request['requests'])[:n]
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Task store in a local SQLite database shared by all worker processes
+
+    Connections are opened per thread and per process, so the store can be created
+    before a pre-fork server forks its workers.
+    """
+
+    COLUMNS = ['task_id', 'params', 'status', 'current_step', 'progress', 'message',
+               'results', 'dataset_path', 'worker', 'created', 'updated', 'priority']
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'tasks.db')
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " task_id TEXT PRIMARY KEY,"
+            " params TEXT,"
+            " status TEXT,"
+            " current_step TEXT,"
+            " progress INTEGER,"
+            " message TEXT,"
+            " results TEXT,"
+            " dataset_path TEXT,"
+            " worker TEXT,"
+            " created REAL,"
+            " updated REAL,"
+            " priority INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Databases created before job priorities
+        if 'priority' not in [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]:
+            conn.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (status, created)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_priority ON tasks (status, priority DESC, created)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS target_popularity ("
+            " target_id TEXT NOT NULL,"
+            " row_limit TEXT NOT NULL,"
+            " tune INTEGER NOT NULL,"
+            " score REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " last_warmup REAL,"
+            " PRIMARY KEY (target_id, row_limit, tune))"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _to_task(self, row):
+        if row is None:
+            return None
+        values = dict(zip(self.COLUMNS, row))
+        return {
+            "taskId": values['task_id'],
+            "params": json.loads(values['params']) if values['params'] else {},
+            "priority": values['priority'],
+            "status": values['status'],
+            "currentStep": values['current_step'],
+            "progress": values['progress'],
+            "message": values['message'],
+            "results": json.loads(values['results']) if values['results'] else None,
+            "datasetPath": values['dataset_path'],
+            "worker": values['worker'],
+            "created": values['created'],
+            "updated": values['updated']
+        }
+
+    def create_task(self, task_id, params, priority=USER_PRIORITY):
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO tasks (task_id, params, status, current_step, progress, message, created, updated, priority)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, json.dumps(params), QUEUED, 'starting', 0, 'Waiting for an analysis worker...', now, now,
+             priority)
+        )
+
+    def claim_next_job(self, worker_id):
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET status = ?, message = ?, updated = ? WHERE status = ? AND updated < ?",
+                (ERROR, LEASE_EXPIRED_MESSAGE, now, RUNNING, now - TASK_LEASE_SECONDS)
+            )
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM tasks WHERE status = ?"
+                " ORDER BY priority DESC, created LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, message = ?, updated = ? WHERE task_id = ?",
+                (RUNNING, worker_id, 'Initializing analysis...', now, row[0])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        task = self._to_task(row)
+        task.update(status=RUNNING, worker=worker_id)
+        return task
+
+    def queue_stats(self, min_priority=USER_PRIORITY):
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*), MIN(created) FROM tasks WHERE status IN (?, ?) AND priority >= ? GROUP BY status",
+            (*ACTIVE, min_priority)
+        ).fetchall()
+        stats = {status: (count, oldest) for status, count, oldest in rows}
+        return {"queued": stats.get(QUEUED, (0, None))[0], "running": stats.get(RUNNING, (0, None))[0],
+                "oldestQueued": stats.get(QUEUED, (0, None))[1]}
+
+    def heartbeat(self, task_id):
+        self._connection().execute(
+            "UPDATE tasks SET updated = ? WHERE task_id = ? AND status = ?", (time.time(), task_id, RUNNING)
+        )
+
+    def prune(self, max_age_hours=24):
+        cursor = self._connection().execute(
+            f"DELETE FROM tasks WHERE status IN ({', '.join('?' * len(FINISHED))}) AND updated < ?",
+            (*FINISHED, time.time() - max_age_hours * 3600)
+        )
+        return cursor.rowcount
+
+    def update_progress(self, task_id, step, progress, message):
+        self._connection().execute(
+            "UPDATE tasks SET current_step = ?, progress = ?, message = ?, updated = ? WHERE task_id = ? AND status = ?",
+            (step, progress, message, time.time(), task_id, RUNNING)
+        )
+
+    def complete(self, task_id, results=None, dataset_path=None):
+        self._connection().execute(
+            "UPDATE tasks SET status = ?, current_step = ?, progress = ?, message = ?, results = ?,"
+            " dataset_path = ?, updated = ? WHERE task_id = ? AND status = ?",
+            (COMPLETE, 'complete', 100, 'Analysis completed successfully',
+             json.dumps(results, default=_json_default) if results is not None else None,
+             dataset_path, time.time(), task_id, RUNNING)
+        )
+
+    def fail(self, task_id, message):
+        self._connection().execute(
+            "UPDATE tasks SET status = ?, message = ?, updated = ? WHERE task_id = ? AND status = ?",
+            (ERROR, message, time.time(), task_id, RUNNING)
+        )
+
+    def cancel(self, task_id, message='Analysis cancelled'):
+        cursor = self._connection().execute(
+            "UPDATE tasks SET status = ?, message = ?, updated = ? WHERE task_id = ? AND status IN (?, ?)",
+            (CANCELLED, message, time.time(), task_id, *ACTIVE)
+        )
+        return cursor.rowcount > 0
+
+    def get(self, task_id):
+        row = self._connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return self._to_task(row)
+
+    def record_request(self, target_id, limit, tune, half_life, now=None):
+        now = now or time.time()
+        conn = self._connection()
+        # The decay is computed here, so read and update under the write lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            key = (target_id, limit, int(tune))
+            row = conn.execute(
+                "SELECT score, updated FROM target_popularity WHERE target_id = ? AND row_limit = ? AND tune = ?", key
+            ).fetchone()
+            score = (_decayed(row[0], row[1], half_life, now) if row else 0.0) + 1
+            conn.execute(
+                "INSERT INTO target_popularity (target_id, row_limit, tune, score, updated) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (target_id, row_limit, tune) DO UPDATE SET score = excluded.score,"
+                " updated = excluded.updated",
+                (*key, score, now)
+            )
+            conn.execute("DELETE FROM target_popularity WHERE updated < ?",
+                         (now - POPULARITY_MAX_HALF_LIVES * half_life,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def queue_warmup(self, task_id, params, retry_seconds, now=None):
+        now = now or time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN (?, ?) AND priority >= ?", (*ACTIVE, BACKGROUND_PRIORITY)
+            ).fetchone()[0]
+            # Only an analysis with a request count whose last warm-up is old enough
+            updated = conn.execute(
+                "UPDATE target_popularity SET last_warmup = ? WHERE target_id = ? AND row_limit = ? AND tune = ?"
+                " AND (last_warmup IS NULL OR last_warmup <= ?)",
+                (now, params['target'], params['limit'], int(params['tune']), now - retry_seconds)
+            ).rowcount if active == 0 else 0
+            if updated:
+                conn.execute(
+                    "INSERT INTO tasks (task_id, params, status, current_step, progress, message, created, updated,"
+                    " priority) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_id, json.dumps(params), QUEUED, 'starting', 0, 'Waiting for an analysis worker...', now, now,
+                     BACKGROUND_PRIORITY)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return updated > 0
+
+    def top_requests(self, n, half_life, now=None):
+        now = now or time.time()
+        rows = self._connection().execute(
+            "SELECT target_id, row_limit, tune, score, updated, last_warmup FROM target_popularity"
+        ).fetchall()
+        requests = [{"targetId": target_id, "limit": limit, "tune": bool(tune),
+                     "requests": _decayed(score, updated, half_life, now), "lastWarmup": last_warmup}
+                    for target_id, limit, tune, score, updated, last_warmup in rows]
+        return sorted(requests, key=lambda request: -request['requests'])[:n]
+
+
+def create_task_store(spec=None):
+    """
+    Create the task store selected by DRUGPREDICT_TASK_STORE
+
+    Args:
+        spec (str): 'sqlite' (default), 'memory', or 'package.module:ClassName' for a custom store
+
+    Returns:
+        TaskStore: Task store instance
+    """
+    spec = spec or os.getenv('DRUGPREDICT_TASK_STORE', 'sqlite')
+    if spec == 'sqlite':
+        return SQLiteTaskStore(os.getenv('DRUGPREDICT_TASK_DB') or None)
+    if spec == 'memory':
+        return MemoryTaskStore()
+    module_name, _, class_name = spec.partition(':')
+    if not class_name:
+        raise ValueError(f"Unknown task store: {spec}")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,156 @@
+#DrugPredict - Background warm-up of popular targets
+#A handful of targets make up most analysis requests. Completed user analyses are
+#counted per resolved target in the shared task store, and once the job queue has been idle for a while the
+#scheduler queues a background-priority analysis of the most requested target whose
+#data is not checkpointed. It fetches the activities, computes the descriptors and
+#trains the model, so the next user analysis of that target resumes from the stored
+#stages. Background jobs are only claimed when no user job is queued, and a running
+#warm-up is cancelled as soon as a user job waits for a worker (its completed stages
+#stay checkpointed).
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+from backend.api.task_store import USER_PRIORITY, BACKGROUND_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+# Number of most requested targets kept warm (0 disables the warm-up)
+WARMUP_TOP_TARGETS = int(os.getenv('DRUGPREDICT_WARMUP_TOP_TARGETS', 5))
+
+# Seconds without queued or running jobs before a warm-up is started
+WARMUP_IDLE_SECONDS = float(os.getenv('DRUGPREDICT_WARMUP_IDLE_SECONDS', 60))
+
+# Seconds between checks of the queue
+WARMUP_CHECK_INTERVAL = 10
+
+# A running warm-up is cancelled once a user job has waited this long for a worker
+WARMUP_PREEMPT_SECONDS = 1.0
+
+# Request counts lose half their weight after this many hours
+WARMUP_HALF_LIFE_HOURS = 24
+
+# Targets with a lower decayed request count are not warmed (two requests within a day pass)
+WARMUP_MIN_REQUESTS = 1.5
+
+# Seconds before a target whose warm-up failed or was preempted is tried again
+WARMUP_RETRY_SECONDS = 900
+
+
+class TargetPopularity:
+    """
+    Exponentially decayed request counts per analysis (resolved target, limit, tune)
+
+    Only analyses with the same parameters share their checkpoints, so the limit and
+    the tuning flag are part of the key. The counts live in the shared task store, so
+    every worker process counts all requests and they survive a restart.
+    """
+
+    def __init__(self, store, half_life_hours=WARMUP_HALF_LIFE_HOURS):
+        self.store = store
+        self.half_life = half_life_hours * 3600
+
+    def record(self, target_id, limit='1000', tune=False, now=None):
+        """Count one completed analysis of a target"""
+        self.store.record_request(target_id, str(limit), bool(tune), self.half_life, now)
+
+    def top(self, n, now=None):
+        """
+        Most requested analyses
+
+        Returns:
+            list: Dicts with targetId, limit, tune, requests (decayed count) and
+                  lastWarmup, highest count first
+        """
+        return self.store.top_requests(n, self.half_life, now)
+
+
+def should_preempt(store, preempt_seconds=WARMUP_PREEMPT_SECONDS):
+    """True once a user job has waited preempt_seconds for a worker"""
+    oldest = store.queue_stats(USER_PRIORITY)['oldestQueued']
+    return oldest is not None and time.time() - oldest >= preempt_seconds
+
+
+class WarmupScheduler(threading.Thread):
+    """
+    Queues warm-up analyses of popular targets while the job queue is idle
+
+    At most one warm-up is queued or running at a time, also with a scheduler in every
+    worker process (see TaskStore.queue_warmup); the job workers run it like any other
+    job, at background priority.
+
+    Args:
+        store (TaskStore): Shared task store
+        is_warm (callable): is_warm(target_id, limit, tune) -> True if the analysis needs no warm-up
+        top_n (int): Number of most requested targets kept warm
+        idle_seconds (float): Idle time of the queue before a warm-up is queued
+        interval (float): Seconds between checks
+        timeout (float): Deadline of a warm-up job in seconds
+    """
+
+    def __init__(self, store, is_warm, top_n=WARMUP_TOP_TARGETS, idle_seconds=WARMUP_IDLE_SECONDS,
+                 interval=WARMUP_CHECK_INTERVAL, timeout=None):
+        super().__init__(daemon=True, name='warmup-scheduler')
+        self.store = store
+        self.is_warm = is_warm
+        self.top_n = top_n
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.timeout = timeout
+        self.idle_since = None
+        self.popularity = TargetPopularity(store)
+
+    def run(self):
+        logger.info(f"Warm-up scheduler started (top {self.top_n} targets)")
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Warm-up check failed: {str(e)}")
+
+    def check(self, now=None):
+        """
+        Queue a warm-up if the queue has been idle long enough and a popular target is cold
+
+        Returns:
+            str: Task ID of the queued warm-up, or None
+        """
+        now = now or time.time()
+        stats = self.store.queue_stats(BACKGROUND_PRIORITY)
+        if stats['queued'] or stats['running']:
+            self.idle_since = None
+            return None
+        if self.idle_since is None:
+            self.idle_since = now
+        if now - self.idle_since < self.idle_seconds:
+            return None
+
+        for request in self.popularity.top(self.top_n, now):
+            target_id, limit, tune = request['targetId'], request['limit'], request['tune']
+            if request['requests'] < WARMUP_MIN_REQUESTS:
+                break
+            if now - (request['lastWarmup'] or 0) < WARMUP_RETRY_SECONDS:
+                continue
+            if self.is_warm(target_id, limit, tune):
+                continue
+
+            self.idle_since = None
+            task_id = f"warmup_{target_id}_{limit}_{int(now)}_{uuid.uuid4().hex[:6]}"
+            params = {"target": target_id, "limit": limit, "tune": tune, "warmup": True}
+            if self.timeout:
+                params["timeoutSeconds"] = self.timeout
+            if not self.store.queue_warmup(task_id, params, WARMUP_RETRY_SECONDS, now):
+                # The scheduler of another worker process was first, or a job arrived
+                return None
+            logger.info(f"Queued warm-up {task_id} ({request['requests']:.1f} recent requests)")
+            return task_id
+        return None
+
+    def status(self, now=None):
+        """Most requested analyses with their request counts and last warm-up attempt"""
+        return [dict(request, requests=round(request['requests'], 2))
+                for request in self.popularity.top(self.top_n, now)]
@@ -0,0 +1,15 @@
+# Standalone analysis worker
+# Runs analysis jobs from the shared task store without serving HTTP requests:
+# python backend/api/worker.py
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from backend.api.flask_app import JOB_WORKERS, start_job_workers
+from backend.api.task_store import create_task_store
+
+if __name__ == '__main__':
+    start_job_workers(create_task_store(), max(JOB_WORKERS, 1))
+    while True:
+        time.sleep(60)
@@ -0,0 +1,9 @@
+# WSGI entry point for pre-fork servers
+# gunicorn --workers 4 --bind 0.0.0.0:5001 backend.api.wsgi:app
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from backend.api.flask_app import create_app
+
+app = create_app()
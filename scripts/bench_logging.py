@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Logging overhead benchmark
+
+Measures what log calls cost the threads that make them, with the handlers written
+synchronously (FileHandler and StreamHandler in the calling thread) and through the
+queue of backend/analysis/log_pipeline.py. The console is simulated by a stream
+that takes --write-delay-ms per write, like a slow terminal or a log collector
+behind a pipe.
+
+Scenarios:
+    burst       --threads threads each log --records distinct messages
+    repeated    one call site logs --records times (one info message per bad row), with
+                and without the rate limit
+    per-row     the same rows counted with log_pipeline.count and one summary line
+
+Usage:
+    python scripts/bench_logging.py [--records 20000] [--threads 4] [--write-delay-ms 0.05]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from backend.analysis import log_pipeline
+
+logger = logging.getLogger('bench')
+
+
+class SlowStream:
+    """Console stream that takes a fixed time per write"""
+
+    def __init__(self, delay_seconds):
+        self.delay = delay_seconds
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def burst(records, threads):
+    def work(worker):
+        for i in range(records):
+            logger.info(f"worker {worker} record {i}")
+
+    workers = [threading.Thread(target=work, args=(w,)) for w in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return records * threads
+
+
+def repeated(records, threads):
+    for i in range(records):
+        logger.info(f"Invalid IC50 value in row {i}")
+    return records
+
+
+def per_row(records, threads):
+    with log_pipeline.stage_counters('bench'):
+        for i in range(records):
+            log_pipeline.count('invalid_ic50')
+    return records
+
+
+SCENARIOS = {'burst': burst, 'repeated': repeated, 'per-row': per_row}
+
+# (scenario, mode, rate limit); 'repeated' without a limit is the per-row message count() replaces
+RUNS = [
+    ('burst', 'sync', 0), ('burst', 'async', 0),
+    ('repeated', 'sync', 0), ('repeated', 'async', 0), ('repeated', 'async', log_pipeline.LOG_RATE_LIMIT),
+    ('per-row', 'async', log_pipeline.LOG_RATE_LIMIT),
+]
+
+
+def run(scenario, mode, rate_limit, args, log_path):
+    stream = SlowStream(args.write_delay_ms / 1000)
+    log_pipeline.setup_logging(log_path, async_logging=(mode == 'async'), rate_limit=rate_limit, stream=stream)
+    start = time.perf_counter()
+    calls = SCENARIOS[scenario](args.records, args.threads)
+    returned = time.perf_counter() - start
+    log_pipeline.stop_logging()
+    written = time.perf_counter() - start
+    root = logging.getLogger()
+    dropped = sum(getattr(handler, 'dropped_total', 0) for handler in root.handlers)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    return {"calls": calls, "callerUs": returned / calls * 1e6, "callerMs": returned * 1000,
+            "writtenMs": written * 1000, "lines": stream.writes, "dropped": dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000, help='Log calls per thread')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--write-delay-ms', type=float, default=0.05, help='Time per console write')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(',')
+
+    print(f"{'scenario':<10} {'mode':<6} {'limit':>6} {'calls':>8} {'us/call':>9} {'caller ms':>11} "
+          f"{'written ms':>11} {'lines':>8} {'dropped':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario, mode, rate_limit in RUNS:
+            if scenario not in scenarios:
+                continue
+            result = run(scenario, mode, rate_limit, args, os.path.join(tmp, f'{scenario}-{mode}-{rate_limit}.log'))
+            print(f"{scenario:<10} {mode:<6} {rate_limit or '-':>6} {result['calls']:>8} {result['callerUs']:>9.2f} "
+                  f"{result['callerMs']:>11.1f} {result['writtenMs']:>11.1f} {result['lines']:>8} {result['dropped']:>8}")
+    print("caller ms: until the logging threads return; written ms: until every record is written; "
+          f"dropped: records over the queue size ({log_pipeline.LOG_QUEUE_SIZE})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Memory benchmark for activity retrieval and the processed dataset
+
+Builds synthetic ChemBL IC50 activity records (all fields the web service returns)
+and compares the full-record frame with the projected, compact-typed frame produced
+by compact_activities(), then runs the processing steps on the compact frame.
+Reports payload bytes per compound, frame memory and tracemalloc peaks.
+
+Usage:
+    python scripts/bench_memory.py [--compounds 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fields of a ChemBL activity record as returned by the web service
+FULL_RECORD_FIELDS = [
+    'action_type', 'activity_comment', 'activity_id', 'activity_properties', 'assay_chembl_id',
+    'assay_description', 'assay_type', 'assay_variant_accession', 'assay_variant_mutation',
+    'bao_endpoint', 'bao_format', 'bao_label', 'canonical_smiles', 'data_validity_comment',
+    'data_validity_description', 'document_chembl_id', 'document_journal', 'document_year',
+    'ligand_efficiency', 'molecule_chembl_id', 'molecule_pref_name', 'parent_molecule_chembl_id',
+    'pchembl_value', 'potential_duplicate', 'qudt_units', 'record_id', 'relation', 'src_id',
+    'standard_flag', 'standard_relation', 'standard_text_value', 'standard_type', 'standard_units',
+    'standard_upper_value', 'standard_value', 'target_chembl_id', 'target_organism', 'target_pref_name',
+    'target_tax_id', 'text_value', 'toid', 'type', 'units', 'uo_units', 'upper_value', 'value'
+]
+
+SMILES_POOL = [
+    'CC(=O)Oc1ccccc1C(=O)O', 'CN1CCC[C@H]1c1cccnc1', 'c1ccc2c(c1)cc1ccc3cccc4ccc2c1c34',
+    'COc1cc2ncnc(Nc3ccc(F)c(Cl)c3)c2cc1OCCCN1CCOCC1', 'CC(C)Cc1ccc(C(C)C(=O)O)cc1',
+    'O=C(O)c1ccccc1O', 'CCN(CC)CCNC(=O)c1ccc(N)cc1', 'Cn1cnc2c1c(=O)n(C)c(=O)n2C.Cl'
+]
+
+
+def synthetic_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(n):
+        record = {field: f'{field}_{i % 97}' for field in FULL_RECORD_FIELDS}
+        record.update({
+            'activity_id': 1000000 + i,
+            'molecule_chembl_id': f'CHEMBL{100000 + i}',
+            'canonical_smiles': SMILES_POOL[i % 8] + 'C' * (i // 8 % 25) + 'O' + 'C' * (i // 200 % 50),
+            'standard_value': f'{rng.lognormal(7, 2):.2f}',
+            'activity_properties': [],
+            'ligand_efficiency': None
+        })
+        records.append(record)
+    return records
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    result = fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compounds', type=int, default=20000)
+    args = parser.parse_args()
+
+    from backend.analysis import main as analysis
+
+    records = synthetic_records(args.compounds)
+    projected = [{k: r[k] for k in analysis.ACTIVITY_FIELDS} for r in records]
+
+    full_payload = sum(len(json.dumps(r)) for r in records) / len(records)
+    projected_payload = sum(len(json.dumps(r)) for r in projected) / len(records)
+
+    df_full, full_peak = traced(pd.DataFrame.from_dict, records)
+    df_compact, compact_peak = traced(lambda: analysis.compact_activities(pd.DataFrame.from_dict(projected)))
+
+    print(f"compounds: {args.compounds}")
+    print(f"{'':<34} {'full records':>14} {'projected':>14}")
+    print(f"{'payload bytes per compound':<34} {full_payload:>14.0f} {projected_payload:>14.0f}")
+    print(f"{'raw frame MB':<34} {frame_mb(df_full):>14.2f} {frame_mb(df_compact):>14.2f}")
+    print(f"{'raw frame peak MB (tracemalloc)':<34} {full_peak:>14.2f} {compact_peak:>14.2f}")
+
+    # Processed dataset: the legacy dtypes (object strings, float64/int64) vs compact types
+    def process(df):
+        df = analysis.preprocess_data(df)
+        df = analysis.labelcompounds_data(df)
+        df = analysis.add_lipinski_descriptors(df)
+        return analysis.process_ic50_values(df)
+
+    df_final, process_peak = traced(process, df_compact)
+    df_legacy = df_final.astype({
+        'molecule_chembl_id': object, 'canonical_smiles': object, 'class': object,
+        'MW': 'float64', 'LogP': 'float64', 'NumHDonors': 'int64', 'NumHAcceptors': 'int64', 'pIC50': 'float64'
+    })
+    df_legacy['standard_value'] = df_legacy['standard_value'].astype(str).astype(object)
+    print(f"{'final frame MB (legacy dtypes)':<34} {frame_mb(df_legacy):>14.2f}")
+    print(f"{'final frame MB (compact dtypes)':<34} {frame_mb(df_final):>14.2f}")
+    print(f"{'processing peak MB (tracemalloc)':<34} {process_peak:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Model serving benchmark: pickled sklearn forest vs the compact array format
+
+Trains a Random Forest on synthetic fingerprint-like data, stores it as a pickle and
+in the compact format, and measures in a fresh interpreter per format: load time,
+private and shared resident memory after one prediction (private memory is what
+every worker process pays again; shared file pages exist once) and predictions per
+second. Also checks that both formats predict the same values.
+
+Usage:
+    python scripts/bench_model.py [--compounds 5000] [--features 800] [--trees 100] [--batch 1000]
+"""
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+# Runs in the child interpreter: load one model format and predict a batch repeatedly
+CHILD_SCRIPT = """
+import json, pickle, sys, time
+import numpy as np
+
+def memory_mb():
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            fields[name] = value.strip()
+    return {name: int(fields.get(name, '0 kB').split()[0]) / 1024 for name in ('RssAnon', 'RssFile')}
+
+fmt, model_path, X_path, repeats, model_dir = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5]
+X = np.load(X_path)
+if fmt == 'pickle':
+    import sklearn.ensemble
+else:
+    from backend.analysis import forest_model
+before = memory_mb()
+
+start = time.perf_counter()
+if fmt == 'pickle':
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+else:
+    model = forest_model.load_forest(model_path, model_dir)
+load_ms = (time.perf_counter() - start) * 1000
+
+predictions = model.predict(X)
+after = memory_mb()
+
+start = time.perf_counter()
+for _ in range(repeats):
+    model.predict(X)
+seconds = time.perf_counter() - start
+
+np.save(X_path + '.' + fmt + '.npy', predictions)
+print(json.dumps({
+    "loadMs": load_ms,
+    "privateMb": after['RssAnon'] - before['RssAnon'],
+    "sharedMb": after['RssFile'] - before['RssFile'],
+    "predictionsPerSecond": len(X) * repeats / seconds
+}))
+"""
+
+
+def run_child(fmt, model_path, X_path, repeats, model_dir=''):
+    result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT, fmt, model_path, X_path, str(repeats), model_dir],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--compounds', type=int, default=5000)
+    parser.add_argument('--features', type=int, default=800)
+    parser.add_argument('--trees', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    from sklearn.ensemble import RandomForestRegressor
+    from backend.analysis import forest_model
+
+    # Sparse binary features with a few informative bits, like PaDEL fingerprints
+    rng = np.random.default_rng(0)
+    X = (rng.random((args.compounds, args.features)) < 0.15).astype('float32')
+    y = X[:, :20] @ rng.normal(0, 0.5, 20) + rng.normal(6, 0.5, args.compounds)
+    model = RandomForestRegressor(n_estimators=args.trees, random_state=42, n_jobs=-1).fit(X, y)
+    model.set_params(n_jobs=None)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        pickle_path = os.path.join(work_dir, 'model.pkl')
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        model_dir = os.path.join(work_dir, 'models')
+        model_key = forest_model.save_forest(model, model_dir=model_dir)
+        pickle_bytes = os.path.getsize(pickle_path)
+        compact_bytes = sum(entry.stat().st_size for entry in os.scandir(os.path.join(model_dir, model_key)))
+
+        X_path = os.path.join(work_dir, 'X.npy')
+        np.save(X_path, X[:args.batch])
+
+        results = {
+            'pickle': run_child('pickle', pickle_path, X_path, args.repeats),
+            'compact': run_child('compact', model_key, X_path, args.repeats, model_dir)
+        }
+        difference = np.abs(np.load(X_path + '.pickle.npy') - np.load(X_path + '.compact.npy')).max()
+
+    print(f"compounds: {args.compounds}, features: {args.features}, trees: {args.trees}, batch: {args.batch}")
+    print(f"{'':<28} {'pickle':>12} {'compact':>12}")
+    print(f"{'file MB':<28} {pickle_bytes / 1e6:>12.2f} {compact_bytes / 1e6:>12.2f}")
+    for label, key in (('load ms', 'loadMs'), ('private RSS MB per worker', 'privateMb'),
+                       ('shared RSS MB', 'sharedMb'), ('predictions / s', 'predictionsPerSecond')):
+        print(f"{label:<28} {results['pickle'][key]:>12.1f} {results['compact'][key]:>12.1f}")
+    print(f"max prediction difference: {difference:.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Startup-time benchmark for the DrugPredict API
+
+Starts a fresh interpreter for every run, imports backend/api/flask_app.py in the
+given startup mode and measures the time until /api/health answers.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--modes lazy,eager]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter: import the app and answer a health check
+CHILD_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from backend.api import flask_app
+imported = time.perf_counter()
+app = flask_app.create_app(start_workers=False)
+response = app.test_client().get('/api/health')
+ready = time.perf_counter()
+print(json.dumps({
+    "importMs": (imported - start) * 1000,
+    "healthMs": (ready - start) * 1000,
+    "status": response.status_code,
+    "importTimingsMs": flask_app.import_timings
+}))
+"""
+
+
+def run_once(mode):
+    env = dict(os.environ, DRUGPREDICT_STARTUP_MODE=mode, DRUGPREDICT_TASK_STORE='memory')
+    result = subprocess.run([sys.executable, '-c', CHILD_SCRIPT], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--modes', default='lazy,eager')
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'import ms (median)':>20} {'first /api/health ms (median)':>32}")
+    for mode in args.modes.split(','):
+        try:
+            runs = [run_once(mode) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{mode:<8} failed: {e}")
+            continue
+        import_ms = statistics.median(r['importMs'] for r in runs)
+        health_ms = statistics.median(r['healthMs'] for r in runs)
+        print(f"{mode:<8} {import_ms:>20.1f} {health_ms:>32.1f}")
+        if runs[-1]['importTimingsMs']:
+            for module_name, ms in runs[-1]['importTimingsMs'].items():
+                print(f"    {module_name:<40} {ms:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
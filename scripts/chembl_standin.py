@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the ChemBL data web service
+
+Serves target and activity records the way www.ebi.ac.uk/chembl/api/data does for
+the chembl_webresource_client (SPORE description, paginated list queries with
+filters, only= and order_by, target search and detail lookups), with configurable
+latency and error rate. Records are synthetic, or recorded responses loaded from a
+JSON file of the form {"targets": [...], "activities": [...]}.
+
+Point the API at it with:
+    DRUGPREDICT_CHEMBL_URL=http://localhost:8765/chembl/api/data DRUGPREDICT_CHEMBL_CACHE=0
+
+Usage:
+    python scripts/chembl_standin.py [--port 8765] [--targets 200] [--activities 2000]
+        [--latency-ms 50] [--jitter-ms 20] [--error-rate 0.0] [--data recorded.json]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+
+API_PATH = '/chembl/api/data'
+
+# Resources served, with the collection key of their list responses
+RESOURCES = {'target': 'targets', 'activity': 'activities'}
+
+# Frequently requested targets, so realistic searches find something
+TARGET_NAMES = [
+    'Epidermal growth factor receptor erbB1', 'Acetylcholinesterase', 'Replicase polyprotein 1ab',
+    'SARS coronavirus 3C-like proteinase', 'Cyclooxygenase-2', 'Dopamine D2 receptor',
+    'Beta-secretase 1', 'Carbonic anhydrase II', 'Tyrosine-protein kinase ABL',
+    'Serotonin transporter', 'HERG', 'Thrombin', 'Histone deacetylase 1', 'Estrogen receptor alpha',
+    'Glycogen synthase kinase-3 beta', 'Phosphodiesterase 4B', 'Cannabinoid CB1 receptor'
+]
+GENE_SYMBOLS = ['EGFR', 'ACHE', 'rep', '3CL', 'PTGS2', 'DRD2', 'BACE1', 'CA2', 'ABL1', 'SLC6A4',
+                'KCNH2', 'F2', 'HDAC1', 'ESR1', 'GSK3B', 'PDE4B', 'CNR1']
+ORGANISMS = ['Homo sapiens', 'Rattus norvegicus', 'Mus musculus', 'Severe acute respiratory syndrome coronavirus 2']
+TARGET_TYPES = ['SINGLE PROTEIN', 'PROTEIN COMPLEX', 'PROTEIN FAMILY']
+
+# Fragments combined into valid SMILES for synthetic compounds
+SCAFFOLDS = ['c1ccc({})cc1', 'c1ccc2[nH]c({})cc2c1', 'O=C(N{})c1ccccc1', 'c1cnc({})nc1',
+             'C1CCN(CC1){}', 'c1ccc2ncc({})cc2c1', 'O=C1CCC(N1){}', 'c1csc({})n1']
+SUBSTITUENTS = ['C', 'CC', 'OC', 'N', 'Cl', 'F', 'C(F)(F)F', 'CCN(C)C', 'C(=O)O', 'c1ccccc1',
+                'CCO', 'S(=O)(=O)N', 'C#N', 'OCC', 'CC(C)C', 'c1ccncc1']
+
+
+def synthetic_records(n_targets, activities_per_target, seed=0):
+    """Synthetic targets and IC50 activities (activity counts vary around the mean)"""
+    rng = np.random.default_rng(seed)
+    targets = []
+    activities = []
+    activity_id = 1000000
+    for i in range(n_targets):
+        name = TARGET_NAMES[i] if i < len(TARGET_NAMES) else f'{TARGET_NAMES[i % len(TARGET_NAMES)]} {i}'
+        target_id = f'CHEMBL{200 + i}'
+        targets.append({
+            'target_chembl_id': target_id,
+            'pref_name': name,
+            'organism': ORGANISMS[i % len(ORGANISMS)],
+            'target_type': TARGET_TYPES[i % len(TARGET_TYPES)],
+            'gene_symbol': GENE_SYMBOLS[i % len(GENE_SYMBOLS)],
+            'species_group_flag': False
+        })
+        for _ in range(max(1, int(rng.exponential(activities_per_target)))):
+            scaffold = SCAFFOLDS[rng.integers(len(SCAFFOLDS))]
+            smiles = scaffold.format(''.join(rng.choice(SUBSTITUENTS, rng.integers(1, 4))))
+            activities.append({
+                'activity_id': activity_id,
+                'molecule_chembl_id': f'CHEMBL{int(rng.integers(10000, 3000000))}',
+                'canonical_smiles': smiles,
+                'standard_type': 'IC50' if rng.random() < 0.8 else 'Ki',
+                'standard_value': f'{rng.lognormal(7, 2):.2f}',
+                'standard_units': 'nM',
+                'standard_relation': '=',
+                'target_chembl_id': target_id,
+                'target_pref_name': name
+            })
+            activity_id += 1
+    return targets, activities
+
+
+def spore_description(base_url):
+    """SPORE description the client builds its resources from"""
+    methods = {}
+    for name, collection in RESOURCES.items():
+        definition = {'resource_name': name, 'collection_name': collection,
+                      'formats': ['json'], 'default_format': 'application/json'}
+        methods[f'GET_{name}_dispatch_list'] = definition
+        methods[f'GET_{name}_dispatch_detail'] = definition
+        if name == 'target':
+            methods['GET_target_get_search'] = definition
+    return {'name': 'ChEMBL stand-in', 'base_url': base_url, 'methods': methods}
+
+
+def _matches(record, field, value):
+    name, _, lookup = field.partition('__')
+    actual = record.get(name)
+    if actual is None:
+        return False
+    if lookup == '':
+        return str(actual) == value
+    if lookup == 'in':
+        return str(actual) in value.split(',')
+    if lookup == 'iexact':
+        return str(actual).lower() == value.lower()
+    if lookup == 'icontains':
+        return value.lower() in str(actual).lower()
+    if lookup in ('gt', 'gte', 'lt', 'lte'):
+        actual, value = float(actual), float(value)
+        return {'gt': actual > value, 'gte': actual >= value,
+                'lt': actual < value, 'lte': actual <= value}[lookup]
+    raise ValueError(f'Unsupported filter: {field}')
+
+
+class StandIn:
+    """Record store and query evaluation behind the HTTP handler"""
+
+    def __init__(self, targets, activities, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503):
+        self.targets = {t['target_chembl_id']: t for t in targets}
+        self.activities_by_target = defaultdict(list)
+        for activity in activities:
+            self.activities_by_target[activity['target_chembl_id']].append(activity)
+        self.activities = activities
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def delay(self):
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+
+    def inject_error(self):
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+        return failed
+
+    def search(self, query):
+        query = query.lower()
+        hits = [t for t in self.targets.values()
+                if query in t['pref_name'].lower() or query == t['target_chembl_id'].lower()
+                or t.get('gene_symbol', '').lower().startswith(query)]
+        # Names starting with the query rank first, like a relevance score
+        return sorted(hits, key=lambda t: (not t['pref_name'].lower().startswith(query), len(t['pref_name'])))
+
+    def query(self, resource, params, search=False):
+        """
+        Evaluate a list query
+
+        Args:
+            resource (str): 'target' or 'activity'
+            params (list): (name, value) pairs as sent by the client
+            search (bool): Full-text target search (the q parameter)
+
+        Returns:
+            dict: List response with page_meta
+        """
+        filters = []
+        only = []
+        ordering = []
+        limit, offset = 20, 0
+        query = ''
+        for name, value in params:
+            if name == 'only':
+                # only(list) arrives as one pair with a list value
+                only.extend(value if isinstance(value, list) else unquote(str(value)).split(','))
+                continue
+            value = unquote(str(value))
+            if name == 'limit':
+                limit = min(int(value), 1000)
+            elif name == 'offset':
+                offset = int(value)
+            elif name == 'order_by':
+                ordering.append(value)
+            elif name == 'q':
+                query = value
+            elif name != 'format':
+                filters.append((name, value))
+
+        if search:
+            records = self.search(query)
+        elif resource == 'activity':
+            # Activities are indexed by target, like the real service
+            target_ids = [v for f, v in filters if f == 'target_chembl_id']
+            records = self.activities_by_target.get(target_ids[0], []) if target_ids else self.activities
+        else:
+            records = list(self.targets.values())
+
+        records = [r for r in records if all(_matches(r, f, v) for f, v in filters)]
+        for field in reversed(ordering):
+            key = field.lstrip('-')
+            records = sorted(records, key=lambda r: (r.get(key) is None, r.get(key)), reverse=field.startswith('-'))
+
+        page = records[offset:offset + limit]
+        if only:
+            page = [{k: r.get(k) for k in only} for r in page]
+        return {
+            'page_meta': {
+                'limit': limit,
+                'offset': offset,
+                'total_count': len(records),
+                'next': None if offset + limit >= len(records) else f'offset={offset + limit}',
+                'previous': None if offset == 0 else f'offset={max(0, offset - limit)}'
+            },
+            RESOURCES[resource]: page
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, body_params):
+        url = urlsplit(self.path)
+        if not url.path.startswith(API_PATH):
+            return self.send_json(404, {'error': 'Not found'})
+        path = url.path[len(API_PATH):].strip('/')
+        if path.endswith('.json'):
+            path = path[:-len('.json')]
+
+        if path == 'spore':
+            host = self.headers.get('Host', 'localhost')
+            return self.send_json(200, spore_description(f'http://{host}{API_PATH}/'))
+
+        self.standin.delay()
+        if self.standin.inject_error():
+            return self.send_json(self.standin.error_status, {'error': 'Injected error'})
+
+        parts = path.split('/')
+        resource = parts[0]
+        if resource not in RESOURCES:
+            return self.send_json(404, {'error': f'Unknown resource: {resource}'})
+        params = parse_qsl(url.query) + body_params
+
+        try:
+            if len(parts) == 1:
+                return self.send_json(200, self.standin.query(resource, params))
+            if parts[1] == 'search' and resource == 'target':
+                return self.send_json(200, self.standin.query(resource, params, search=True))
+            if resource == 'target' and parts[1] in self.standin.targets:
+                return self.send_json(200, self.standin.targets[parts[1]])
+            return self.send_json(404, {'error': 'Not found'})
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+
+    def do_GET(self):
+        self.handle_request([])
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length) or b'[]')
+        # The client sends list queries as a JSON list of [name, value] pairs
+        params = [tuple(pair) for pair in data] if isinstance(data, list) else list(data.items())
+        self.handle_request(params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--targets', type=int, default=200, help='Synthetic targets')
+    parser.add_argument('--activities', type=int, default=2000, help='Mean activities per synthetic target')
+    parser.add_argument('--data', help='JSON file with recorded targets and activities')
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.data:
+        with open(args.data) as f:
+            recorded = json.load(f)
+        targets, activities = recorded['targets'], recorded['activities']
+    else:
+        targets, activities = synthetic_records(args.targets, args.activities, args.seed)
+
+    random.seed(args.seed)
+    Handler.standin = StandIn(targets, activities, args.latency_ms, args.jitter_ms,
+                              args.error_rate, args.error_status)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f"ChemBL stand-in with {len(targets)} targets and {len(activities)} activities "
+          f"at http://{args.host}:{args.port}{API_PATH}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin = Handler.standin
+        print(f"Served {standin.requests} requests, {standin.errors} injected errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+Build the local ChemBL snapshot used by DRUGPREDICT_DATA_SOURCE=local
+
+Imports the targets and the activities of the selected types from a ChemBL release
+(the SQLite download, e.g. chembl_35.db) or from a JSON file of the form
+{"targets": [...], "activities": [...]} (the format of scripts/chembl_standin.py)
+into a compact SQLite database. The indexes are created after the bulk insert:
+
+    activities (target_chembl_id, standard_type, activity_id)   activity queries of a target
+    activities (molecule_chembl_id)                              lookups by molecule
+    target_synonyms (synonym)                                    target search by gene symbol
+
+The snapshot is written next to the output and moved into place when complete, so a
+running API keeps reading the previous one until it is restarted.
+
+Usage:
+    python scripts/import_chembl_snapshot.py --chembl-db chembl_35.db [--output data/chembl/chembl_snapshot.db]
+    python scripts/import_chembl_snapshot.py --json recorded.json [--types IC50,Ki]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from backend.analysis.data_sources import SNAPSHOT_PATH, SNAPSHOT_VERSION
+
+SCHEMA = """
+CREATE TABLE targets (
+    target_chembl_id TEXT PRIMARY KEY,
+    pref_name TEXT,
+    organism TEXT,
+    target_type TEXT,
+    n_activities INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE target_synonyms (
+    target_chembl_id TEXT NOT NULL,
+    synonym TEXT NOT NULL COLLATE NOCASE
+);
+CREATE TABLE activities (
+    activity_id INTEGER PRIMARY KEY,
+    target_chembl_id TEXT NOT NULL,
+    standard_type TEXT NOT NULL,
+    molecule_chembl_id TEXT,
+    canonical_smiles TEXT,
+    standard_value REAL
+);
+CREATE TABLE snapshot_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INDEXES = """
+CREATE INDEX idx_activities_target ON activities (target_chembl_id, standard_type, activity_id);
+CREATE INDEX idx_activities_molecule ON activities (molecule_chembl_id);
+CREATE INDEX idx_target_synonyms ON target_synonyms (synonym);
+"""
+
+# Rows per executemany batch of the JSON import
+BATCH_ROWS = 50000
+
+
+def import_chembl_release(conn, chembl_db, types):
+    """Copy targets, synonyms and activities from a ChemBL release database"""
+    conn.execute("ATTACH DATABASE ? AS chembl", (chembl_db,))
+    placeholders = ', '.join('?' * len(types))
+    conn.execute(
+        "INSERT INTO targets (target_chembl_id, pref_name, organism, target_type)"
+        " SELECT chembl_id, pref_name, organism, target_type FROM chembl.target_dictionary")
+    conn.execute(
+        "INSERT INTO target_synonyms (target_chembl_id, synonym)"
+        " SELECT DISTINCT td.chembl_id, cs.component_synonym FROM chembl.target_dictionary td"
+        " JOIN chembl.target_components tc ON tc.tid = td.tid"
+        " JOIN chembl.component_synonyms cs ON cs.component_id = tc.component_id"
+        " WHERE cs.syn_type IN ('GENE_SYMBOL', 'UNIPROT')")
+    conn.execute(
+        "INSERT INTO activities (activity_id, target_chembl_id, standard_type, molecule_chembl_id,"
+        " canonical_smiles, standard_value)"
+        " SELECT act.activity_id, td.chembl_id, act.standard_type, md.chembl_id, cs.canonical_smiles,"
+        " act.standard_value FROM chembl.activities act"
+        " JOIN chembl.assays a ON a.assay_id = act.assay_id"
+        " JOIN chembl.target_dictionary td ON td.tid = a.tid"
+        " JOIN chembl.molecule_dictionary md ON md.molregno = act.molregno"
+        " LEFT JOIN chembl.compound_structures cs ON cs.molregno = act.molregno"
+        f" WHERE act.standard_type IN ({placeholders})", types)
+    conn.commit()
+    conn.execute("DETACH DATABASE chembl")
+    return f"chembl-release:{os.path.basename(chembl_db)}"
+
+
+def import_json(conn, json_path, types):
+    """Copy targets and activities from a JSON file of web service records"""
+    with open(json_path) as f:
+        data = json.load(f)
+    conn.executemany(
+        "INSERT OR REPLACE INTO targets (target_chembl_id, pref_name, organism, target_type) VALUES (?, ?, ?, ?)",
+        [(t['target_chembl_id'], t.get('pref_name'), t.get('organism'), t.get('target_type'))
+         for t in data['targets']])
+    conn.executemany(
+        "INSERT INTO target_synonyms (target_chembl_id, synonym) VALUES (?, ?)",
+        [(t['target_chembl_id'], t['gene_symbol']) for t in data['targets'] if t.get('gene_symbol')])
+
+    wanted = set(types)
+    rows = [(int(a['activity_id']), a['target_chembl_id'], a['standard_type'], a.get('molecule_chembl_id'),
+             a.get('canonical_smiles'), _to_float(a.get('standard_value')))
+            for a in data['activities'] if a.get('standard_type') in wanted]
+    for start in range(0, len(rows), BATCH_ROWS):
+        conn.executemany("INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?, ?)", rows[start:start + BATCH_ROWS])
+    conn.commit()
+    return f"json:{os.path.basename(json_path)}"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_snapshot(output, chembl_db=None, json_path=None, types=('IC50',)):
+    """
+    Build a snapshot database at output
+
+    Returns:
+        dict: Row counts of the snapshot
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tmp_path = f"{output}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # The file is discarded if the import fails, so skip the journal
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(SCHEMA)
+        if chembl_db:
+            source = import_chembl_release(conn, chembl_db, list(types))
+        else:
+            source = import_json(conn, json_path, list(types))
+
+        conn.executescript(INDEXES)
+        conn.execute(
+            "UPDATE targets SET n_activities = (SELECT count(*) FROM activities a"
+            " WHERE a.target_chembl_id = targets.target_chembl_id)")
+        info = {"version": SNAPSHOT_VERSION, "source": source, "types": ','.join(types),
+                "imported": datetime.now().isoformat(timespec='seconds')}
+        conn.executemany("INSERT INTO snapshot_info (key, value) VALUES (?, ?)",
+                         [(key, str(value)) for key, value in info.items()])
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+        counts = {table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                  for table in ('targets', 'target_synonyms', 'activities')}
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, output)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--chembl-db', help='ChemBL release SQLite database')
+    source.add_argument('--json', help='JSON file with targets and activities')
+    parser.add_argument('--output', default=SNAPSHOT_PATH, help='Snapshot database')
+    parser.add_argument('--types', default='IC50', help='Comma-separated standard types to import')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = build_snapshot(os.path.abspath(args.output), args.chembl_db, args.json, args.types.split(','))
+    print(f"Imported {counts['targets']} targets, {counts['target_synonyms']} synonyms and "
+          f"{counts['activities']} activities into {os.path.abspath(args.output)} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
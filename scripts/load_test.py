@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Load generator for the DrugPredict API
+
+Runs concurrent user sessions against a running API: type a target name into the
+autocomplete (one /api/targets/search per keystroke from the second character),
+submit the analysis, poll /api/progress until it finishes and fetch the plots of
+the results (thumbnails, one full-size image and the plot data). Reports latency
+percentiles, throughput and error rate per endpoint.
+
+Run the API against the ChemBL stand-in so no traffic reaches the real service:
+    python scripts/chembl_standin.py &
+    DRUGPREDICT_CHEMBL_URL=http://localhost:8765/chembl/api/data DRUGPREDICT_CHEMBL_CACHE=0 \\
+        DRUGPREDICT_TASK_STORE=memory python backend/api/flask_app.py
+
+Usage:
+    python scripts/load_test.py [--base-url http://localhost:5001] [--users 10] [--duration 60]
+        [--targets EGFR,Acetylcholinesterase] [--limit 100] [--json report.json]
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+# Targets picked by the simulated users, most popular first
+DEFAULT_TARGETS = ['EGFR', 'Acetylcholinesterase', 'coronavirus', 'Cyclooxygenase-2', 'Dopamine D2 receptor',
+                   'Beta-secretase 1', 'Thrombin', 'HERG']
+
+# Request paths are reported by endpoint, with IDs replaced by placeholders
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^/api/progress/[^/]+$'), '/api/progress/<task_id>'),
+    (re.compile(r'^/api/plots/[^/]+$'), '/api/plots/<data_key>'),
+    (re.compile(r'^/outputs/plots/[^/]+/[^/]+$'), '/outputs/plots/<data_key>/<file>'),
+    (re.compile(r'^/outputs/[^/]+$'), '/outputs/<file>'),
+]
+
+
+def endpoint_name(method, path):
+    for pattern, name in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return f'{method} {name}'
+    return f'{method} {path}'
+
+
+class Recorder:
+    """Thread-safe latency and error samples per endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self, elapsed):
+        rows = []
+        for endpoint in sorted(self.latencies):
+            ms = np.array(self.latencies[endpoint]) * 1000
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(ms),
+                "perSecond": round(len(ms) / elapsed, 2),
+                "errorRate": round(self.errors[endpoint] / len(ms), 4),
+                "p50Ms": round(float(np.percentile(ms, 50)), 1),
+                "p95Ms": round(float(np.percentile(ms, 95)), 1),
+                "p99Ms": round(float(np.percentile(ms, 99)), 1)
+            })
+        return rows
+
+
+class Session:
+    """One simulated user working through the analysis flow"""
+
+    def __init__(self, args, recorder, rng):
+        self.args = args
+        self.recorder = recorder
+        self.rng = rng
+        self.http = requests.Session()
+
+    def request(self, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.args.base_url + path, timeout=self.args.timeout, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(endpoint_name(method, urlsplit(path).path), time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def autocomplete(self, target):
+        for length in range(2, min(len(target), self.args.max_keystrokes) + 1):
+            self.request('GET', '/api/targets/search', params={'q': target[:length]})
+            time.sleep(self.args.keystroke_delay)
+
+    def submit(self, target):
+        response = self.request('POST', '/api/search', json={'target': target, 'limit': str(self.args.limit)})
+        return response.json().get('taskId') if response is not None else None
+
+    def poll(self, task_id, deadline):
+        while time.time() < deadline:
+            time.sleep(self.args.poll_interval)
+            response = self.request('GET', f'/api/progress/{task_id}')
+            if response is None:
+                continue
+            progress = response.json()
+            if progress.get('status') in ('complete', 'error', 'cancelled'):
+                return progress.get('results')
+        return None
+
+    def fetch_plots(self, results):
+        plots = list(results.get('plots') or [])
+        for plot in plots:
+            self.fetch(plot.get('thumbnailPath') or plot.get('imagePath'))
+        if plots:
+            # Users open one plot at full size and the interactive chart data
+            opened = plots[self.rng.integers(len(plots))]
+            self.fetch(opened.get('imagePath'))
+            self.fetch(opened.get('dataPath'))
+
+    def fetch(self, url):
+        if not url:
+            return
+        # Result URLs are absolute for the production host; keep only path and query
+        parts = urlsplit(url)
+        self.request('GET', parts.path + (f'?{parts.query}' if parts.query else ''))
+
+    def run(self, stop_at):
+        targets = self.args.targets
+        # Zipf-like popularity: the first targets are requested most often
+        weights = 1 / np.arange(1, len(targets) + 1)
+        while time.time() < stop_at:
+            target = targets[self.rng.choice(len(targets), p=weights / weights.sum())]
+            self.autocomplete(target)
+            task_id = self.submit(target)
+            if task_id:
+                results = self.poll(task_id, min(stop_at, time.time() + self.args.session_timeout))
+                if results:
+                    self.fetch_plots(results)
+            time.sleep(self.rng.exponential(self.args.think_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5001')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent sessions')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run')
+    parser.add_argument('--targets', default=','.join(DEFAULT_TARGETS))
+    parser.add_argument('--limit', type=int, default=100, help='Compounds per analysis')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--keystroke-delay', type=float, default=0.15)
+    parser.add_argument('--max-keystrokes', type=int, default=6)
+    parser.add_argument('--think-time', type=float, default=2.0, help='Mean pause between sessions of a user')
+    parser.add_argument('--session-timeout', type=float, default=300)
+    parser.add_argument('--timeout', type=float, default=30, help='Request timeout')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+    args.base_url = args.base_url.rstrip('/')
+    args.targets = [t.strip() for t in args.targets.split(',') if t.strip()]
+
+    recorder = Recorder()
+    start = time.time()
+    stop_at = start + args.duration
+    threads = []
+    for i in range(args.users):
+        session = Session(args, recorder, np.random.default_rng(args.seed + i))
+        thread = threading.Thread(target=session.run, args=(stop_at,), daemon=True)
+        # Stagger the users so they do not all type at the same moment
+        time.sleep(session.rng.uniform(0, 0.5))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join(args.duration + args.session_timeout + args.timeout)
+    elapsed = time.time() - start
+
+    rows = recorder.report(elapsed)
+    print(f"users: {args.users}, duration: {elapsed:.1f}s, base URL: {args.base_url}")
+    print(f"{'endpoint':<44} {'requests':>9} {'req/s':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<44} {row['requests']:>9} {row['perSecond']:>8.2f} {row['errorRate']:>8.2%} "
+              f"{row['p50Ms']:>9.1f} {row['p95Ms']:>9.1f} {row['p99Ms']:>9.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"users": args.users, "durationSeconds": round(elapsed, 1), "endpoints": rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
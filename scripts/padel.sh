@@ -1,12 +1,14 @@
 #!/bin/bash
 
 # PaDEL Descriptor calculation script
-# Expects molecule.smi in data/processed directory
-# Outputs descriptors_output.csv in data/processed directory
+# Usage: padel.sh [input_dir] [output_file]
+# Expects molecule.smi in input_dir (default: data/processed directory)
+# Outputs output_file (default: descriptors_output.csv in input_dir)
 
 SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )"
 PROJECT_ROOT="$(dirname "$SCRIPT_DIR")"
-DATA_DIR="$PROJECT_ROOT/data/processed"
+DATA_DIR="${1:-$PROJECT_ROOT/data/processed}"
+OUTPUT_FILE="${2:-$DATA_DIR/descriptors_output.csv}"
 
 # Ensure data directory exists
 mkdir -p "$DATA_DIR"
@@ -18,4 +20,4 @@ java -Xms1G -Xmx1G -Djava.awt.headless=true -jar "$SCRIPT_DIR/PaDEL-Descriptor/P
     -fingerprints \
     -descriptortypes "$SCRIPT_DIR/PaDEL-Descriptor/PubchemFingerprinter.xml" \
     -dir "$DATA_DIR" \
-    -file "$DATA_DIR/descriptors_output.csv"
+    -file "$OUTPUT_FILE"
@@ -135,7 +135,7 @@ export default function ProgressBar({ isActive, taskId, onComplete }: ProgressBa
           return // Stop polling
         }
         
-        if (data.status === 'error') {
+        if (data.status === 'error' || data.status === 'cancelled') {
           console.error('Analysis failed:', data.message)
           return // Stop polling
         }
@@ -156,6 +156,24 @@ export default function ProgressBar({ isActive, taskId, onComplete }: ProgressBa
     }
   }, [isActive, taskId, onComplete])
 
+  // Cancel the backend task when the user leaves the page while it is still running
+  useEffect(() => {
+    if (!isActive || !taskId) return
+
+    const handlePageHide = () => {
+      if (status === 'running' || status === 'queued') {
+        const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5001/api'
+        navigator.sendBeacon(`${apiUrl}/tasks/${taskId}/cancel`)
+      }
+    }
+
+    window.addEventListener('pagehide', handlePageHide)
+
+    return () => {
+      window.removeEventListener('pagehide', handlePageHide)
+    }
+  }, [isActive, taskId, status])
+
   // Remove the old currentStep effect since we handle it in the main effect now
 
   if (!isActive) {
@@ -168,11 +186,13 @@ export default function ProgressBar({ isActive, taskId, onComplete }: ProgressBa
     <div className="bg-white rounded-2xl shadow-xl p-8 border border-gray-100">
       <div className="text-center mb-8">
         <h2 className="text-3xl font-bold bg-gradient-to-r from-blue-600 to-indigo-600 bg-clip-text text-transparent mb-3">
-          {status === 'error' ? 'Analysis Failed' : status === 'complete' ? 'Analysis Complete' : 'Analyzing Target Data'}
+          {status === 'error' ? 'Analysis Failed' : status === 'cancelled' ? 'Analysis Cancelled' : status === 'complete' ? 'Analysis Complete' : 'Analyzing Target Data'}
         </h2>
         <p className="text-gray-600 text-lg">
           {status === 'error' 
             ? 'There was an error during analysis. Please try again.' 
+            : status === 'cancelled'
+              ? 'The analysis was cancelled.'
             : status === 'complete' 
               ? 'Analysis completed successfully!' 
               : 'This may take a few minutes depending on the dataset size...'}
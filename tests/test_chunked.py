@@ -0,0 +1,128 @@
+#DrugPredict - Out-of-core preprocessing and statistics
+#Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import mannwhitneyu
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.analysis.chunked import (mannwhitney_from_counts, run_chunked, read_output, write_partitions,
+                                      StatisticsAggregate, STAT_RESOLUTION)
+from backend.analysis.standardize import standardize_structures
+
+# Parents together with salt forms, charged forms and differently written duplicates
+SMILES = [smiles for n in range(1, 31) for smiles in (
+    'C' * n + 'N', 'C' * n + 'N.Cl', 'NC' + 'C' * (n - 1), 'C' * n + 'C(=O)O', 'C' * n + 'C(=O)[O-].[Na+]'
+)] + ['not a smiles']
+
+
+def activity_frame(n_rows=600):
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(6, 2, n_rows)
+    values[rng.random(n_rows) < 0.05] = np.nan
+    values[rng.random(n_rows) < 0.05] = 0
+    return pd.DataFrame({
+        'molecule_chembl_id': [f'CHEMBL{i}' for i in range(n_rows)],
+        'canonical_smiles': rng.choice(SMILES, n_rows),
+        'standard_value': values
+    })
+
+
+def usable(df):
+    df = df[df.standard_value.notna() & (df.standard_value != 0) & df.canonical_smiles.notna()]
+    return df[['molecule_chembl_id', 'canonical_smiles', 'standard_value']]
+
+
+def labelled(df):
+    df = df.copy()
+    df['class'] = np.where(df['standard_value'] <= 1000, 'active', 'inactive')
+    df['pIC50'] = 9 - np.log10(df['standard_value'].astype('float64'))
+    for descriptor in ('MW', 'LogP', 'NumHDonors', 'NumHAcceptors'):
+        df[descriptor] = df['n_measurements'].astype('float64')
+    return df
+
+
+def run(tmp_path, df, chunk_rows):
+    batches = [df.iloc[start:start + 70] for start in range(0, len(df), 70)]
+    write_partitions(batches, str(tmp_path / 'raw'))
+    output_dir, statistics, raw_rows = run_chunked(str(tmp_path / 'raw'), str(tmp_path / 'work'), usable, labelled,
+                                                   chunk_rows=chunk_rows)
+    return read_output(output_dir), statistics, raw_rows
+
+
+@pytest.mark.parametrize('chunk_rows', [25, 1000])
+def test_run_chunked_matches_in_memory_standardization(tmp_path, chunk_rows):
+    df = activity_frame()
+    result, _, raw_rows = run(tmp_path, df, chunk_rows)
+    expected = labelled(standardize_structures(usable(df)))
+    assert raw_rows == len(df)
+    assert result['canonical_smiles'].tolist() == expected['canonical_smiles'].tolist()
+    assert result['molecule_chembl_id'].tolist() == expected['molecule_chembl_id'].tolist()
+    assert result['n_measurements'].tolist() == expected['n_measurements'].tolist()
+    np.testing.assert_allclose(result['standard_value'], expected['standard_value'], rtol=1e-6)
+    assert result['class'].tolist() == expected['class'].tolist()
+
+
+def test_chunked_statistics_match_final_dataset(tmp_path):
+    result, statistics, _ = run(tmp_path, activity_frame(), 25)
+    assert statistics.rows == len(result)
+    assert statistics.class_counts.to_dict() == result['class'].value_counts().to_dict()
+
+    active = result[result['class'] == 'active']
+    inactive = result[result['class'] == 'inactive']
+    for descriptor in STAT_RESOLUTION:
+        u, p = statistics.mannwhitney(descriptor)
+        expected = mannwhitneyu(active[descriptor], inactive[descriptor], method='asymptotic')
+        if descriptor == 'pIC50':
+            # Values are ranked at STAT_RESOLUTION
+            assert p == pytest.approx(expected.pvalue, abs=1e-3)
+        else:
+            assert (u, p) == pytest.approx((expected.statistic, expected.pvalue))
+
+
+def test_statistics_merge_equals_single_aggregate():
+    df = labelled(standardize_structures(usable(activity_frame())))
+    whole = StatisticsAggregate()
+    whole.add(df)
+    first, second = StatisticsAggregate(), StatisticsAggregate()
+    first.add(df.iloc[:20])
+    second.add(df.iloc[20:])
+    merged = first.merge(second)
+    assert merged.rows == whole.rows
+    assert merged.class_counts.to_dict() == whole.class_counts.to_dict()
+    for descriptor in STAT_RESOLUTION:
+        assert merged.mannwhitney(descriptor) == whole.mannwhitney(descriptor)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_mannwhitney_from_counts_matches_scipy(seed):
+    rng = np.random.default_rng(seed)
+    # Small integer values give many ties
+    x = rng.integers(0, 8, rng.integers(5, 60))
+    y = rng.integers(2, 10, rng.integers(5, 60))
+    u, p = mannwhitney_from_counts(pd.Series(x).value_counts(), pd.Series(y).value_counts())
+    expected = mannwhitneyu(x, y, method='asymptotic')
+    assert u == pytest.approx(expected.statistic)
+    assert p == pytest.approx(expected.pvalue)
+
+
+def test_mannwhitney_from_counts_of_continuous_values():
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(0, 1, 40), rng.normal(0.5, 1, 55)
+    u, p = mannwhitney_from_counts(pd.Series(x).value_counts(), pd.Series(y).value_counts())
+    expected = mannwhitneyu(x, y, method='asymptotic')
+    assert (u, p) == pytest.approx((expected.statistic, expected.pvalue))
+
+
+def test_mannwhitney_from_counts_of_identical_values():
+    assert mannwhitney_from_counts(pd.Series({3: 4}), pd.Series({3: 6})) == (12.0, 1.0)
+
+
+def test_mannwhitney_from_counts_requires_observations():
+    with pytest.raises(ValueError):
+        mannwhitney_from_counts(pd.Series({1: 2}), pd.Series(dtype='int64'))
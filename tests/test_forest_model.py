@@ -0,0 +1,60 @@
+#DrugPredict - Compact Random Forest predictions
+#Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.analysis import forest_model
+from backend.analysis.forest_model import CompactForest
+
+
+def fitted_forest(n_rows=300, n_features=12, **params):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_features))
+    # Repeated values give thresholds that rows fall exactly on
+    X[:, 0] = np.round(X[:, 0], 1)
+    y = X[:, 0] * 2 + np.sin(X[:, 1]) + rng.normal(0, 0.1, n_rows)
+    model = RandomForestRegressor(random_state=0, **params).fit(X, y)
+    return model, rng.normal(size=(200, n_features))
+
+
+def test_predict_matches_sklearn():
+    model, X = fitted_forest(n_estimators=20)
+    np.testing.assert_allclose(CompactForest.from_sklearn(model).predict(X), model.predict(X), rtol=0, atol=1e-12)
+
+
+def test_predict_matches_sklearn_on_training_rows():
+    model, _ = fitted_forest(n_estimators=10, max_depth=4)
+    X = np.random.default_rng(0).normal(size=(300, 12))
+    X[:, 0] = np.round(X[:, 0], 1)
+    np.testing.assert_allclose(CompactForest.from_sklearn(model).predict(X), model.predict(X), rtol=0, atol=1e-12)
+
+
+def test_predict_in_blocks(monkeypatch):
+    model, X = fitted_forest(n_estimators=8)
+    monkeypatch.setattr(forest_model, 'PREDICT_BLOCK_CELLS', 24)
+    np.testing.assert_allclose(CompactForest.from_sklearn(model).predict(X), model.predict(X), rtol=0, atol=1e-12)
+
+
+def test_predict_single_leaf_trees():
+    X = np.zeros((20, 3))
+    model = RandomForestRegressor(n_estimators=3, random_state=0).fit(X, np.ones(20))
+    np.testing.assert_allclose(CompactForest.from_sklearn(model).predict(X[:5]), model.predict(X[:5]))
+
+
+def test_predict_rejects_wrong_feature_count():
+    model, X = fitted_forest(n_estimators=2)
+    with pytest.raises(ValueError):
+        CompactForest.from_sklearn(model).predict(X[:, :5])
+
+
+def test_content_key_of_identical_forests():
+    model, _ = fitted_forest(n_estimators=4)
+    other, _ = fitted_forest(n_estimators=4)
+    assert CompactForest.from_sklearn(model).content_key() == CompactForest.from_sklearn(other).content_key()
@@ -0,0 +1,49 @@
+#DrugPredict - Box-plot statistics of the plot data endpoint
+#Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.analysis.plot_data import box_statistics, BOX_COLUMNS
+
+
+def descriptor_frame(classes, values=None):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({column: rng.normal(5, 1, len(classes)) if values is None else values
+                       for column in BOX_COLUMNS})
+    df['class'] = classes
+    return df
+
+
+def test_box_statistics_without_active_or_inactive_rows():
+    df = descriptor_frame(['intermediate'] * 4)
+    labelled = df[df['class'].isin(['active', 'inactive'])]
+    assert box_statistics(labelled) == {column: [] for column in BOX_COLUMNS}
+
+
+def test_box_statistics_of_empty_frame():
+    assert box_statistics(descriptor_frame([]).iloc[:0]) == {column: [] for column in BOX_COLUMNS}
+
+
+def test_box_statistics_without_class_labels():
+    assert box_statistics(descriptor_frame([None, None])) == {column: [] for column in BOX_COLUMNS}
+
+
+def test_box_statistics_skips_classes_without_values():
+    df = descriptor_frame(['active', 'active', 'inactive', 'inactive'])
+    df.loc[df['class'] == 'inactive', 'pIC50'] = np.nan
+    stats = box_statistics(df)
+    assert [entry['class'] for entry in stats['pIC50']] == ['active']
+    assert [entry['class'] for entry in stats['MW']] == ['active', 'inactive']
+
+
+def test_box_statistics_quartiles():
+    df = descriptor_frame(['active'] * 5, values=[1.0, 2.0, 3.0, 4.0, 100.0])
+    entry = box_statistics(df)['pIC50'][0]
+    assert (entry['q1'], entry['median'], entry['q3']) == (2.0, 3.0, 4.0)
+    assert (entry['whiskerLow'], entry['whiskerHigh'], entry['outliers']) == (1.0, 4.0, 1)
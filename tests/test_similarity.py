@@ -0,0 +1,60 @@
+#DrugPredict - Bit-packed Tanimoto similarity
+#Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+from rdkit import Chem, DataStructs
+from rdkit.Chem import rdFingerprintGenerator
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend.analysis.similarity import (fingerprint_smiles, popcount_rows, tanimoto, tanimoto_upper_bound,
+                                         FP_BITS, MORGAN_RADIUS)
+
+SMILES = [
+    'CC(=O)Oc1ccccc1C(=O)O', 'CC(C)Cc1ccc(cc1)C(C)C(=O)O', 'Cn1cnc2c1c(=O)n(C)c(=O)n2C',
+    'CC(=O)Nc1ccc(O)cc1', 'c1ccccc1', 'C', 'OC(=O)c1ccccc1O', 'CCN(CC)CCNC(=O)c1ccc(N)cc1',
+    'COc1ccc2[nH]cc(CCN(C)C)c2c1', 'CC12CCC3C(CCC4=CC(=O)CCC34C)C1CCC2O'
+]
+
+
+def rdkit_fingerprints(smiles):
+    generator = rdFingerprintGenerator.GetMorganGenerator(radius=MORGAN_RADIUS, fpSize=FP_BITS)
+    return [generator.GetFingerprint(Chem.MolFromSmiles(smi)) for smi in smiles]
+
+
+def test_popcount_matches_rdkit():
+    fps, valid = fingerprint_smiles(SMILES)
+    assert valid.all()
+    expected = [fp.GetNumOnBits() for fp in rdkit_fingerprints(SMILES)]
+    assert popcount_rows(fps).tolist() == expected
+    assert popcount_rows(fps[0]) == expected[0]
+
+
+def test_tanimoto_matches_rdkit():
+    fps, _ = fingerprint_smiles(SMILES)
+    counts = popcount_rows(fps)
+    reference = rdkit_fingerprints(SMILES)
+    for i in range(len(SMILES)):
+        expected = DataStructs.BulkTanimotoSimilarity(reference[i], reference)
+        np.testing.assert_allclose(tanimoto(fps[i], counts[i], fps, counts), expected, rtol=0, atol=1e-12)
+
+
+def test_tanimoto_of_empty_fingerprints():
+    fps = np.zeros((3, FP_BITS // 8), dtype=np.uint8)
+    assert tanimoto(fps[0], 0, fps, popcount_rows(fps)).tolist() == [0.0, 0.0, 0.0]
+
+
+def test_upper_bound_is_not_exceeded():
+    fps, _ = fingerprint_smiles(SMILES)
+    counts = popcount_rows(fps)
+    for i in range(len(SMILES)):
+        assert (tanimoto(fps[i], counts[i], fps, counts) <= tanimoto_upper_bound(counts[i], counts) + 1e-12).all()
+
+
+def test_fingerprint_smiles_marks_unparsable():
+    fps, valid = fingerprint_smiles(['CCO', 'not a smiles', 'c1ccccc1'])
+    assert valid.tolist() == [True, False, True]
+    assert not fps[1].any()